@@ -62,6 +62,17 @@ function get_result_file_name() {
 
 }
 
+/**
+ * Get the name of the JSON Lines file to which each search result is appended as soon as it is crawled,
+ * so that it can be preprocessed while the crawl is running (see Preprocessing/ingest_live.py).
+ *
+ * @returns {string} - The name of the JSON Lines file.
+ */
+function get_live_result_file_name() {
+    return get_result_file_name().replace(/\.json$/, ".jsonl")
+
+}
+
 // Main asynchronous function
 (async () => {
 
@@ -91,6 +102,9 @@ function get_result_file_name() {
     let res = []
     let size = queries.length
 
+    // Start the JSON Lines file of this crawl empty, as the JSON results file is rewritten by each crawl
+    fs.writeFileSync(get_live_result_file_name(), "")
+
     // Iterate through queries and execute crawlers
     for(let i=0; i<size; i++) {
 
@@ -99,6 +113,7 @@ function get_result_file_name() {
             let crawler = get_crawler_object(queries[i])
             let item = await crawler.handle_query()
             res.push(item)               
+            fs.appendFileSync(get_live_result_file_name(), JSON.stringify(item) + "\n")
             await new Promise(r => setTimeout(r, 2000));
         }
         catch(e) {
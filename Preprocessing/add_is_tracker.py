@@ -3,27 +3,50 @@ This script processes crawling results from various search engines to identify n
 It uses Adblock rules from easylist and easyprivacy lists to determine if a network request is a tracker.
 The results are then saved in a JSON file with added 'is_tracker' field for each network request.
 
+Classifications are cached by URL (see utils/tracker_cache.py), so re-running the script after adding a new crawl
+only classifies URLs that were never seen with the current lists.
+
+Usage:
+    python add_is_tracker.py --workers 32
+
 """
-import os, json
+import os, json, argparse, multiprocessing
 from adblockparser import AdblockRules
 from utils.read_and_write_crawling_results import read_crawling_results, write_crawling_results
+from utils.tracker_cache import TrackerClassificationCache, get_tracker_lists_hash, TRACKER_CACHE_PATH, TRACKER_LISTS_DIR, TRACKER_LIST_FILES
+from utils.rules_snapshot import load_rules_snapshot, SNAPSHOT_VERSION
+
+# Use the indexed matcher of utils/adblock_index.py instead of a single AdblockRules object
+USE_INDEXED_MATCHER = True
 
 """
 Read the adblock rules from easylist and easyprivacy lists.
+The indexed matcher is loaded from the precompiled snapshot stored next to the lists, which is rebuilt when the lists change.
+
+Args:
+    indexed (bool): Use the indexed matcher (default: USE_INDEXED_MATCHER)
+    lists_dir (str): Directory of the lists, e.g. ../Analysis/data_sources for the analysis
+    use_re2 (bool): Compile the AdblockRules regexes with pyre2 instead of the re module, when not indexed
 
 Returns:
-    AdblockRules: An instance of AdblockRules initialized with the tracker rules.
+    IndexedAdblockRules or AdblockRules: A matcher initialized with the tracker rules.
 """
-def read_tracker_rules():
+def read_tracker_rules(indexed=None, lists_dir=TRACKER_LISTS_DIR, use_re2=True):
+
+    if indexed is None:
+        indexed = USE_INDEXED_MATCHER
+
+    if indexed:
+        return load_rules_snapshot(lists_dir)
 
     raw_rules = []
 
-    for file_name in ["easylist.txt", "easyprivacy.txt"]:
-        with open('lists/'+file_name) as f:
+    for file_name in TRACKER_LIST_FILES:
+        with open(os.path.join(lists_dir, file_name)) as f:
             raw_rules += f.read().splitlines()
             
     print("Number of rules:", len(raw_rules))
-    return AdblockRules(raw_rules, use_re2=True, max_mem=512*1024*1024)
+    return AdblockRules(raw_rules, use_re2=use_re2, max_mem=512*1024*1024)
 
 
 """
@@ -32,32 +55,225 @@ Check if a given URL is a tracker based on the Adblock rules.
 Args:
     url (str): The URL to check.
     TRACKER_RULES (AdblockRules): An instance of AdblockRules containing tracker rules.
+    cache (TrackerClassificationCache): Optional cache of previous classifications.
     
 Returns:
     bool: True if the URL is a tracker, False otherwise.
 """
-def is_tracker_from_lists(url, TRACKER_RULES):
+def is_tracker_from_lists(url, TRACKER_RULES, cache=None):
+
+    if cache is not None:
+        return cache.classify(url, TRACKER_RULES)
     
     return TRACKER_RULES.should_block(url)
 
 
+"""
+Adds the 'is_tracker' field to every network request of a single search.
+"""
+def add_is_tracker_to_search(search, TRACKER_RULES, cache=None):
+
+    for request in search["requests"]:
+        request["is_tracker"] = is_tracker_from_lists(request["url"], TRACKER_RULES, cache)
+
+    return search
+
+
+_TRACKER_RULES = None
+_TRACKER_CACHE = None
+_TRACKER_CACHE_PATH = TRACKER_CACHE_PATH
+
+"""
+Returns the tracker rules, reading them only the first time they are needed.
+"""
+def get_tracker_rules():
+    global _TRACKER_RULES
+
+    if _TRACKER_RULES is None:
+        _TRACKER_RULES = read_tracker_rules()
+
+    return _TRACKER_RULES
+
+
+"""
+Returns the key of the tracker classification cache: the content hash of the lists, with the matcher that classifies
+the URLs and the version of the indexed matcher's snapshot, so that changing the lists, switching the matcher or fixing
+the indexed matcher empties the cache.
+"""
+def get_tracker_cache_key():
+
+    matcher = "indexed:%d" % SNAPSHOT_VERSION if USE_INDEXED_MATCHER else "adblockparser"
+    return get_tracker_lists_hash() + ":" + matcher
+
+
+"""
+Returns the persistent tracker classification cache, opening it only the first time it is needed.
+"""
+def get_tracker_cache():
+    global _TRACKER_CACHE
+
+    if _TRACKER_CACHE is None:
+        _TRACKER_CACHE = TrackerClassificationCache(get_tracker_cache_key(), _TRACKER_CACHE_PATH)
+
+    return _TRACKER_CACHE
+
+
+"""
+Makes get_tracker_cache use the cache file at path, e.g. a cache per shard when several shards are processed on the
+same machine. The cache already opened, if any, is closed.
+"""
+def set_tracker_cache_path(path):
+    global _TRACKER_CACHE_PATH
+
+    close_tracker_cache()
+    _TRACKER_CACHE_PATH = path
+
+
+"""
+Writes the pending classifications of the tracker cache to disk and closes it.
+"""
+def close_tracker_cache():
+    global _TRACKER_CACHE
+
+    if _TRACKER_CACHE is not None:
+        _TRACKER_CACHE.close()
+        _TRACKER_CACHE = None
+
+
+"""
+Initializes a worker process of the pool with the matcher selected in the parent process.
+"""
+def _init_worker(use_indexed_matcher):
+    global USE_INDEXED_MATCHER
+    USE_INDEXED_MATCHER = use_indexed_matcher
+
+
+"""
+Classifies a list of URLs in a worker process of the pool.
+The tracker rules are inherited from the parent process after fork, or read once per worker otherwise.
+"""
+def _classify_urls(urls):
+    TRACKER_RULES = get_tracker_rules()
+    return [TRACKER_RULES.should_block(url) for url in urls]
+
+
+"""
+Adds the 'is_tracker' field to the requests of a stream of searches, classifying URLs in a pool of worker processes.
+Searches are processed in batches: the distinct URLs of a batch that are not in the cache are split into chunks
+and classified in parallel, then the classifications are assigned to the requests in order.
+
+Args:
+    searches: An iterable of (search engine name, index, search)
+    workers (int): Number of worker processes
+    batch_size (int): Number of searches classified together
+    cache (TrackerClassificationCache): Optional cache of previous classifications.
+
+Yields:
+    the processed (search engine name, index, search), in the input order
+"""
+def add_is_tracker_to_searches(searches, workers=os.cpu_count(), batch_size=1000, cache=None, chunk_size=500):
+
+    pool = None
+    number_of_searches = 0
+    number_of_requests = 0
+    number_of_classified_urls = 0
+
+    try:
+        for batch in _batches(searches, batch_size):
+            urls_to_classify = _add_cached_is_tracker_to_batch(batch, cache)
+
+            if len(urls_to_classify) > 0:
+                if pool is None:
+                    if multiprocessing.get_start_method() == "fork":
+                        # Build the rules before forking, so that workers share them copy-on-write
+                        get_tracker_rules()
+                    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(USE_INDEXED_MATCHER,))
+
+                chunks = [urls_to_classify[i:i + chunk_size] for i in range(0, len(urls_to_classify), chunk_size)]
+                classifications = {}
+                for chunk, results in zip(chunks, pool.map(_classify_urls, chunks)):
+                    classifications.update(zip(chunk, results))
+
+                for url, is_tracker in classifications.items():
+                    if cache is not None:
+                        cache.set(url, is_tracker)
+
+                for se, idx, search in batch:
+                    for request in search["requests"]:
+                        if request["is_tracker"] is None:
+                            request["is_tracker"] = classifications[request["url"]]
+
+            number_of_searches += len(batch)
+            number_of_requests += sum([len(search["requests"]) for se, idx, search in batch])
+            number_of_classified_urls += len(urls_to_classify)
+            print("searches:", number_of_searches, "requests:", number_of_requests, "classified urls:", number_of_classified_urls)
+
+            yield from batch
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+"""
+Groups an iterable into lists of at most batch_size items
+"""
+def _batches(items, batch_size):
+
+    batch = []
+    for item in items:
+        batch.append(item)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
+
+
+"""
+Sets 'is_tracker' for the requests of a batch whose URL is cached, and to None for the others.
+
+Returns:
+    list: the distinct URLs that still have to be classified, in order of first appearance
+"""
+def _add_cached_is_tracker_to_batch(batch, cache):
+
+    classifications = {}
+    for se, idx, search in batch:
+        for request in search["requests"]:
+            url = request["url"]
+            if url not in classifications:
+                classifications[url] = None if cache is None else cache.get(url)
+
+            request["is_tracker"] = classifications[url]
+
+    return [url for url, is_tracker in classifications.items() if is_tracker is None]
+
     
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Add the is_tracker field to all network requests")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Number of searches classified together")
+    parser.add_argument("--matcher", choices=["indexed", "adblockparser"], default="indexed", help="Rule matching engine (default: indexed)")
+    args = parser.parse_args()
+
+    USE_INDEXED_MATCHER = args.matcher == "indexed"
+
     #Importing crawling results 
     ALL_SE_RESULTS = read_crawling_results()
 
-
-    #Reading the tracker rules used to detect trackers
-    TRACKER_RULES = read_tracker_rules()
+    TRACKER_CACHE = get_tracker_cache()
 
     #Loop over crawling instances for each search engine
-    for se_searches in ALL_SE_RESULTS:
-        total = len(se_searches)
-        for idx, search in enumerate(se_searches):
-            print(idx,"/",total)
-            for request in search["requests"]:
-                request["is_tracker"] = is_tracker_from_lists(request["url"], TRACKER_RULES)
+    all_searches = [(None, idx, search) for se_searches in ALL_SE_RESULTS for idx, search in enumerate(se_searches)]
+    for item in add_is_tracker_to_searches(all_searches, args.workers, args.batch_size, TRACKER_CACHE):
+        pass
+
+    close_tracker_cache()
 
 #    with open('../Analysis/all_se_results_with_trending3.json', 'w') as f:
     write_crawling_results(ALL_SE_RESULTS)
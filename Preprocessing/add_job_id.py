@@ -1,62 +1,68 @@
 
 import os, json
-from urllib.parse import urlparse
+from utils.parsed_urls import parse_url
 from utils.read_and_write_crawling_results import read_crawling_results, write_crawling_results
 
 
 
 
 """
-    Adds job_id to network requests. 
-    Essential to sort the network requests in the correct order
+    Adds job_id to the network requests of a single search and sorts them by job_id.
     Extracts the job-id field from the interceptionId, which is in string format
 """
-def add_job_id_to_requests(ALL_SE_RESULTS):
+def add_job_id_to_search(search):
 
-    for list_ in ALL_SE_RESULTS:
+    requests_for_search = []
 
-        for search in list_:
+    for request in search["requests"]:
+        if "interceptionId" not in request and "requestId" not in request : # THis condition for old similations
+            print("problem, no iterceptionId and no request Id")
+            ignore = True
+            break
 
-            requests_for_search = []
+        if "interceptionId" not in request and parse_url(request["url"]).netloc != "":
+            ignore = True
+            print("problem, iterceptionId not defined for a non data: url", parse_url(request["url"]).netloc)
+            break
 
-            for request in search["requests"]:
-                if "interceptionId" not in request and "requestId" not in request : # THis condition for old similations
-                    print("problem, no iterceptionId and no request Id")
-                    ignore = True
-                    break
+        if "interceptionId" in request and "interception-job-" not in request["interceptionId"]:
+            ignore = True
+            print("problem, interceptionId have a different form", request["interceptionId"])
+            break
 
-                if "interceptionId" not in request and urlparse(request["url"]).netloc != "":
-                    ignore = True
-                    print("problem, iterceptionId not defined for a non data: url", urlparse(request["url"]).netloc)
-                    break
+        if "interceptionId" not in request:
+#            print("no interception id in request, continue", parse_url(request["url"]).netloc)
+            continue
 
-                if "interceptionId" in request and "interception-job-" not in request["interceptionId"]:
-                    ignore = True
-                    print("problem, interceptionId have a different form", request["interceptionId"])
-                    break
+        job_id = request["interceptionId"][17:]
 
-                if "interceptionId" not in request:
-#                    print("no interception id in request, continue", urlparse(request["url"]).netloc)
-                    continue
+        try:
+            job_id = float(job_id)
+            request["job_id"] = job_id
 
-                job_id = request["interceptionId"][17:]
+        except:
+            print("job_id not in good format", job_id)
+            continue
 
-                try:
-                    job_id = float(job_id)
-                    request["job_id"] = job_id
+        requests_for_search.append(request)
+    search["requests"] = requests_for_search
+    search["requests"] = sorted(search["requests"], key=lambda d: d['job_id'])  # By job_id
 
-                except:
-                    print("job_id not in good format", job_id)
-                    continue
+    return search
 
-                requests_for_search.append(request)
-            search["requests"] = requests_for_search
-            search["requests"] = sorted(search["requests"], key=lambda d: d['job_id'])  # By job_id
 
-    return ALL_SE_RESULTS
+"""
+    Adds job_id to network requests. 
+    Essential to sort the network requests in the correct order
+"""
+def add_job_id_to_requests(ALL_SE_RESULTS):
 
+    for list_ in ALL_SE_RESULTS:
 
+        for search in list_:
+            add_job_id_to_search(search)
 
+    return ALL_SE_RESULTS
 
 
 
@@ -0,0 +1,165 @@
+"""
+This script benchmarks the preprocessing stages on crawler files, typically the synthetic ones written by
+generate_synthetic_crawl_data.py, so that performance regressions of the preprocessing show up.
+
+The crawler files are read into memory first, then each stage of run_pipeline.py (from job_id to user_identifiers)
+is run on all the searches, one stage after the other, as the stages depend on the fields added by the previous ones.
+For each stage, it reports the elapsed time, the throughput in searches and requests per second, and the peak memory
+allocated while the stage ran (measured with tracemalloc, which slows the stages down; use --no-memory for timings only).
+
+The tracker stage classifies every URL with the tracker rules, without the persistent classification cache, unless
+--tracker-cache is given.
+
+Usage:
+    python generate_synthetic_crawl_data.py --searches 10k
+    python benchmark_stages.py --output ../Data/benchmark.json
+    python benchmark_stages.py --baseline ../Data/benchmark.json
+"""
+import argparse, json, os, time, tracemalloc
+from utils.read_and_write_crawling_results import ALL_SE_NAMES, iter_json_list
+from generate_synthetic_crawl_data import SYNTHETIC_FILES_DIR
+from add_is_tracker import add_is_tracker_to_search, get_tracker_rules
+from run_pipeline import PIPELINE_STAGES, get_pipeline_stages
+
+
+"""
+Reads the crawler files of crawling_files_dir
+
+Returns:
+    list: the (search engine name, index, search) of all the searches
+"""
+def read_benchmark_searches(crawling_files_dir=SYNTHETIC_FILES_DIR):
+
+    searches = []
+    for se in ALL_SE_NAMES:
+        path = os.path.join(crawling_files_dir, se + ".json")
+        if os.path.exists(path):
+            searches += [(se, idx, search) for idx, search in enumerate(iter_json_list(path))]
+
+    return searches
+
+
+"""
+Returns the stages to benchmark, in pipeline order.
+Without tracker_cache, the tracker stage does not read nor fill the persistent classification cache.
+"""
+def get_benchmark_stages(stage_names=None, tracker_cache=False):
+
+    stages = get_pipeline_stages(stage_names)
+    if tracker_cache:
+        return stages
+
+    return [(name, (lambda search, se: add_is_tracker_to_search(search, get_tracker_rules(), None)) if name == "is_tracker" else stage)
+            for name, stage in stages]
+
+
+"""
+Runs each stage on all the searches, and measures its elapsed time and peak memory
+
+Returns:
+    list: one dictionary of measures per stage
+"""
+def benchmark_stages(searches, stages, measure_memory=True):
+
+    number_of_searches = len(searches)
+    number_of_requests = sum(len(search["requests"]) for se, idx, search in searches)
+
+    # Loads the tracker rules (from their snapshot) before the timings
+    if any(name == "is_tracker" for name, stage in stages):
+        get_tracker_rules()
+
+    if measure_memory:
+        tracemalloc.start()
+
+    results = []
+    for name, stage in stages:
+        if measure_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        for se, idx, search in searches:
+            stage(search, se)
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "stage": name,
+            "seconds": elapsed,
+            "searches_per_second": number_of_searches / elapsed if elapsed > 0 else None,
+            "requests_per_second": number_of_requests / elapsed if elapsed > 0 else None,
+        }
+
+        if measure_memory:
+            result["peak_memory_mb"] = (tracemalloc.get_traced_memory()[1] - memory_before) / (1024 * 1024)
+
+        results.append(result)
+
+    if measure_memory:
+        tracemalloc.stop()
+
+    return results
+
+
+"""
+Prints the measures of each stage, and their change compared to the baseline measures if given
+"""
+def print_benchmark(results, number_of_searches, number_of_requests, baseline=None):
+
+    print("Benchmark of", number_of_searches, "searches and", number_of_requests, "requests")
+
+    baseline_by_stage = {result["stage"]: result for result in (baseline or {}).get("stages", [])}
+
+    header = "{:<26} {:>10} {:>14} {:>14} {:>12}".format("stage", "seconds", "searches/s", "requests/s", "peak MB")
+    if baseline is not None:
+        header += " {:>12}".format("vs baseline")
+    print(header)
+
+    for result in results:
+        line = "{:<26} {:>10.3f} {:>14.0f} {:>14.0f} {:>12}".format(result["stage"], result["seconds"], result["searches_per_second"] or 0,
+                                                                     result["requests_per_second"] or 0,
+                                                                     "{:.1f}".format(result["peak_memory_mb"]) if "peak_memory_mb" in result else "-")
+
+        if baseline is not None:
+            previous = baseline_by_stage.get(result["stage"])
+            if previous is not None and previous["seconds"] > 0:
+                line += " {:>+11.1f}%".format(100 * (result["seconds"] - previous["seconds"]) / previous["seconds"])
+            else:
+                line += " {:>12}".format("-")
+
+        print(line)
+
+    print("{:<26} {:>10.3f}".format("total", sum(result["seconds"] for result in results)))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing stages on (synthetic) crawler files")
+    parser.add_argument("--crawling-files", default=SYNTHETIC_FILES_DIR, help="Directory of the crawler files (default: " + SYNTHETIC_FILES_DIR + ")")
+    parser.add_argument("--stages", help="Comma separated list of stages to benchmark, among: " + ", ".join(PIPELINE_STAGES.keys()) + " (default: all)")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure the peak memory of the stages")
+    parser.add_argument("--tracker-cache", action="store_true", help="Use the persistent tracker classification cache")
+    parser.add_argument("--output", help="Save the measures to this JSON file")
+    parser.add_argument("--baseline", help="Compare the timings to the measures saved in this JSON file")
+    args = parser.parse_args()
+
+    stages = get_benchmark_stages(args.stages.split(",") if args.stages else None, args.tracker_cache)
+
+    start = time.perf_counter()
+    searches = read_benchmark_searches(args.crawling_files)
+    if len(searches) == 0:
+        raise SystemExit("No crawler files in " + args.crawling_files + ", run generate_synthetic_crawl_data.py first")
+    print("Read the crawler files in {:.3f} seconds".format(time.perf_counter() - start))
+
+    number_of_requests = sum(len(search["requests"]) for se, idx, search in searches)
+    results = benchmark_stages(searches, stages, not args.no_memory)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_benchmark(results, len(searches), number_of_requests, baseline)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"searches": len(searches), "requests": number_of_requests, "stages": results}, f, indent=2)
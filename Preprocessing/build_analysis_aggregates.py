@@ -0,0 +1,35 @@
+"""
+This script precomputes, in one pass over the preprocessed dataset, the per search engine aggregates the analysis
+tables and plots are computed from (see utils/analysis_aggregates.py): party and tracker party counters for each phase,
+redirector counts and positions, navigation path frequencies, redirectors setting UID cookies and UID query parameter
+counts. The aggregates are cached in "Data/cache/analysis_aggregates.pickle" with the content hash of the dataset, and
+only recomputed when the dataset changes.
+
+Usage:
+    python build_analysis_aggregates.py
+    python build_analysis_aggregates.py --tables ../Analysis/tables
+"""
+import argparse
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH
+from utils.analysis_aggregates import ANALYSIS_AGGREGATES_PATH, MAX_SEARCHES_BY_SE, load_analysis_aggregates
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Precompute the aggregates of the analysis tables and plots, cached by dataset content hash")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Preprocessed dataset to read")
+    parser.add_argument("--output", default=ANALYSIS_AGGREGATES_PATH, help="Cache of the aggregates")
+    parser.add_argument("--max-searches", type=int, default=MAX_SEARCHES_BY_SE, help="Number of searches with ads analyzed per search engine (default: " + str(MAX_SEARCHES_BY_SE) + ")")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the aggregates even if the dataset did not change")
+    parser.add_argument("--tables", help="Also write the tables of the most common parties and redirectors to this directory (requires pandas)")
+    args = parser.parse_args()
+
+    aggregates = load_analysis_aggregates(args.input, args.output, args.max_searches, args.rebuild)
+
+    for se, se_aggregates in aggregates.search_engines.items():
+        print(se, "- searches:", se_aggregates["searches"], "- with ads:", se_aggregates["searches_with_ads"], "- analyzed:", se_aggregates["analyzed_searches"])
+
+    if args.tables is not None:
+        aggregates.write_tables(args.tables)
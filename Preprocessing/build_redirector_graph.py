@@ -0,0 +1,48 @@
+"""
+This script indexes the navigation paths and redirectors of the dataset in a redirector graph (see utils/redirector_graph.py).
+The existing graph is updated: new searches are added and changed searches are replaced, unless --rebuild is given.
+
+Usage:
+    python build_redirector_graph.py
+    python build_redirector_graph.py --top 10
+"""
+import argparse
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, iter_crawling_results
+from utils.redirector_graph import REDIRECTOR_GRAPH_PATH, RedirectorGraph, load_redirector_graph
+
+
+"""
+Updates the graph saved at graph_path with the searches of the dataset, and saves it
+
+Returns:
+    RedirectorGraph: the updated graph
+"""
+def build_redirector_graph(input_path=RESULTS_FILE_PATH, graph_path=REDIRECTOR_GRAPH_PATH, rebuild=False):
+
+    graph = RedirectorGraph() if rebuild else load_redirector_graph(graph_path)
+
+    for se, idx, search in iter_crawling_results(input_path):
+        graph.add_search(se, idx, search)
+
+    graph.save(graph_path)
+    return graph
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Index the navigation paths and redirectors of the dataset")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Dataset to read")
+    parser.add_argument("--output", default=REDIRECTOR_GRAPH_PATH, help="Redirector graph to update")
+    parser.add_argument("--rebuild", action="store_true", help="Build the graph from scratch instead of updating it")
+    parser.add_argument("--top", type=int, default=0, help="Print the most common redirectors and navigation paths of each search engine")
+    args = parser.parse_args()
+
+    graph = build_redirector_graph(args.input, args.output, args.rebuild)
+
+    for se in ALL_SE_NAMES:
+        print(se, ":", graph.number_of_paths(se), "navigation paths")
+        if args.top > 0:
+            print("   top redirectors:", graph.top_redirectors(se, args.top))
+            print("   top paths:", graph.most_common_paths(se, args.top))
@@ -0,0 +1,66 @@
+"""
+This script counts, in a single pass over the searches, the number of distinct searches each (key, value) token of
+cookies and query parameters appears in, and saves the counts as a token index (see utils/token_index.py).
+
+Tokens found in several searches have the same values across different iterations, so they are not user identifiers:
+with `python run_pipeline.py --token-index ../Data/token_index.pickle`, the user identifier extraction uses the index
+instead of the hand-maintained lists of constant keys and values.
+
+Usage:
+    python build_token_index.py
+    python build_token_index.py --crawling-files ../Crawling_system/files
+    python build_token_index.py --sketch-width 4194304
+"""
+import argparse, os
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, iter_crawling_results, iter_json_list
+from utils.token_index import TOKEN_INDEX_PATH, SKETCH_DEPTH, TokenFrequencyIndex
+
+
+"""
+Streams the searches of the crawler files of crawling_files_dir
+
+Yields:
+    (search engine name, index, search)
+"""
+def iter_crawling_files(crawling_files_dir):
+
+    for se in ALL_SE_NAMES:
+        path = os.path.join(crawling_files_dir, se + ".json")
+        if os.path.exists(path):
+            for idx, search in enumerate(iter_json_list(path)):
+                yield se, idx, search
+
+
+"""
+Builds the token index of the dataset at input_path (or of the crawler files of crawling_files_dir), and saves it
+
+Returns:
+    TokenFrequencyIndex: the index
+"""
+def build_token_index(input_path=RESULTS_FILE_PATH, index_path=TOKEN_INDEX_PATH, crawling_files_dir=None, sketch_width=None, sketch_depth=SKETCH_DEPTH):
+
+    index = TokenFrequencyIndex(sketch_width, sketch_depth)
+    searches = iter_crawling_results(input_path) if crawling_files_dir is None else iter_crawling_files(crawling_files_dir)
+
+    for se, idx, search in searches:
+        index.add_search(search)
+
+    index.save(index_path)
+    return index
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Count the number of searches each cookie and query parameter token appears in")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Dataset to read")
+    parser.add_argument("--crawling-files", help="Read the crawler files of this directory instead of the dataset")
+    parser.add_argument("--output", default=TOKEN_INDEX_PATH, help="Token index to write")
+    parser.add_argument("--sketch-width", type=int, help="Count the tokens in a count-min sketch of this width instead of a hash table, for very large corpora")
+    parser.add_argument("--sketch-depth", type=int, default=SKETCH_DEPTH, help="Number of rows of the count-min sketch (default: " + str(SKETCH_DEPTH) + ")")
+    args = parser.parse_args()
+
+    index = build_token_index(args.input, args.output, args.crawling_files, args.sketch_width, args.sketch_depth)
+
+    print(index.number_of_searches, "searches,", len(index), "tokens" if args.sketch_width is None else "counters")
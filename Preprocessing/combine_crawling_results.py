@@ -1,42 +1,122 @@
 """
 This script reads crawling results from various search engines and put them into a signle json file
+
+The crawler file of each search engine is streamed and serialized in its own process, then the parts are written into
+the dataset in the ALL_SE_NAMES order, so the searches of all the search engines are never held in memory at once.
+Search engines without crawler file are written as empty lists, so that the position of each search engine in the
+dataset is always the one given by ALL_SE_NAMES.
 """
-import os, json
+import os, json, argparse, multiprocessing, shutil, tempfile
+from utils.read_and_write_crawling_results import ALL_SE_NAMES, RESULTS_FILE_PATH, iter_json_list, CrawlingResultsShardWriter
+from utils.manifest import CRAWLING_FILES_DIR
 
 
 
-def read_crawling_results():
+def read_crawling_results(crawling_files_dir=CRAWLING_FILES_DIR):
     """
     Read and combine crawling results from multiple search engines.
-    
+
     Returns:
-        list: A list containing the crawling results for each search engine.
+        list: A list containing the crawling results for each search engine, in the ALL_SE_NAMES order.
     """
-    
-    #The search engines included in the study
-    study_ses = ["bing", "ddg", "google", "startpage", "qwant"]
+
     ARRAYS = []
 
     # Importing all crawling files for each search engine
-    for study_se in study_ses:
-            
-        if os.path.exists('../Crawling_system/files/' + study_se + '.json'):
-            f = open('../Crawling_system/files/' + study_se + '.json')
-            ARRAYS.append(json.load(f))
+    for study_se in ALL_SE_NAMES:
+        ARRAYS.append(list(iter_json_list(get_crawling_file_path(study_se, crawling_files_dir))))
 
     return ARRAYS
 
-    
+
+def get_crawling_file_path(se, crawling_files_dir=CRAWLING_FILES_DIR):
+    return os.path.join(crawling_files_dir, se + ".json")
+
+
+def _serialize_search_engine(args):
+    """
+    Streams the crawler file of a search engine into part_path, as the comma separated searches of its list in the dataset,
+    or into a shard of shards_dir when part_path is None
+
+    Returns:
+        int: the number of searches
+    """
+
+    se, crawling_file_path, part_path, shards_dir = args
+    count = 0
+
+    if part_path is not None:
+        with open(part_path, "w") as f:
+            for search in iter_json_list(crawling_file_path):
+                if count > 0:
+                    f.write(", ")
+                json.dump(search, f)
+                count += 1
+
+    else:
+        with CrawlingResultsShardWriter(shards_dir, append=False) as writer:
+            for search in iter_json_list(crawling_file_path):
+                writer.append(se, count, search)
+                count += 1
+
+    return count
+
+
+def combine_crawling_results(crawling_files_dir=CRAWLING_FILES_DIR, output_path=RESULTS_FILE_PATH, output_shards=None, workers=os.cpu_count()):
+    """
+    Merges the crawler files into the dataset at output_path, or into one JSON Lines shard per search engine in output_shards.
+    The search engines are parsed in parallel, in a pool of workers processes.
+
+    Returns:
+        dict: the number of searches of each search engine with a crawler file
+    """
+
+    search_engines = [se for se in ALL_SE_NAMES if os.path.exists(get_crawling_file_path(se, crawling_files_dir))]
+    if len(search_engines) == 0:
+        return {}
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    parts_dir = tempfile.mkdtemp(prefix="combine_", dir=os.path.dirname(os.path.abspath(output_path)))
+
+    try:
+        tasks = [(se, get_crawling_file_path(se, crawling_files_dir), None if output_shards is not None else os.path.join(parts_dir, se + ".part"), output_shards)
+                 for se in search_engines]
+
+        with multiprocessing.Pool(max(1, min(workers, len(tasks)))) as pool:
+            counts = dict(zip(search_engines, pool.map(_serialize_search_engine, tasks, chunksize=1)))
+
+        if output_shards is None:
+            # Same layout as write_crawling_results: one list per search engine, in the ALL_SE_NAMES order
+            with open(output_path + ".tmp", "w") as f:
+                f.write("[")
+                for index, se in enumerate(ALL_SE_NAMES):
+                    f.write("[" if index == 0 else "], [")
+                    if se in counts:
+                        with open(os.path.join(parts_dir, se + ".part")) as part:
+                            shutil.copyfileobj(part, f)
+                f.write("]]")
+            os.replace(output_path + ".tmp", output_path)
+
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    return counts
+
+
 if __name__ == "__main__":
 
-    #Importing crawling results 
-    ALL_SE_RESULTS = read_crawling_results()
+    parser = argparse.ArgumentParser(description="Combine the crawler files of all the search engines into the dataset")
+    parser.add_argument("--crawling-files", default=CRAWLING_FILES_DIR, help="Directory of the crawler files")
+    parser.add_argument("--output", default=RESULTS_FILE_PATH, help="Dataset to write")
+    parser.add_argument("--output-shards", help="Write JSON Lines shards, one per search engine, in this directory instead of a single dataset file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
 
-#    with open('../Analysis/all_se_results_with_trending3.json', 'w') as f:
+    counts = combine_crawling_results(args.crawling_files, args.output, args.output_shards, args.workers)
 
-    if len(ALL_SE_RESULTS) == 0:
+    if len(counts) == 0:
         print("nothing to write!")
 
     else:
-        write_crawling_results(ALL_SE_RESULTS)
-
+        for se, count in counts.items():
+            print(se, ":", count, "searches")
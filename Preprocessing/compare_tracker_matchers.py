@@ -0,0 +1,87 @@
+"""
+This script checks that the indexed matcher of utils/adblock_index.py classifies URLs exactly like adblockparser.
+Both matchers are built from the same lists, and every URL of the sample corpus is classified by both.
+The sample corpus is a text file with one URL per line, by default lists/tracker_sample_urls.txt (URLs of synthetic
+crawls, and URLs derived from EasyPrivacy rules with variants that may or may not match them), or the URLs of the
+network requests of the dataset.
+
+Usage:
+    python compare_tracker_matchers.py
+    python compare_tracker_matchers.py --no-re2
+    python compare_tracker_matchers.py --dataset --sample 100000
+    python compare_tracker_matchers.py --urls urls.txt
+
+The script exits with status 1 if the two matchers disagree on any URL.
+"""
+import argparse, sys, time
+from add_is_tracker import read_tracker_rules
+from utils.read_and_write_crawling_results import iter_crawling_results
+
+SAMPLE_URLS_PATH = "lists/tracker_sample_urls.txt"
+
+
+"""
+Returns at most sample_size distinct URLs of network requests and redirections from the dataset
+"""
+def sample_urls_from_dataset(sample_size):
+
+    urls = {}
+    for se, idx, search in iter_crawling_results():
+        for request in search["requests"]:
+            urls[request["url"]] = True
+            for redirection in request.get("redirectChain", []):
+                urls[redirection["url"]] = True
+
+        if len(urls) >= sample_size:
+            break
+
+    return list(urls.keys())[:sample_size]
+
+
+"""
+Classifies each URL with both matchers
+
+Returns:
+    list: the URLs on which the matchers disagree
+"""
+def compare_tracker_matchers(urls, use_re2=True):
+
+    reference_rules = read_tracker_rules(indexed=False, use_re2=use_re2)
+    indexed_rules = read_tracker_rules(indexed=True)
+
+    start = time.time()
+    reference = [reference_rules.should_block(url) for url in urls]
+    print("adblockparser (" + ("re2" if use_re2 else "re") + "):", round(time.time() - start, 2), "s")
+
+    start = time.time()
+    indexed = [indexed_rules.should_block(url) for url in urls]
+    print("indexed:", round(time.time() - start, 2), "s")
+
+    print("URLs:", len(urls), "trackers:", sum(reference))
+    return [url for url, expected, result in zip(urls, reference, indexed) if expected != result]
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare the indexed tracker matcher with adblockparser")
+    parser.add_argument("--urls", default=SAMPLE_URLS_PATH, help="Text file with one URL per line (default: " + SAMPLE_URLS_PATH + ")")
+    parser.add_argument("--dataset", action="store_true", help="Compare on URLs sampled from the dataset instead of a URL file")
+    parser.add_argument("--sample", type=int, default=100000, help="Number of URLs sampled from the dataset, with --dataset")
+    parser.add_argument("--no-re2", action="store_true", help="Build the adblockparser reference with the re module, where pyre2 is not installed")
+    args = parser.parse_args()
+
+    if args.dataset:
+        urls = sample_urls_from_dataset(args.sample)
+
+    else:
+        with open(args.urls) as f:
+            urls = [line.strip() for line in f if line.strip() != ""]
+
+    mismatches = compare_tracker_matchers(urls, use_re2=not args.no_re2)
+
+    for url in mismatches:
+        print("mismatch:", url)
+
+    print("mismatches:", len(mismatches))
+    sys.exit(1 if len(mismatches) > 0 else 0)
@@ -0,0 +1,38 @@
+"""
+This script flattens the requests of the dataset into a columnar table, stored as one NumPy file per column.
+String columns (search engine, phase, ETLD + 1, netloc, first party) are dictionary encoded.
+The table can be memory-mapped with utils.request_table.load_request_table and queried with vectorized group-bys.
+
+Usage:
+    python export_request_table.py
+    python export_request_table.py --parquet
+"""
+import argparse
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, iter_crawling_results
+from utils.request_table import REQUEST_TABLE_PATH, RequestTableBuilder
+
+
+"""
+Streams the dataset and writes its request table in directory
+"""
+def export_request_table(input_path=RESULTS_FILE_PATH, directory=REQUEST_TABLE_PATH, parquet=False):
+
+    builder = RequestTableBuilder()
+    for se, idx, search in iter_crawling_results(input_path):
+        builder.add_search(se, idx, search)
+
+    builder.write(directory, parquet)
+    print("Number of requests:", len(builder.columns["search_index"]))
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export the requests of the dataset as a columnar table")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Dataset to read")
+    parser.add_argument("--output", default=REQUEST_TABLE_PATH, help="Directory of the table")
+    parser.add_argument("--parquet", action="store_true", help="Also write the table as a Parquet file (requires pyarrow)")
+    args = parser.parse_args()
+
+    export_request_table(args.input, args.output, args.parquet)
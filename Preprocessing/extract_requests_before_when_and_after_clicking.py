@@ -1,9 +1,9 @@
 import os, json, tldextract
-from urllib.parse import urlparse
 from  collections import OrderedDict
 
 from utils.read_and_write_crawling_results import read_crawling_results, write_crawling_results, ALL_SE_NAMES
-from utils.urls import get_url_domain, get_url_etld
+from utils.phases import partition_search_requests
+from utils.parsed_urls import parse_url
 
 
 """
@@ -27,20 +27,20 @@ def get_requests_before_clicking(ALL_SE_RESULTS):
 
     for se_searches in ALL_SE_RESULTS:
         for idx, search in enumerate(se_searches):
-            requests_before_clicking = get_requests_between_times(search["requests"], 0, search["clicking_time"])
-            domains_before_clicking = [urlparse(item["url"]).netloc for item in requests_before_clicking]
-            tracker_requests_before_clicking = [item for item in requests_before_clicking if item["is_tracker"] is True]
-            tracker_domains_before_clicking = [urlparse(item["url"]).netloc for item in tracker_requests_before_clicking]
-
-            search["requests_before_clicking"] = requests_before_clicking
-            search["domains_before_clicking"] = domains_before_clicking
-            search["tracker_requests_before_clicking"] = tracker_requests_before_clicking
-            search["tracker_domains_before_clicking"] = tracker_domains_before_clicking
+            get_search_requests_before_clicking(search)
 
 
     return ALL_SE_RESULTS
 
 
+"""
+Same as get_requests_before_clicking, for a single search
+"""
+def get_search_requests_before_clicking(search):
+
+    return partition_search_requests(search, None, before_clicking=True, after_clicking=False)
+
+
 """
 Puts the landing URLs of DuckDuckGo crawling occurences in the correct format. 
 On DuckDuckGo, the landing URL is not displayed as URL but just a string containing the domain of the landing URL
@@ -48,12 +48,22 @@ On DuckDuckGo, the landing URL is not displayed as URL but just a string contain
 def format_duckduckgo_urls(ALL_SE_RESULTS):
 
     for search in ALL_SE_RESULTS[2]:
-        if len(search["ads"]) > 0:
-             search["ads"][0]["landing_url"] = "https://" + search["ads"][0]["landing_url"] +"/"
+        format_duckduckgo_url(search)
 
     return ALL_SE_RESULTS
 
 
+"""
+Same as format_duckduckgo_urls, for a single DuckDuckGo search
+"""
+def format_duckduckgo_url(search):
+
+    if len(search["ads"]) > 0:
+         search["ads"][0]["landing_url"] = "https://" + search["ads"][0]["landing_url"] +"/"
+
+    return search
+
+
 
 
 """
@@ -67,54 +77,40 @@ The first request sent to the landing URL sets the separation between requests b
 def get_requests_after_clicking_and_after_reaching_destination(ALL_SE_RESULTS):
 
      for index, se_searches in enumerate(ALL_SE_RESULTS):
-          for idx, search in enumerate([item for item in se_searches if item["clicked_url"] != ""]):
-
-               if len(search["ads"]) == 0:
-                    continue
+          for idx, search in enumerate(se_searches):
+               get_search_requests_after_clicking_and_after_reaching_destination(search, ALL_SE_NAMES[index])
 
-               if ">" in search["ads"][0]["landing_url"]:
-                    search["ads"][0]["landing_url"] = search["ads"][0]["landing_url"].split(">")[0].replace(" ", "")
+     return ALL_SE_RESULTS
 
-               clicked_url_domain = get_url_domain(search["ads"][0]["landing_url"])
-               found = False
 
-               requests_after_clicking = []
-               requests_after_reaching_destination = []
-               domains_after_clicking = []
-               domains_after_reaching_destination = []
+"""
+Same as get_requests_after_clicking_and_after_reaching_destination, for a single search of the search engine se
+"""
+def get_search_requests_after_clicking_and_after_reaching_destination(search, se):
 
-               requests_to_consider = get_requests_between_times(search["requests"], search["clicking_time"], 9999999999999)
+     return partition_search_requests(search, se, before_clicking=False, after_clicking=True)
 
-               for request in requests_to_consider:
-                    # We use request_domain for detecting when we arrive to landing url
-                    # because its the same as the one extracted from the clicked url 
-                    # Then we use etld domain for later analysis
 
-                    request_domain = get_url_domain(request["url"])
-                    etld_domain = get_url_etld(request["url"])
 
-                    if request_domain == clicked_url_domain and (ALL_SE_NAMES[index] != "bing" or request["responseHeaders"] != {}):
-                         found = True
+"""
+Same as get_requests_before_clicking followed by get_requests_after_clicking_and_after_reaching_destination, splitting
+the requests of each search into the three phases in a single scan
+"""
+def get_requests_before_and_after_clicking(ALL_SE_RESULTS):
 
-                    if found == False:
-                         domains_after_clicking.append(etld_domain)
-                         requests_after_clicking.append(request)
+     for index, se_searches in enumerate(ALL_SE_RESULTS):
+          for idx, search in enumerate(se_searches):
+               get_search_requests_before_and_after_clicking(search, ALL_SE_NAMES[index])
 
-                    else:
-                         domains_after_reaching_destination.append(etld_domain)
-                         requests_after_reaching_destination.append(request)
+     return ALL_SE_RESULTS
 
-               search["requests_after_clicking"] = requests_after_clicking
-               search["domains_after_clicking"] = domains_after_clicking
-               search["tracker_requests_after_clicking"] = [item for item in requests_after_clicking if item["is_tracker"] is True]
-               search["tracker_domains_after_clicking"] = [urlparse(item["url"]).netloc for item in search["tracker_requests_after_clicking"]]
 
-               search["requests_after_reaching_destination"] = requests_after_reaching_destination
-               search["domains_after_reaching_destination"] = domains_after_reaching_destination
-               search["tracker_requests_after_reaching_destination"] = [item for item in requests_after_reaching_destination if item["is_tracker"] is True]
-               search["tracker_domains_after_reaching_destination"] = [urlparse(item["url"]).netloc for item in search["tracker_requests_after_reaching_destination"]]
+"""
+Same as get_requests_before_and_after_clicking, for a single search of the search engine se
+"""
+def get_search_requests_before_and_after_clicking(search, se):
 
-     return ALL_SE_RESULTS
+     return partition_search_requests(search, se)
 
 
 
@@ -126,44 +122,53 @@ def extract_requests_by_first_parties(ALL_SE_RESULTS):
 
      for index, se_searches in enumerate(ALL_SE_RESULTS):
           se = ALL_SE_NAMES[index]
-          for idx, search in enumerate([item for item in se_searches if item["clicked_url"] != ""]):
+          for idx, search in enumerate(se_searches):
+               extract_search_requests_by_first_parties(search, se)
+
+     return ALL_SE_RESULTS
 
-               if len(search["ads"]) == 0:
-                    continue
 
+"""
+Same as extract_requests_by_first_parties, for a single search of the search engine se
+"""
+def extract_search_requests_by_first_parties(search, se):
 
-               first_party = "www." + se + ".com"
-               location_found = False
-               current_location = "-1 Lorem ipsum dolor sit amet" #Just random that i will not find
-               queries_by_first_party = [{first_party: []}]
+     if search["clicked_url"] == "" or len(search["ads"]) == 0:
+          return search
 
-               for request in [item for item in search["requests_after_clicking"] if item["status"] != 404]:
-                    request["url"] = request["url"].replace("%3A", ":").replace("%2F", "/").replace("%3F", "?").replace("%26", "&").replace("%3D", "=")
 
-                    if not current_location in request["url"]:
-                         queries_by_first_party[len(queries_by_first_party) - 1][first_party].append(request)
+     first_party = "www." + se + ".com"
+     location_found = False
+     current_location = "-1 Lorem ipsum dolor sit amet" #Just random that i will not find
+     queries_by_first_party = [{first_party: []}]
 
-                    else:
-                         new_first_party = urlparse(current_location).netloc
+     for request in [item for item in search["requests_after_clicking"] if item["status"] != 404]:
+          request["url"] = parse_url(request["url"]).decoded_url
 
-                         if new_first_party != "":
-                              first_party = new_first_party
+          if not current_location in request["url"]:
+               queries_by_first_party[len(queries_by_first_party) - 1][first_party].append(request)
 
-                         queries_by_first_party.append({first_party : []})
+          else:
+               new_first_party = parse_url(current_location).netloc
 
-                    if request["status"] <= 399 and request["status"] >= 300 and "location" in request["responseHeaders"]:
-                         location = request["responseHeaders"]["location"]
-                         location = location.replace("%3A", ":").replace("%2F", "/").replace("%3F", "?").replace("%26", "&").replace("%3D", "=")
-                         location_found = True
-                         current_location = location
+               if new_first_party != "":
+                    first_party = new_first_party
 
+               queries_by_first_party.append({first_party : []})
 
-               if urlparse(current_location).netloc != first_party: #ADD LAST FIRST PARTY IN CASE IT WASNT ADDED
-                    queries_by_first_party.append({urlparse(current_location).netloc : []})
+          if request["status"] <= 399 and request["status"] >= 300 and "location" in request["responseHeaders"]:
+               location = request["responseHeaders"]["location"]
+               location = parse_url(location).decoded_url
+               location_found = True
+               current_location = location
 
-               search["requests_by_first_parties"] = queries_by_first_party
 
-     return ALL_SE_RESULTS
+     if parse_url(current_location).netloc != first_party: #ADD LAST FIRST PARTY IN CASE IT WASNT ADDED
+          queries_by_first_party.append({parse_url(current_location).netloc : []})
+
+     search["requests_by_first_parties"] = queries_by_first_party
+
+     return search
 
 
 
@@ -175,47 +180,54 @@ The results are saved in the fields 'path' and 'redirectors'
 def extract_redirectors_and_navigation_paths(ALL_SE_RESULTS):
 
      for index, results in enumerate(ALL_SE_RESULTS):
-          se = ALL_SE_NAMES[index]
+          for idx, result in enumerate(results):
+               extract_search_redirectors_and_navigation_path(result, ALL_SE_NAMES[index])
 
-          if se =="ddg":
-               se = "duckduckgo.com"
+     return ALL_SE_RESULTS
 
-          else:
-               se = "www." + se + ".com"
 
-          for idx, result in enumerate([item for item in results if item["clicked_url"] != ""]):
+"""
+Same as extract_redirectors_and_navigation_paths, for a single search of the search engine se
+"""
+def extract_search_redirectors_and_navigation_path(result, se):
 
-               if len(result["ads"]) == 0:
-                    continue
+     if se =="ddg":
+          se = "duckduckgo.com"
 
-               if len(result["requests_after_reaching_destination"]) == 0:
-                    result["redirectors"] = []
-                    result["path"] = ""
-                    result["redirecting_requests"] = ""
-                    continue
+     else:
+          se = "www." + se + ".com"
 
-               # ALL DOMAINS
-               all_chain_domains = [urlparse(item["url"]).netloc for item in result["requests_after_reaching_destination"][0]["redirectChain"]]
+     if result["clicked_url"] == "" or len(result["ads"]) == 0:
+          return result
 
-               # REMOVE LAST DOMAIN IN CASE ITS SAME AS URL
-               all_chain_domains = [item for item in all_chain_domains if item != urlparse(result["requests_after_reaching_destination"][0]["url"]).netloc]
+     if len(result["requests_after_reaching_destination"]) == 0:
+          result["redirectors"] = []
+          result["path"] = ""
+          result["redirecting_requests"] = ""
+          return result
 
-               # ADDING SE AND REMOVING DUPLICATES
-               all_chain_domains = list(OrderedDict.fromkeys([se] + all_chain_domains))
-               result["redirectors"] = [item for item in all_chain_domains[1:] if item not in ["r.g.bing.com", "api.qwant.com", "qwa.qwant.com"]]
-               result["path"] = " - ".join([item for item in all_chain_domains if item not in ["r.g.bing.com", "api.qwant.com", "qwa.qwant.com"]] + ["destination"])
-               result["redirecting_requests"] = []
-               first_redirect = result["requests_after_reaching_destination"][0]["redirectChain"][0]["url"]
+     # ALL DOMAINS
+     all_chain_domains = [parse_url(item["url"]).netloc for item in result["requests_after_reaching_destination"][0]["redirectChain"]]
 
-               if (urlparse(first_redirect).netloc != se) and (urlparse(first_redirect).netloc != "r.g.bing.com"):
-                    result["redirecting_requests"] += [first_redirect]
+     # REMOVE LAST DOMAIN IN CASE ITS SAME AS URL
+     all_chain_domains = [item for item in all_chain_domains if item != parse_url(result["requests_after_reaching_destination"][0]["url"]).netloc]
 
-               result["redirecting_requests"] += [item["url"] for item in result["requests_after_reaching_destination"][0]["redirectChain"][1:]]
+     # ADDING SE AND REMOVING DUPLICATES
+     all_chain_domains = list(OrderedDict.fromkeys([se] + all_chain_domains))
+     result["redirectors"] = [item for item in all_chain_domains[1:] if item not in ["r.g.bing.com", "api.qwant.com", "qwa.qwant.com"]]
+     result["path"] = " - ".join([item for item in all_chain_domains if item not in ["r.g.bing.com", "api.qwant.com", "qwa.qwant.com"]] + ["destination"])
+     result["redirecting_requests"] = []
+     first_redirect = result["requests_after_reaching_destination"][0]["redirectChain"][0]["url"]
 
-               if result["requests_after_reaching_destination"][0]["url"] not in result["redirecting_requests"]:
-                    result["redirecting_requests"].append(result["requests_after_reaching_destination"][0]["url"])
+     if (parse_url(first_redirect).netloc != se) and (parse_url(first_redirect).netloc != "r.g.bing.com"):
+          result["redirecting_requests"] += [first_redirect]
 
-     return ALL_SE_RESULTS
+     result["redirecting_requests"] += [item["url"] for item in result["requests_after_reaching_destination"][0]["redirectChain"][1:]]
+
+     if result["requests_after_reaching_destination"][0]["url"] not in result["redirecting_requests"]:
+          result["redirecting_requests"].append(result["requests_after_reaching_destination"][0]["url"])
+
+     return result
 
 
 
@@ -228,8 +240,7 @@ if __name__ == "__main__":
     #Importing crawling results
     ALL_SE_RESULTS = read_crawling_results()
     ALL_SE_RESULTS = format_duckduckgo_urls(ALL_SE_RESULTS)
-    ALL_SE_RESULTS = get_requests_before_clicking(ALL_SE_RESULTS)
-    ALL_SE_RESULTS = get_requests_after_clicking_and_after_reaching_destination(ALL_SE_RESULTS)
+    ALL_SE_RESULTS = get_requests_before_and_after_clicking(ALL_SE_RESULTS)
     ALL_SE_RESULTS = extract_requests_by_first_parties(ALL_SE_RESULTS)
     ALL_SE_RESULTS = extract_redirectors_and_navigation_paths(ALL_SE_RESULTS)
 
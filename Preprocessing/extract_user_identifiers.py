@@ -1,7 +1,7 @@
-import os, json, tldextract, enchant, validators
-from urllib.parse import urlparse, parse_qs
+import os, json, tldextract
 from utils.read_and_write_crawling_results import read_crawling_results, write_crawling_results
-from utils.urls import get_url_etld
+from utils.parsed_urls import parse_url
+from utils.uid_tokens import get_uid_token_classifier, parse_set_cookie, get_query_parameter_pairs
 
 
 
@@ -12,13 +12,8 @@ Returns:
     A set of UID values created in first-party storage
 """
 def filter_cookies(cookies):
-    res = {}
-    for cookie_key, cookie_value in cookies.items():
 
-        if is_uid_token(cookie_key, cookie_value):
-            res[cookie_key] = cookie_value
-
-    return res
+    return get_uid_token_classifier().filter_pairs(cookies.items())
 
 
 """
@@ -28,16 +23,8 @@ Returns:
     A set of UID values passed in query parameters
 """
 def filter_query_parameters(parameters):
-    res = {}
-    for key, value in parameters.items():
-
-        value = list(set(value))
-        value = " ".join(value)
 
-        if is_uid_token(key, value):
-            res[key] = value
-
-    return res
+    return get_uid_token_classifier().filter_pairs(get_query_parameter_pairs(parameters))
 
 
 """
@@ -45,109 +32,77 @@ Returns True if a given token (key, value) is a UID parameter
 
 """
 def is_uid_token(token_key, token_value):
-    english_dictionnary = enchant.Dict("en_US")
-
-    # Manual filtering results
-    if token_value in ["EUR", "en", "sc_b_locale=fr_FR", "set", ""]:
-        return False
-
-    # Manual filtering result - 2
-    if token_key == "DATA":
-        return False
-
-    # Removing token keys that have same values accross different iterations
-    if token_key in ["et_keyword", "url", "utm_term", "utm_campaign", "utm_content", "u", "tuuid", "aw7735", "bId", "aw17547", "ds_k", "JPOP", "JPKW", "semnb", "ref", "keywords", "utm_custom1", "utm_ag", "asid", "ds_dest_url", "atc_content", "litb_from", "utm_source", "utm_medium", "m_pi", "m_cn", "m_ag", "m_ac", "cm_mmc", "oll", "ad_provider", "ad_domain", "dm", "d", "dsig", "blay", "sm","ccpturl", "uule", "ei", "c1", "c2", "gclsrc"]:
-        return False
-
-    # Removing token keys that have same values accross different iterations - 2
-    if token_value in ["Event.ClientInst", "UserEvent", "Event.ClientInst", "zenaps.com", "w*HZeZhmD60", "sa360-au-new-goodscat", "p64736203151", "ppc|ga|1|||", "googdemozdesk-21", "A4768712791", "fr_pd_ppc_google_youmake2022_shop-HQ_marque-exact_hot_you-make_text_none_none", "pcmcat1563299784494", "421x11964043", "459x3096044", "duckduckgo.com", "zIv3CTTKCSOnGn", "googhydr0a8-21", "-oaymwEECHwQRg", "AIDcmm2yi7yuxb_SEM_{gclid}:G:s", "{gclid}:G:s", "tbn:ANd9GcSBFmzURVeYKqQuB2JbIhAOt40ZNwbh-7Z6X56HI8mQfw"]:
-        return False
-
-    # Removing token keys that have same values accross different iterations - 3
-    if token_value[:4] in ["kwd-", "dat-", "dsa-", "DevE", "SERP"]:
-        return False
 
-    # Removing short tokens
-    if len(token_value) < 8:
-        return False
+    return get_uid_token_classifier().is_uid_token(token_key, token_value)
 
-    # Removing url values
-    if validators.url(token_value):
-        return False
 
-    # Removing english words
-    token_values_for_dictionary = token_value[:]
-    token_values_for_dictionary = token_values_for_dictionary.replace("_", " ").replace("=", " ")
-    non_words = [item for item in token_values_for_dictionary.split(" ") if item != '' and english_dictionnary.check(item) is False]
 
-    if len(non_words) == 0:
-        return False
+"""
+Iterates over all crawling occurences over all search engines
+For each occurence, extracts UIDs from first-party storage and query-parameters
+Saves the result in set-cookies_after_clicking and parameters_after_clicking
+"""
+def extract_user_identifiers_from_first_party_storage_and_query_parameters(ALL_SE_RESULTS):
+     for se, se_searches in enumerate(ALL_SE_RESULTS):
 
-    ## Removing timestamp values
-    if token_value.isdigit():
-        int_value = int(token_value)
-        if 1654034400000 <= int_value <= 1672527600000 or 1654034400 <= int_value <= 1672527600 : #Timestamp between june 2022 and july 2023 both in s and ms
-            return False
+          for idx, search in enumerate(se_searches):
+               extract_search_user_identifiers(search)
 
-    return True
+     return ALL_SE_RESULTS
 
 
 """
-Parses a set of cookies. Transforms it from a string to a dictionary (cookie_name, cookie_value)
-
-Returns:
-    a dictionnary of cookies {"cookie_key": cookie_value}
+Same as extract_user_identifiers_from_first_party_storage_and_query_parameters, for a single search
+The requests of requests_after_clicking are copied before their URL is decoded and their UIDs are added: when the phases
+were computed in the same pass, they are the requests of search["requests"] and of the other phase fields themselves,
+which must stay as they are, as when the dataset is written and read back between the scripts.
 """
-def parse_set_cookie(raw_set_cookies):
-    cookies = {}
-    raw_cookies = raw_set_cookies.split("\n")
+def extract_search_user_identifiers(search):
 
-    for raw_cookie in raw_cookies:
-        cookie_items = raw_cookie.split(";")
-        cookie_key = cookie_items[0].split("=")[0]
-        cookie_value = "=".join(cookie_items[0].split("=")[1:])
-        cookies[cookie_key] = cookie_value
+     if "requests_after_clicking" not in search:
+          return search
 
-    return cookies
+     search["set-cookies_after_clicking"] = []
+     search["parameters_after_clicking"] = []
+     search["requests_after_clicking"] = [req.copy() for req in search["requests_after_clicking"]]
 
+     for req in search["requests_after_clicking"]:
+          req["url"] = parse_url(req["url"]).decoded_url
 
-"""
-Iterates over all crawling occurences over all search engines
-For each occurence, extracts UIDs from first-party storage and query-parameters
-Saves the result in set-cookies_after_clicking and parameters_after_clicking
-"""
-def extract_user_identifiers_from_first_party_storage_and_query_parameters(ALL_SE_RESULTS):
-     for se, se_searches in enumerate(ALL_SE_RESULTS):
+     # The cookies and query parameters of all the requests are classified in one batch, then given back to each request
+     request_pairs = []
+     pairs = []
+     for req in search["requests_after_clicking"]:
+          parsed_url = parse_url(req["url"])
 
-          for idx, search in enumerate(se_searches):
+          cookie_pairs = None
+          if "set-cookie" in req['responseHeaders']:
+               cookie_pairs = list(parse_set_cookie(req["responseHeaders"]["set-cookie"]).items())
+               pairs.extend(cookie_pairs)
 
-               if "requests_after_clicking" not in search:
-                    continue
+          parameter_pairs = get_query_parameter_pairs(parsed_url.query_params)
+          pairs.extend(parameter_pairs)
 
-               search["set-cookies_after_clicking"] = []
-               search["parameters_after_clicking"] = []
+          request_pairs.append((req, parsed_url.etld, cookie_pairs, parameter_pairs))
 
-               for req in search["requests_after_clicking"]:
-                    req["url"] = req["url"].replace("%3A", ":").replace("%2F", "/").replace("%3F", "?").replace("%26", "&").replace("%3D", "=")
-                    domain = get_url_etld(req["url"])
+     decisions = iter(get_uid_token_classifier().classify_pairs(pairs))
 
-                    if "set-cookie" in req['responseHeaders']:
-                         set_cookie = req["responseHeaders"]["set-cookie"]
-                         set_cookie = parse_set_cookie(set_cookie)
-                         set_cookie = filter_cookies(set_cookie)
-                         req["set_cookies"] = set_cookie
+     for req, domain, cookie_pairs, parameter_pairs in request_pairs:
 
-                         if set_cookie != {}:
-                              search["set-cookies_after_clicking"].append((set_cookie, domain))
+          if cookie_pairs is not None:
+               set_cookie = {key: value for (key, value), is_uid in zip(cookie_pairs, decisions) if is_uid}
+               req["set_cookies"] = set_cookie
 
-                    parameters = parse_qs(urlparse(req["url"]).query)
-                    parameters = filter_query_parameters(parameters)
-                    req["parameters"] = parameters
+               if set_cookie != {}:
+                    search["set-cookies_after_clicking"].append((set_cookie, domain))
 
-                    if parameters != {}:
-                         search["parameters_after_clicking"].append((parameters, domain))
+          parameters = {key: value for (key, value), is_uid in zip(parameter_pairs, decisions) if is_uid}
+          req["parameters"] = parameters
 
-     return ALL_SE_RESULTS
+          if parameters != {}:
+               search["parameters_after_clicking"].append((parameters, domain))
+
+     return search
 
 
 
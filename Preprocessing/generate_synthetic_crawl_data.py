@@ -0,0 +1,294 @@
+"""
+This script generates synthetic crawler files, with the same layout as the files written by the crawling system
+(Crawling_system/files/<se>.json), so that the preprocessing stages can be run and benchmarked without the real dataset.
+
+Each search has a query, organic results, ads, and the network requests intercepted by the crawler
+(interceptionId, requestId, timestamp, status, responseHeaders with set-cookie and location, redirectChain),
+sent before clicking on the ad, while bouncing through the redirectors, and after reaching the landing page.
+Some searches have no ad, as in the real crawls.
+
+The files are written to "Data/synthetic/" by default; the crawler files of Crawling_system/files are never overwritten.
+
+Usage:
+    python generate_synthetic_crawl_data.py --searches 1k
+    python generate_synthetic_crawl_data.py --searches 100k --output-dir ../Data/synthetic_100k
+"""
+import argparse, json, os, random
+from urllib.parse import quote
+from utils.read_and_write_crawling_results import ALL_SE_NAMES
+from utils.manifest import CRAWLING_FILES_DIR
+
+SYNTHETIC_FILES_DIR = "../Data/synthetic"
+
+SEARCH_SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+# Fraction of the searches where an ad was clicked
+AD_CLICK_RATE = 0.8
+
+QUERY_WORDS = ["gaming", "laptop", "keto", "diet", "recipes", "solar", "panels", "yoga", "electric", "bikes", "travel", "deals", "vegan",
+               "skincare", "camping", "gear", "smart", "home", "podcasts", "cosmetics", "toys", "movies", "headphones", "sneakers"]
+
+SEARCH_ENGINE_HOSTS = {
+    "bing": ["www.bing.com", "th.bing.com", "r.bing.com"],
+    "google": ["www.google.com", "www.gstatic.com", "apis.google.com"],
+    "ddg": ["duckduckgo.com", "improving.duckduckgo.com", "links.duckduckgo.com"],
+    "startpage": ["www.startpage.com", "eu-browse.startpage.com"],
+    "qwant": ["www.qwant.com", "api.qwant.com", "s.qwant.com"],
+}
+
+# Host of the URL of the clicked ad
+AD_CLICK_HOSTS = {
+    "bing": "www.bing.com",
+    "google": "www.googleadservices.com",
+    "ddg": "duckduckgo.com",
+    "startpage": "www.startpage.com",
+    "qwant": "www.qwant.com",
+}
+
+REDIRECTOR_HOSTS = ["ad.doubleclick.net", "clickserve.dartsearch.net", "track.adform.net", "www.googleadservices.com", "bat.bing.com",
+                    "click.linksynergy.com", "ad.atdmt.com", "c.ci.criteo.com", "tracking.publicidees.com", "www.awin1.com"]
+
+TRACKER_HOSTS = ["www.google-analytics.com", "bat.bing.com", "connect.facebook.net", "www.facebook.com", "static.criteo.net",
+                 "sslwidget.criteo.com", "googleads.g.doubleclick.net", "stats.g.doubleclick.net", "www.googletagmanager.com",
+                 "c.clarity.ms", "analytics.tiktok.com", "ct.pinterest.com", "px.ads.linkedin.com", "cdn.taboola.com"]
+
+LANDING_DOMAINS = ["shop-example", "bestdeals", "my-store", "gear-outlet", "greenliving", "techplanet", "fitshop", "beauty-corner",
+                   "toyland", "travelnow", "homecomfort", "cinemax"]
+
+LANDING_TLDS = ["com", "fr", "co.uk", "de", "net", "com.au"]
+
+RESOURCE_PATHS = ["/", "/js/app.js", "/css/main.css", "/img/logo.png", "/img/banner.jpg", "/fonts/font.woff2", "/api/cart", "/favicon.ico"]
+
+TRACKER_PATHS = ["/collect", "/g/collect", "/action/0", "/tr", "/pagead/viewthroughconversion/123456/", "/event", "/pixel.gif", "/ct"]
+
+CLICK_ID_PARAMETERS = ["gclid", "msclkid", "dclid", "cid", "clickid", "irclickid"]
+
+COOKIE_NAMES = ["_ga", "_gid", "MUID", "_fbp", "uid", "sid", "cto_bundle", "IDE", "lang", "consent", "session_id", "ANONCHK"]
+
+
+class SyntheticCrawlGenerator:
+    """
+    Generates synthetic searches of a search engine, as written by the crawler, from a seeded random generator
+    """
+
+    def __init__(self, se, seed=0, start_time=1680000000000):
+        self.se = se
+        self.random = random.Random(str(seed) + se)
+        self.time = start_time
+
+    def token(self, length=16):
+        return "".join(self.random.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(length))
+
+    def cookie(self):
+        name = self.random.choice(COOKIE_NAMES)
+        value = self.random.choice([self.token(self.random.randint(16, 40)), "GA1.2." + str(self.random.randint(10 ** 9, 10 ** 10)) + "." + str(self.time // 1000),
+                                    "en", "1", "true", "yes"])
+        return name + "=" + value + "; path=/; expires=Fri, 31 Dec 2027 23:59:59 GMT; SameSite=None; Secure"
+
+    def response_headers(self, status, location=None):
+        headers = {"content-type": self.random.choice(["text/html; charset=utf-8", "image/gif", "application/javascript", "text/css"])}
+
+        if location is not None:
+            headers["location"] = location
+
+        if self.random.random() < 0.3:
+            headers["set-cookie"] = "\n".join(self.cookie() for _ in range(self.random.randint(1, 3)))
+
+        if status != 204:
+            headers["cache-control"] = "no-cache"
+
+        return headers
+
+    def query_string(self, parameters):
+        return "&".join(key + "=" + quote(value, safe="") for key, value in parameters)
+
+    def tracker_url(self, host):
+        parameters = [("v", "2"), ("tid", "G-" + self.token(10)), ("cid", str(self.random.randint(10 ** 9, 10 ** 10)) + "." + str(self.time // 1000))]
+        return "https://" + host + self.random.choice(TRACKER_PATHS) + "?" + self.query_string(parameters[:self.random.randint(0, 3)])
+
+    def request(self, url, status=200, location=None, redirect_chain=None):
+        """
+        Returns:
+            dict: a request as intercepted by the crawler, without its interceptionId, requestId and timestamp
+        """
+
+        return {
+            "url": url,
+            "requestHeaders": {"user-agent": "Mozilla/5.0 (X11; Linux x86_64) Chrome/114.0.0.0 Safari/537.36", "accept": "*/*"},
+            "responseHeaders": self.response_headers(status, location),
+            "status": status,
+            "method": self.random.choice(["GET", "GET", "GET", "POST"]),
+            "redirectChain": redirect_chain or [],
+            "responseText": self.random.random() < 0.2,
+        }
+
+    def page_requests(self, hosts, trackers, number_of_requests):
+        requests = []
+        for index in range(number_of_requests):
+            if self.random.random() < 0.4:
+                requests.append(self.request(self.tracker_url(self.random.choice(trackers)), self.random.choice([200, 200, 204])))
+            else:
+                url = "https://" + self.random.choice(hosts) + self.random.choice(RESOURCE_PATHS)
+                requests.append(self.request(url, self.random.choice([200, 200, 200, 304, 404])))
+
+        return requests
+
+    def ad(self, landing_url):
+        ad_url = "https://" + AD_CLICK_HOSTS[self.se] + "/aclk?" + self.query_string([("ld", self.token(24)), ("u", landing_url)])
+        landing_domain = landing_url.split("/")[2]
+        displayed_landing_url = {
+            "bing": "https://" + landing_domain + " > products",
+            "ddg": landing_domain,
+        }.get(self.se, landing_url)
+
+        return {"title": "Ad - " + landing_domain, "url": ad_url, "description": "Best prices on " + landing_domain, "landing_url": displayed_landing_url}
+
+    def search(self, query):
+        """
+        Returns:
+            dict: a search as written by the crawler
+        """
+
+        se_hosts = SEARCH_ENGINE_HOSTS[self.se]
+        trackers = self.random.sample(TRACKER_HOSTS, 6)
+        has_ad = self.random.random() < AD_CLICK_RATE
+
+        results = [{"title": query.title() + " " + str(index), "url": "https://www." + self.random.choice(LANDING_DOMAINS) + ".com/" + str(index), "description": "About " + query}
+                   for index in range(self.random.randint(6, 10))]
+
+        # Requests sent before clicking on the ad: the search engine page
+        requests = self.page_requests(se_hosts, trackers[:2], self.random.randint(5, 20))
+
+        ads = []
+        clicked_url = ""
+        clicking_position = len(requests)
+
+        if has_ad:
+            landing_domain = "www." + self.random.choice(LANDING_DOMAINS) + "." + self.random.choice(LANDING_TLDS)
+            click_id = self.token(32)
+            landing_url = "https://" + landing_domain + "/products/" + self.token(6) + "?" + self.query_string([(self.random.choice(CLICK_ID_PARAMETERS), click_id), ("utm_source", self.se)])
+
+            ads = [self.ad(landing_url)] + [self.ad("https://www." + self.random.choice(LANDING_DOMAINS) + ".com/") for _ in range(self.random.randint(0, 3))]
+            clicked_url = ads[0]["url"]
+
+            # Bounce through the ad click URL and the redirectors: each hop answers with a redirection to the next one
+            hops = [clicked_url] + ["https://" + host + "/c?" + self.query_string([("id", self.token(12)), ("u", landing_url)])
+                                    for host in self.random.sample(REDIRECTOR_HOSTS, self.random.randint(0, 3))]
+            for index, hop in enumerate(hops):
+                location = hops[index + 1] if index + 1 < len(hops) else landing_url
+                requests.append(self.request(hop, self.random.choice([301, 302, 302, 307]), location))
+
+            # The landing page, with the redirect chain that led to it, then its resources and trackers
+            redirect_chain = [{"url": hop} for hop in hops]
+            requests.append(self.request(landing_url, 200, redirect_chain=redirect_chain))
+            landing_hosts = [landing_domain, "cdn." + landing_domain.partition(".")[2]]
+            requests += self.page_requests(landing_hosts, trackers[2:], self.random.randint(10, 40))
+
+        # Timestamps and job ids follow the order the requests were sent, the ad is clicked after the search engine page
+        first_job = self.random.randint(1, 50)
+        clicking_time = 0
+        for index, request in enumerate(requests):
+            if has_ad and index == clicking_position:
+                self.time += self.random.randint(1000, 3000)
+                clicking_time = self.time
+
+            self.time += self.random.randint(1, 120)
+            request["interceptionId"] = "interception-job-" + str(first_job + index) + ".0"
+            request["requestId"] = str(self.random.randint(1000, 9999)) + "." + str(first_job + index)
+            request["timestamp"] = self.time
+
+        # The redirect chain of a request lists the requests it was redirected from
+        ids = {request["url"]: request for request in requests if request["redirectChain"] == []}
+        for request in requests:
+            for hop in request["redirectChain"]:
+                hop["interceptionId"] = ids[hop["url"]]["interceptionId"]
+                hop["requestId"] = ids[hop["url"]]["requestId"]
+
+        # Requests are written in the order they finished, which is not always the order they were sent
+        for index in range(len(requests) - 1):
+            if self.random.random() < 0.1:
+                requests[index], requests[index + 1] = requests[index + 1], requests[index]
+
+        self.time += self.random.randint(5000, 20000)
+
+        return {
+            "query": query,
+            "results": results,
+            "ads": ads,
+            "side_bar_ads": [],
+            "raw_body": "<html><body>" + " ".join(result["title"] for result in results) + "</body></html>",
+            "requests": requests,
+            "slide_ads": [],
+            "clicking_time": clicking_time,
+            "clicked_url": clicked_url,
+        }
+
+    def searches(self, number_of_searches):
+        for index in range(number_of_searches):
+            yield self.search(" ".join(self.random.sample(QUERY_WORDS, self.random.randint(1, 3))))
+
+
+def parse_number_of_searches(value):
+    """
+    Parses a number of searches, given as a number or as one of the sizes of SEARCH_SIZES
+    """
+
+    if value in SEARCH_SIZES:
+        return SEARCH_SIZES[value]
+
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid number of searches: " + value + " (expected a number or one of " + ", ".join(SEARCH_SIZES) + ")")
+
+
+def generate_synthetic_crawl_data(number_of_searches, output_dir=SYNTHETIC_FILES_DIR, search_engines=ALL_SE_NAMES, seed=0):
+    """
+    Writes a synthetic crawler file of number_of_searches searches for each search engine, into output_dir.
+    The searches are streamed to the files, so that large files can be generated in constant memory.
+
+    Raises:
+        ValueError: if output_dir is the directory of the real crawler files
+
+    Returns:
+        dict: the path of the file written for each search engine
+    """
+
+    if os.path.abspath(output_dir) == os.path.abspath(CRAWLING_FILES_DIR):
+        raise ValueError("Refusing to write synthetic data into the crawler files directory " + CRAWLING_FILES_DIR)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+
+    for se in search_engines:
+        path = os.path.join(output_dir, se + ".json")
+        generator = SyntheticCrawlGenerator(se, seed)
+
+        # Same compact layout as JSON.stringify in the crawler
+        with open(path + ".tmp", "w") as f:
+            f.write("[")
+            for index, search in enumerate(generator.searches(number_of_searches)):
+                if index > 0:
+                    f.write(",")
+                json.dump(search, f, separators=(",", ":"))
+            f.write("]")
+        os.replace(path + ".tmp", path)
+
+        paths[se] = path
+
+    return paths
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate synthetic crawler files to run and benchmark the preprocessing without the real dataset")
+    parser.add_argument("--searches", type=parse_number_of_searches, default="1k", help="Number of searches per search engine: a number, or 1k, 10k or 100k (default: 1k)")
+    parser.add_argument("--output-dir", default=SYNTHETIC_FILES_DIR, help="Directory of the generated crawler files (default: " + SYNTHETIC_FILES_DIR + ")")
+    parser.add_argument("--search-engines", default=",".join(ALL_SE_NAMES), help="Comma separated list of search engines (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator, the same seed generates the same files")
+    args = parser.parse_args()
+
+    paths = generate_synthetic_crawl_data(args.searches, args.output_dir, args.search_engines.split(","), args.seed)
+
+    for se, path in paths.items():
+        print(se, ":", args.searches, "searches written to", path)
@@ -0,0 +1,339 @@
+"""
+This script preprocesses the searches while the crawler is running, instead of waiting for the end of the crawl.
+
+The crawler appends each search to "Crawling_system/files/<search engine>.jsonl" as soon as it is crawled (see
+run_se.js). This script tails these files, and runs each new search through the preprocessing stages (job_id,
+is_tracker, phase extraction, user identifiers...) as it appears. The processed searches are appended to JSON Lines
+shards, one per search engine, readable with iter_crawling_results_shards.
+
+Each stage runs in its own thread, and the stages are connected by bounded queues: when a stage is slower than the
+crawler, the stages before it block on the full queue instead of accumulating searches in memory.
+The byte offset reached in each crawler file is saved in a checkpoint after the processed searches are written, so
+that an interrupted ingestion resumes where it stopped.
+
+Usage:
+    python ingest_live.py
+    python ingest_live.py --once
+    python ingest_live.py --idle-timeout 600 --queue-size 8
+"""
+import argparse, json, os, queue, signal, threading, time
+
+from utils.read_and_write_crawling_results import ALL_SE_NAMES, CrawlingResultsShardWriter
+from utils.manifest import CRAWLING_FILES_DIR
+from add_is_tracker import close_tracker_cache
+from run_pipeline import PIPELINE_STAGES, get_pipeline_stages, get_pipeline_configuration, use_token_index
+
+LIVE_SHARDS_DIR = "../Data/live_shards"
+
+LIVE_CHECKPOINT_PATH = "../Data/live_checkpoint.json"
+
+# Bump when the layout of the checkpoint changes
+LIVE_CHECKPOINT_VERSION = 1
+
+# Default number of searches each queue between two stages can hold
+QUEUE_SIZE = 16
+
+# Default number of seconds between two reads of the crawler files
+POLL_INTERVAL = 2.0
+
+# Cleanups run by the thread of a stage when it stops, for the resources that can only be used by the thread that
+# opened them (the SQLite connection of the tracker cache)
+STAGE_CLEANUPS = {
+    "is_tracker": close_tracker_cache,
+}
+
+# Put in a queue after the last search
+_END = None
+
+
+class LiveCheckpoint:
+    """
+    Progress of the ingestion of each crawler file: the byte offset up to which it was read, the index of its next
+    search, and the size of the shard holding its processed searches.
+    The checkpoint is only valid for the configuration (stages, tracker lists, token index) it was written with.
+    """
+
+    def __init__(self, path, configuration):
+        self.path = path
+        self.configuration = configuration
+        self.search_engines = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+
+            if data.get("version") == LIVE_CHECKPOINT_VERSION and data.get("configuration") == configuration:
+                self.search_engines = data["search_engines"]
+            else:
+                print("The checkpoint " + path + " was written with another configuration, the crawler files are ingested from the start")
+
+    def get(self, se):
+        return self.search_engines.get(se, {"offset": 0, "next_index": 0, "shard_size": 0})
+
+    def update(self, se, offset, next_index, shard_size):
+        self.search_engines[se] = {"offset": offset, "next_index": next_index, "shard_size": shard_size}
+
+    def save(self):
+        if os.path.dirname(self.path) != "":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": LIVE_CHECKPOINT_VERSION, "configuration": self.configuration, "search_engines": self.search_engines}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+"""
+Truncates the shards to the size recorded in the checkpoint, dropping the searches written after the last checkpoint
+(they are read again from the crawler files). Shards of search engines not in the checkpoint are emptied.
+"""
+def restore_shards(writer, checkpoint):
+
+    for se in ALL_SE_NAMES:
+        shard_path = writer.get_shard_path(se)
+        if not os.path.exists(shard_path):
+            checkpoint.update(se, 0, 0, 0)
+            continue
+
+        shard_size = checkpoint.get(se)["shard_size"]
+        if os.path.getsize(shard_path) < shard_size:
+            # The shard lost searches that the checkpoint counts as written, everything is ingested again
+            shard_size = 0
+            checkpoint.update(se, 0, 0, 0)
+
+        with open(shard_path, "r+") as f:
+            f.truncate(shard_size)
+
+
+"""
+Streams the complete lines appended to the crawler file at path since offset.
+A line the crawler has not finished writing is left for the next read.
+
+Yields:
+    (offset after the line, search) for each new search
+"""
+def iter_new_searches(path, offset):
+
+    if not os.path.exists(path):
+        return
+
+    if os.path.getsize(path) < offset:
+        raise ValueError(path + " is shorter than when it was last read, remove the checkpoint to ingest it again")
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+
+            offset += len(line)
+            if line.strip() != b"":
+                yield offset, json.loads(line)
+
+
+"""
+Blocks until item can be put in output_queue, unless stop is set: with a full queue, the producer waits for the
+consumer, which is what bounds the memory used by the searches in flight.
+
+Returns:
+    bool: True if the item was put, False if stop was set first
+"""
+def put_or_stop(output_queue, item, stop):
+
+    while not stop.is_set():
+        try:
+            output_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+class _CrawlerFilesReader(threading.Thread):
+    """
+    Polls the crawler files, and puts each new (search engine name, index, offset after the search, search) in output_queue.
+    Stops at the first poll that finds nothing new with once, after idle_timeout seconds without new searches if given,
+    or when stop is set.
+    """
+
+    def __init__(self, crawling_files_dir, checkpoint, output_queue, stop, poll_interval=POLL_INTERVAL, once=False, idle_timeout=None):
+        super().__init__(name="crawler files reader", daemon=True)
+        self.paths = {se: os.path.join(crawling_files_dir, se + ".jsonl") for se in ALL_SE_NAMES}
+        self.positions = {se: [checkpoint.get(se)["offset"], checkpoint.get(se)["next_index"]] for se in ALL_SE_NAMES}
+        self.output_queue = output_queue
+        self.stop = stop
+        self.poll_interval = poll_interval
+        self.once = once
+        self.idle_timeout = idle_timeout
+        self.error = None
+
+    def poll(self):
+        number_of_searches = 0
+
+        for se, path in self.paths.items():
+            for offset, search in iter_new_searches(path, self.positions[se][0]):
+                idx = self.positions[se][1]
+                if not put_or_stop(self.output_queue, (se, idx, offset, search), self.stop):
+                    return number_of_searches
+
+                self.positions[se] = [offset, idx + 1]
+                number_of_searches += 1
+
+        return number_of_searches
+
+    def run(self):
+        last_search_time = time.monotonic()
+
+        try:
+            while not self.stop.is_set():
+                if self.poll() > 0:
+                    last_search_time = time.monotonic()
+                elif self.once or (self.idle_timeout is not None and time.monotonic() - last_search_time >= self.idle_timeout):
+                    break
+
+                if not self.once:
+                    self.stop.wait(self.poll_interval)
+
+        except Exception as e:
+            self.error = e
+            self.stop.set()
+
+        finally:
+            self.output_queue.put(_END)
+
+
+class _StageWorker(threading.Thread):
+    """
+    Runs a stage on each search of input_queue, and puts it in output_queue, until the end marker.
+    If the stage fails, the error is kept, stop is set, and the remaining searches are discarded, so that the threads
+    before and after it do not wait forever.
+    """
+
+    def __init__(self, name, stage, input_queue, output_queue, stop):
+        super().__init__(name=name + " stage", daemon=True)
+        self.stage_name = name
+        self.stage = stage
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop = stop
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                item = self.input_queue.get()
+                if item is _END:
+                    break
+
+                if self.error is None:
+                    se, idx, offset, search = item
+                    try:
+                        self.stage(search, se)
+                    except Exception as e:
+                        self.error = e
+                        self.stop.set()
+                        continue
+
+                    self.output_queue.put(item)
+
+        finally:
+            if self.stage_name in STAGE_CLEANUPS:
+                STAGE_CLEANUPS[self.stage_name]()
+            self.output_queue.put(_END)
+
+
+"""
+Tails the crawler files of crawling_files_dir, runs the selected stages on each new search, and appends the processed
+searches to the shards of output_shards, saving the progress in the checkpoint every checkpoint_every searches, and
+whenever no processed search is waiting to be written.
+Runs until interrupted (Ctrl+C), or as set by once and idle_timeout (see _CrawlerFilesReader).
+
+Returns:
+    dict: the number of searches ingested for each search engine
+"""
+def ingest_live(stage_names=None, crawling_files_dir=CRAWLING_FILES_DIR, output_shards=LIVE_SHARDS_DIR, checkpoint_path=LIVE_CHECKPOINT_PATH, request_references=False,
+                token_index=None, queue_size=QUEUE_SIZE, poll_interval=POLL_INTERVAL, once=False, idle_timeout=None, checkpoint_every=100):
+
+    use_token_index(token_index)
+    stages = get_pipeline_stages(stage_names)
+    checkpoint = LiveCheckpoint(checkpoint_path, get_pipeline_configuration([name for name, stage in stages], token_index))
+    counts = {se: 0 for se in ALL_SE_NAMES}
+
+    with CrawlingResultsShardWriter(output_shards, append=True, request_references=request_references) as writer:
+        restore_shards(writer, checkpoint)
+        checkpoint.save()
+
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        reader = _CrawlerFilesReader(crawling_files_dir, checkpoint, queues[0], stop, poll_interval, once, idle_timeout)
+        workers = [_StageWorker(name, stage, queues[index], queues[index + 1], stop) for index, (name, stage) in enumerate(stages)]
+
+        def stop_on_interrupt(signum, frame):
+            print("Stopping, the searches already read are processed first")
+            stop.set()
+
+        # Ctrl+C stops the reader only, so that the searches in the queues are still processed, written and checkpointed
+        previous_handler = signal.signal(signal.SIGINT, stop_on_interrupt)
+
+        reader.start()
+        for worker in workers:
+            worker.start()
+
+        written_searches = {}
+        number_of_written_searches = 0
+
+        while True:
+            item = queues[-1].get()
+
+            if item is not _END:
+                se, idx, offset, search = item
+                writer.append(se, idx, search)
+                written_searches[se] = (offset, idx + 1)
+                counts[se] += 1
+                number_of_written_searches += 1
+
+            if item is _END or number_of_written_searches % checkpoint_every == 0 or queues[-1].empty():
+                writer.flush()
+                for se, (offset, next_index) in written_searches.items():
+                    checkpoint.update(se, offset, next_index, os.path.getsize(writer.get_shard_path(se)))
+                checkpoint.save()
+                written_searches = {}
+
+            if item is _END:
+                break
+
+        reader.join()
+        for worker in workers:
+            worker.join()
+
+        signal.signal(signal.SIGINT, previous_handler)
+
+    for thread in [reader] + workers:
+        if thread.error is not None:
+            raise thread.error
+
+    return counts
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Preprocess the searches while the crawler is running, as they are appended to the crawler files")
+    parser.add_argument("--stages", help="Comma separated list of stages to run, among: " + ", ".join(PIPELINE_STAGES.keys()) + " (default: all)")
+    parser.add_argument("--crawling-files", default=CRAWLING_FILES_DIR, help="Directory of the JSON Lines crawler files")
+    parser.add_argument("--output-shards", default=LIVE_SHARDS_DIR, help="Directory of the JSON Lines shards the processed searches are appended to")
+    parser.add_argument("--checkpoint", default=LIVE_CHECKPOINT_PATH, help="Checkpoint of the ingestion, to resume it where it stopped")
+    parser.add_argument("--request-references", action="store_true", help="Write the phase fields as positions in the requests of each search instead of copies of the requests")
+    parser.add_argument("--token-index", help="Extract user identifiers with the token index saved at this path (see build_token_index.py) instead of the lists of constant tokens")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Number of searches each queue between two stages can hold (default: " + str(QUEUE_SIZE) + ")")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between two reads of the crawler files (default: " + str(POLL_INTERVAL) + ")")
+    parser.add_argument("--once", action="store_true", help="Ingest the searches already in the crawler files, then stop")
+    parser.add_argument("--idle-timeout", type=float, help="Stop after this many seconds without new searches")
+    args = parser.parse_args()
+
+    stage_names = None if args.stages is None else [name.strip() for name in args.stages.split(",")]
+
+    counts = ingest_live(stage_names, args.crawling_files, args.output_shards, args.checkpoint, args.request_references, args.token_index,
+                         args.queue_size, args.poll_interval, args.once, args.idle_timeout)
+
+    print("Ingested searches:", ", ".join(se + ": " + str(count) for se, count in counts.items()))
@@ -0,0 +1,374 @@
+"""
+This script runs the preprocessing stages in a single pass over the dataset.
+Instead of running add_job_id.py, add_is_tracker.py, extract_requests_before_when_and_after_clicking.py and
+extract_user_identifiers.py one after another, each of them re-reading and re-writing the whole dataset,
+the dataset is read once, each search goes through all the selected stages, and the result is written once.
+
+Usage:
+    python run_pipeline.py
+    python run_pipeline.py --stages job_id,is_tracker
+    python run_pipeline.py --incremental
+"""
+import argparse, os
+from collections import OrderedDict
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, iter_crawling_results, iter_json_list, write_crawling_results_stream, \
+    CrawlingResultsShardWriter, get_backend
+from utils.manifest import MANIFEST_PATH, CRAWLING_FILES_DIR, Manifest, get_search_hash, get_source_stat
+from utils.tracker_cache import get_tracker_lists_hash
+from utils.redirector_graph import load_redirector_graph
+from utils.metrics import RunMetrics, PROFILERS, profile_run, get_cache_stats, get_lru_cache_stats
+from utils.parsed_urls import parse_url
+from utils.urls import get_domain_resolver
+from utils.uid_tokens import UidTokenClassifier, get_uid_token_classifier, set_uid_token_classifier
+from utils.token_index import load_token_index, get_token_index_hash
+from add_job_id import add_job_id_to_search
+from add_is_tracker import add_is_tracker_to_search, get_tracker_rules, get_tracker_cache, close_tracker_cache
+from extract_requests_before_when_and_after_clicking import format_duckduckgo_url, get_search_requests_before_and_after_clicking, \
+    extract_search_requests_by_first_parties, \
+    extract_search_redirectors_and_navigation_path
+from extract_user_identifiers import extract_search_user_identifiers
+
+
+"""
+The preprocessing stages, in the order they have to be applied.
+Each stage receives a search and the name of its search engine, and updates the search in place.
+"""
+PIPELINE_STAGES = OrderedDict([
+    ("job_id", lambda search, se: add_job_id_to_search(search)),
+    ("is_tracker", lambda search, se: add_is_tracker_to_search(search, get_tracker_rules(), get_tracker_cache())),
+    ("format_duckduckgo_urls", lambda search, se: format_duckduckgo_url(search) if se == "ddg" else search),
+    ("phases", get_search_requests_before_and_after_clicking),
+    ("requests_by_first_parties", extract_search_requests_by_first_parties),
+    ("redirectors", extract_search_redirectors_and_navigation_path),
+    ("user_identifiers", lambda search, se: extract_search_user_identifiers(search)),
+])
+
+
+"""
+The fields set by the stages that only set fields of the search and of its requests: stage name -> (search fields,
+request fields). When all the selected stages are listed, the searches of a SQLite dataset processed in place only
+have these fields updated, instead of being rewritten with all their requests.
+"""
+STAGE_UPDATED_FIELDS = {
+    "is_tracker": ([], ["is_tracker"]),
+    "format_duckduckgo_urls": (["ads"], []),
+    "redirectors": (["redirectors", "path", "redirecting_requests"], []),
+    "user_identifiers": (["requests_after_clicking", "set-cookies_after_clicking", "parameters_after_clicking"], []),
+}
+
+
+"""
+Returns the selected stages, in pipeline order.
+
+Raises:
+    ValueError: if a stage name is unknown
+"""
+def get_pipeline_stages(stage_names=None):
+
+    if stage_names is None:
+        return list(PIPELINE_STAGES.items())
+
+    unknown_stages = [name for name in stage_names if name not in PIPELINE_STAGES]
+    if len(unknown_stages) > 0:
+        raise ValueError("Unknown stages: " + ", ".join(unknown_stages))
+
+    return [(name, stage) for name, stage in PIPELINE_STAGES.items() if name in stage_names]
+
+
+"""
+Runs the given stages on each search of an iterable of (search engine name, index, search)
+
+Yields:
+    the processed (search engine name, index, search)
+"""
+def process_searches(searches, stages):
+
+    for se, idx, search in searches:
+        for name, stage in stages:
+            stage(search, se)
+
+        yield se, idx, search
+
+
+"""
+Reads the dataset once, runs the selected stages on each search, and writes the result once.
+If output_shards is given, the processed searches are written as JSON Lines files, one per search engine, in that directory.
+With request_references, the phase fields are written as positions in search["requests"] instead of copies of the requests.
+When the input and output are the same SQLite dataset, each processed search is updated in place, only updating the
+fields the stages set when all of them are listed in STAGE_UPDATED_FIELDS.
+If request_table is given, the columnar request table of the processed searches is also exported to that directory.
+If redirector_graph is given, the redirector graph saved at that path is updated with the processed searches.
+If metrics (a RunMetrics) is given, the time and throughput of each stage and search engine, and the cache statistics, are recorded in it.
+If token_index is given, user identifiers are extracted with the token index saved at that path (see build_token_index.py).
+"""
+def run_pipeline(stage_names=None, input_path=RESULTS_FILE_PATH, output_path=RESULTS_FILE_PATH, output_shards=None, request_references=False, request_table=None,
+                 redirector_graph=None, metrics=None, token_index=None):
+
+    use_token_index(token_index)
+    stages = get_pipeline_stages(stage_names)
+    if metrics is not None:
+        stages = metrics.instrument_stages(stages)
+
+    in_place = output_shards is None and get_backend(output_path) == "sqlite" and os.path.abspath(output_path) == os.path.abspath(input_path)
+
+    if in_place:
+        # The searches are read and written on the same connection, a second connection would find the database locked
+        from utils.sqlite_store import SqliteDatasetStore
+        store = SqliteDatasetStore(output_path)
+        searches = store.iter_searches()
+    else:
+        searches = iter_crawling_results(input_path)
+
+    processed_searches = process_searches(searches, stages)
+
+    if request_table is not None:
+        # Imported here, so that NumPy is only needed when exporting the table
+        from utils.request_table import RequestTableBuilder
+        table_builder = RequestTableBuilder()
+        processed_searches = table_builder.add_searches(processed_searches)
+
+    if redirector_graph is not None:
+        graph = load_redirector_graph(redirector_graph)
+        processed_searches = graph.add_searches(processed_searches)
+
+    if metrics is not None:
+        processed_searches = metrics.track_searches(processed_searches)
+
+    if in_place:
+        with store:
+            write_searches_in_place(store, processed_searches, [name for name, stage in stages])
+
+    elif output_shards is None:
+        write_crawling_results_stream(processed_searches, output_path, request_references=request_references)
+
+    else:
+        with CrawlingResultsShardWriter(output_shards, append=False, request_references=request_references) as writer:
+            for se, idx, search in processed_searches:
+                writer.append(se, idx, search)
+
+    if request_table is not None:
+        table_builder.write(request_table)
+
+    if redirector_graph is not None:
+        graph.save(redirector_graph)
+
+    if metrics is not None:
+        record_cache_metrics(metrics, [name for name, stage in stages])
+
+    close_tracker_cache()
+
+
+"""
+Writes the processed searches back to the SQLite store they were read from. When all the stages only set the fields of
+STAGE_UPDATED_FIELDS, only these fields are updated, otherwise each search is rewritten.
+"""
+def write_searches_in_place(store, processed_searches, stage_names):
+
+    if any(name not in STAGE_UPDATED_FIELDS for name in stage_names):
+        store.write_searches(processed_searches)
+        return
+
+    search_fields = [field for name in stage_names for field in STAGE_UPDATED_FIELDS[name][0]]
+    request_fields = [field for name in stage_names for field in STAGE_UPDATED_FIELDS[name][1]]
+
+    for se, idx, search in processed_searches:
+        store.update_search_fields(se, idx, search, search_fields, request_fields)
+
+    store.commit()
+
+
+"""
+Adds the statistics of the caches used by the stages to metrics: parsed URLs, domains resolved with tldextract,
+tracker classifications, and dictionary lookups of the user identifier extraction.
+"""
+def record_cache_metrics(metrics, stage_names):
+
+    metrics.record_cache("parsed_urls", get_lru_cache_stats(parse_url.cache_info()))
+    metrics.record_cache("tldextract", get_lru_cache_stats(get_domain_resolver().cache_info()))
+
+    if "is_tracker" in stage_names:
+        cache = get_tracker_cache()
+        metrics.record_cache("tracker", get_cache_stats(cache.memory_hits + cache.disk_hits, cache.misses, memory_hits=cache.memory_hits, disk_hits=cache.disk_hits))
+
+    if "user_identifiers" in stage_names:
+        cache_info = get_uid_token_classifier().cache_info()
+        metrics.record_cache("dictionary", get_lru_cache_stats(cache_info["words"]))
+        metrics.record_cache("uid_tokens", get_lru_cache_stats(cache_info["tokens"]))
+
+    metrics.finish()
+
+
+"""
+Makes the user identifier extraction use the token index saved at token_index_path, instead of the lists of constant
+keys and values, if a path is given
+"""
+def use_token_index(token_index_path):
+
+    if token_index_path is not None:
+        set_uid_token_classifier(UidTokenClassifier(token_index=load_token_index(token_index_path)))
+
+
+"""
+Returns what the results of the given stages depend on, besides the crawled searches
+"""
+def get_pipeline_configuration(stage_names, token_index=None):
+
+    configuration = {"stages": stage_names}
+    if "is_tracker" in stage_names:
+        configuration["tracker_lists_hash"] = get_tracker_lists_hash()
+
+    if "user_identifiers" in stage_names and token_index is not None:
+        configuration["token_index_hash"] = get_token_index_hash(token_index)
+
+    return configuration
+
+
+class _PreviousSearches:
+    """
+    Random access, in increasing (search engine, index) order, to the searches of the previous output
+    """
+
+    def __init__(self, searches):
+        self.searches = iter(searches)
+        self.current = next(self.searches, None)
+
+    def _skip_before(self, key):
+        while self.current is not None and (ALL_SE_NAMES.index(self.current[0]), self.current[1]) < key:
+            self.current = next(self.searches, None)
+
+    def get(self, se, idx):
+        self._skip_before((ALL_SE_NAMES.index(se), idx))
+        if self.current is not None and self.current[0] == se and self.current[1] == idx:
+            return self.current[2]
+        return None
+
+    def iter_search_engine(self, se):
+        self._skip_before((ALL_SE_NAMES.index(se), 0))
+        while self.current is not None and self.current[0] == se:
+            yield self.current
+            self.current = next(self.searches, None)
+
+
+"""
+Merges the crawler files with the previous output: searches of unchanged crawler files, and unchanged searches,
+are taken from the previous output, the others are processed. The manifest is updated along the way.
+
+Yields:
+    the (search engine name, index, search) of the new output
+"""
+def iter_incremental_searches(stages, manifest, configuration, source_paths, source_stats, previous_searches, counts):
+
+    stage_names = [name for name, stage in stages]
+
+    for se in ALL_SE_NAMES:
+        if source_stats[se] is None:
+            manifest.remove_search_engine(se)
+            continue
+
+        if manifest.is_source_unchanged(se, source_stats[se], configuration):
+            for se, idx, search in previous_searches.iter_search_engine(se):
+                counts["reused"] += 1
+                yield se, idx, search
+            continue
+
+        searches = []
+        for idx, search in enumerate(iter_json_list(source_paths[se])):
+            search_hash = get_search_hash(search)
+            previous_search = previous_searches.get(se, idx)
+
+            if previous_search is not None and manifest.is_search_processed(se, idx, search_hash, stage_names, configuration):
+                search = previous_search
+                counts["reused"] += 1
+
+            else:
+                for name, stage in stages:
+                    stage(search, se)
+                counts["processed"] += 1
+
+            searches.append({"hash": search_hash, "stages": stage_names})
+            yield se, idx, search
+
+        manifest.set_search_engine(se, source_stats[se], configuration, searches)
+
+
+"""
+Builds the dataset from the crawler files of crawling_files_dir, only processing the searches that are new or changed
+since the last run, and merging them into the existing output. The manifest records what was already processed.
+"""
+def run_incremental_pipeline(stage_names=None, crawling_files_dir=CRAWLING_FILES_DIR, output_path=RESULTS_FILE_PATH, manifest_path=MANIFEST_PATH, request_references=False,
+                             metrics=None, token_index=None):
+
+    if get_backend(output_path) == "sqlite":
+        raise ValueError("The incremental mode writes JSON datasets, SQLite datasets are updated in place by run_pipeline")
+
+    use_token_index(token_index)
+    stages = get_pipeline_stages(stage_names)
+    configuration = get_pipeline_configuration([name for name, stage in stages], token_index)
+    if metrics is not None:
+        stages = metrics.instrument_stages(stages)
+
+    manifest = Manifest(manifest_path)
+    if manifest.output is None or manifest.output != get_source_stat(output_path):
+        # The output was changed since the manifest was written, nothing can be reused
+        manifest = Manifest(None)
+
+    source_paths = {se: os.path.join(crawling_files_dir, se + ".json") for se in ALL_SE_NAMES}
+    source_stats = {se: get_source_stat(path) for se, path in source_paths.items()}
+
+    if manifest.output is not None and all(manifest.is_source_unchanged(se, source_stats[se], configuration) or (source_stats[se] is None and se not in manifest.search_engines) for se in ALL_SE_NAMES):
+        print("Nothing to process, the dataset is up to date")
+        return
+
+    counts = {"processed": 0, "reused": 0}
+    previous_searches = _PreviousSearches(iter_crawling_results(output_path) if manifest.output is not None else [])
+    searches = iter_incremental_searches(stages, manifest, configuration, source_paths, source_stats, previous_searches, counts)
+    if metrics is not None:
+        searches = metrics.track_searches(searches)
+    write_crawling_results_stream(searches, output_path, number_of_search_engines=len(ALL_SE_NAMES), request_references=request_references)
+
+    manifest.output = get_source_stat(output_path)
+    manifest.path = manifest_path
+    manifest.save()
+
+    if metrics is not None:
+        record_cache_metrics(metrics, [name for name, stage in stages])
+
+    close_tracker_cache()
+
+    print("Processed searches:", counts["processed"], "- reused searches:", counts["reused"])
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the preprocessing stages in a single pass over the dataset")
+    parser.add_argument("--stages", help="Comma separated list of stages to run, among: " + ", ".join(PIPELINE_STAGES.keys()) + " (default: all)")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Dataset to read")
+    parser.add_argument("--output", default=RESULTS_FILE_PATH, help="Dataset to write")
+    parser.add_argument("--output-shards", help="Write JSON Lines shards, one per search engine, in this directory instead of a single dataset file")
+    parser.add_argument("--request-references", action="store_true", help="Write the phase fields as positions in the requests of each search instead of copies of the requests")
+    parser.add_argument("--incremental", action="store_true", help="Build the dataset from the crawler files, only processing new or changed searches")
+    parser.add_argument("--crawling-files", default=CRAWLING_FILES_DIR, help="Directory of the crawler files, for --incremental")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="Manifest of the processed searches, for --incremental")
+    parser.add_argument("--request-table", help="Also export the columnar request table of the processed searches to this directory")
+    parser.add_argument("--redirector-graph", help="Also update the redirector graph saved at this path with the processed searches")
+    parser.add_argument("--token-index", help="Extract user identifiers with the token index saved at this path (see build_token_index.py) instead of the lists of constant tokens")
+    parser.add_argument("--metrics", help="Write a JSON run report (time, throughput, dropped requests and cache hit rates by stage and search engine) to this path")
+    parser.add_argument("--profile", help="Profile the run and save the profile to this path")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile", help="Profiler used with --profile (default: cprofile, pyinstrument must be installed to use it)")
+    args = parser.parse_args()
+
+    stage_names = None if args.stages is None else [name.strip() for name in args.stages.split(",")]
+    metrics = RunMetrics() if args.metrics is not None else None
+
+    with profile_run(args.profile, args.profiler):
+        if args.incremental:
+            run_incremental_pipeline(stage_names, args.crawling_files, args.output, args.manifest, args.request_references, metrics, args.token_index)
+
+        else:
+            run_pipeline(stage_names, args.input, args.output, args.output_shards, args.request_references, args.request_table, args.redirector_graph, metrics, args.token_index)
+
+    if metrics is not None:
+        metrics.write(args.metrics)
+        print(metrics.summary())
@@ -0,0 +1,101 @@
+"""
+This script preprocesses the dataset on several machines, by splitting it into shards processed independently.
+
+    split   splits the dataset deterministically by (search engine, search index) into N shards (see utils/sharding.py)
+    run     runs the preprocessing stages on one shard, with its own tracker cache; the domains resolved with
+            tldextract are memoized in memory, so each process already has its own
+    merge   merges the processed shards back into a dataset with the layout read_crawling_results expects, checking
+            that every search appears exactly once
+
+The shards directory can be copied to each machine, and the processed shard directories copied back before merging.
+
+Usage:
+    python shard_dataset.py split --shards 8
+    python shard_dataset.py run --shard 3
+    python shard_dataset.py merge
+"""
+import argparse, os
+
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, CrawlingResultsShardWriter, iter_crawling_results_shards, \
+    write_crawling_results_stream
+from utils.sharding import SHARDS_DIR, split_dataset, read_shards_manifest, get_shard_dir, get_processed_shard_dir, write_processed_shard_info, \
+    iter_merged_shards
+from utils.tracker_cache import CACHE_DIR
+from add_is_tracker import set_tracker_cache_path, close_tracker_cache
+from run_pipeline import PIPELINE_STAGES, get_pipeline_stages, get_pipeline_configuration, process_searches, use_token_index
+
+
+"""
+Returns the default tracker cache of a shard, so that shards processed on the same machine do not share a cache file
+"""
+def get_shard_tracker_cache_path(shard):
+
+    return os.path.join(CACHE_DIR, "tracker_cache_shard_{:05d}.sqlite".format(shard))
+
+
+"""
+Runs the selected stages on the searches of a shard, and writes them to its processed shard directory
+
+Returns:
+    dict: the number of searches processed for each search engine
+"""
+def run_shard(shard, shards_dir=SHARDS_DIR, stage_names=None, tracker_cache=None, token_index=None):
+
+    manifest = read_shards_manifest(shards_dir)
+    if not 0 <= shard < manifest["number_of_shards"]:
+        raise ValueError("The shard must be between 0 and " + str(manifest["number_of_shards"] - 1))
+
+    set_tracker_cache_path(tracker_cache if tracker_cache is not None else get_shard_tracker_cache_path(shard))
+    use_token_index(token_index)
+    stages = get_pipeline_stages(stage_names)
+
+    counts = {se: 0 for se in ALL_SE_NAMES}
+    with CrawlingResultsShardWriter(get_processed_shard_dir(shards_dir, shard), append=False) as writer:
+        for se in ALL_SE_NAMES:
+            if os.path.exists(writer.get_shard_path(se)):
+                os.remove(writer.get_shard_path(se))
+
+        for se, idx, search in process_searches(iter_crawling_results_shards(get_shard_dir(shards_dir, shard)), stages):
+            writer.append(se, idx, search)
+            counts[se] += 1
+
+    close_tracker_cache()
+    write_processed_shard_info(shards_dir, shard, manifest["split_id"], get_pipeline_configuration([name for name, stage in stages], token_index), counts)
+
+    return counts
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Split the dataset into shards, preprocess each shard independently, and merge the processed shards")
+    parser.add_argument("command", choices=["split", "run", "merge"])
+    parser.add_argument("--shards-dir", default=SHARDS_DIR, help="Directory of the shards")
+    parser.add_argument("--shards", type=int, help="Number of shards, for split")
+    parser.add_argument("--input", default=RESULTS_FILE_PATH, help="Dataset to split, for split")
+    parser.add_argument("--shard", type=int, help="Shard to process, for run")
+    parser.add_argument("--stages", help="Comma separated list of stages to run, among: " + ", ".join(PIPELINE_STAGES.keys()) + " (default: all), for run")
+    parser.add_argument("--tracker-cache", help="Tracker classification cache of the shard, for run (default: " + get_shard_tracker_cache_path(0).replace("00000", "<shard>") + ")")
+    parser.add_argument("--token-index", help="Extract user identifiers with the token index saved at this path (see build_token_index.py), for run")
+    parser.add_argument("--output", default=RESULTS_FILE_PATH, help="Dataset to write, for merge")
+    parser.add_argument("--request-references", action="store_true", help="Write the phase fields as positions in the requests of each search, for merge")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        if args.shards is None or args.shards < 1:
+            parser.error("split requires --shards, a positive number of shards")
+
+        manifest = split_dataset(args.input, args.shards_dir, args.shards)
+        print("Split", sum(manifest["counts"].values()), "searches into", args.shards, "shards in", args.shards_dir)
+
+    elif args.command == "run":
+        if args.shard is None:
+            parser.error("run requires --shard")
+
+        stage_names = None if args.stages is None else [name.strip() for name in args.stages.split(",")]
+        counts = run_shard(args.shard, args.shards_dir, stage_names, args.tracker_cache, args.token_index)
+        print("Processed", sum(counts.values()), "searches of the shard", args.shard)
+
+    else:
+        write_crawling_results_stream(iter_merged_shards(args.shards_dir), args.output, number_of_search_engines=len(ALL_SE_NAMES), request_references=args.request_references)
+        print("Merged the shards of", args.shards_dir, "into", args.output)
@@ -0,0 +1,198 @@
+import re
+from collections import defaultdict
+from adblockparser import AdblockRule
+
+# Characters forming the tokens of URLs and rules. Any other character separates two tokens.
+_TOKEN_RE = re.compile(r"[a-z0-9%]+")
+
+# Plain hostname rules, like ||example.com^
+_HOSTNAME_RULE_RE = re.compile(r"^\|\|([a-z0-9\-]+(?:\.[a-z0-9\-]+)*)\^$")
+
+# The characters that may follow a hostname without being a separator, see AdblockRule.rule_to_regex
+_HOSTNAME_RUN_RE = re.compile(r"[\w\-.%]*")
+
+_SCHEME_RE = re.compile(r"[^:/?#]+:")
+
+
+class IndexedAdblockRules:
+    """
+    Matcher equivalent to AdblockRules(rules).should_block(url) when no options are given, built for speed.
+
+    - Plain ||hostname^ rules are kept in hash sets, and checked by walking the suffixes of the URL's host.
+    - Every other rule is indexed by one of its tokens, the one shared by the fewest rules.
+      A token is a run of [a-z0-9%] that any matching URL must contain as a whole token,
+      so a URL is only tested against the rules indexed by its own tokens.
+    - The few rules without such a token are always tested.
+
+    The regexes of each bucket are combined and compiled the first time a URL needs them.
+    """
+
+    def __init__(self, rules, supported_options=None):
+
+        if supported_options is None:
+            supported_options = AdblockRule.BINARY_OPTIONS + ["domain"]
+        supported_options = dict((option, True) for option in supported_options)
+
+        parsed_rules = []
+        for rule in rules:
+            rule = rule if isinstance(rule, AdblockRule) else AdblockRule(rule)
+
+            # Same selection as AdblockRules, then only keep the rules that apply when no options are given
+            if (rule.regex or rule.options) and rule.matching_supported(supported_options) and rule.matching_supported({}):
+                parsed_rules.append(rule)
+
+        self.hostnames = {False: set(), True: set()}
+        self.token_rules = {False: defaultdict(list), True: defaultdict(list)}
+        self.generic_rules = {False: [], True: []}
+        self.case_sensitive_rules = {False: [], True: []}
+        self._compiled = {}
+
+        rules_tokens = []
+        token_frequencies = defaultdict(int)
+        for rule in parsed_rules:
+            tokens = _get_rule_tokens(rule)
+            rules_tokens.append(tokens)
+            for token in tokens:
+                token_frequencies[token] += 1
+
+        for rule, tokens in zip(parsed_rules, rules_tokens):
+            is_exception = rule.is_exception
+
+            if rule.options:
+                # Only match-case rules remain, AdblockRules matches them one by one without ignoring case
+                self.case_sensitive_rules[is_exception].append(rule.regex)
+                continue
+
+            hostname = _HOSTNAME_RULE_RE.match(rule.rule_text.lower())
+            if hostname is not None:
+                self.hostnames[is_exception].add(hostname.group(1))
+
+            elif len(tokens) > 0:
+                token = min(tokens, key=lambda token: (token_frequencies[token], -len(token)))
+                self.token_rules[is_exception][token].append(rule.regex)
+
+            else:
+                self.generic_rules[is_exception].append(rule.regex)
+
+        self.token_rules = {key: dict(value) for key, value in self.token_rules.items()}
+
+    def should_block(self, url, options=None):
+
+        if options:
+            raise ValueError("IndexedAdblockRules only supports matching without options")
+
+        lowercase_url = url.lower()
+        hostname_candidates = None
+        url_tokens = None
+
+        for is_exception in [True, False]:
+            if len(self.hostnames[is_exception]) > 0:
+                if hostname_candidates is None:
+                    hostname_candidates = _get_hostname_candidates(lowercase_url)
+                if not self.hostnames[is_exception].isdisjoint(hostname_candidates):
+                    return not is_exception
+
+            matched = False
+            if len(self.token_rules[is_exception]) > 0:
+                if url_tokens is None:
+                    url_tokens = set(_TOKEN_RE.findall(lowercase_url))
+
+                for token in url_tokens:
+                    if token in self.token_rules[is_exception] and self._get_regex(is_exception, token).search(url):
+                        matched = True
+                        break
+
+            if not matched and len(self.generic_rules[is_exception]) > 0:
+                matched = self._get_regex(is_exception, None).search(url) is not None
+
+            if not matched:
+                matched = any(self._get_regex(is_exception, index).search(url) for index in range(len(self.case_sensitive_rules[is_exception])))
+
+            if matched:
+                return not is_exception
+
+        return False
+
+    def _get_regex(self, is_exception, key):
+        """
+        Compiled regex of a token bucket (key is the token), of the generic rules (key is None),
+        or of a case sensitive rule (key is its position)
+        """
+
+        compiled_key = (is_exception, key)
+        if compiled_key not in self._compiled:
+            if key is None:
+                regex = re.compile("|".join(self.generic_rules[is_exception]), re.IGNORECASE)
+            elif isinstance(key, int):
+                regex = re.compile(self.case_sensitive_rules[is_exception][key])
+            else:
+                regex = re.compile("|".join(self.token_rules[is_exception][key]), re.IGNORECASE)
+            self._compiled[compiled_key] = regex
+
+        return self._compiled[compiled_key]
+
+    def __getstate__(self):
+        # Compiled regexes are rebuilt lazily after unpickling
+        state = self.__dict__.copy()
+        state["_compiled"] = {}
+        return state
+
+
+def _get_rule_tokens(rule):
+    """
+    Returns the tokens that every URL matched by rule contains as whole tokens
+    """
+
+    pattern = rule.rule_text.lower()
+
+    # Regex rules, and rules with a "|" in the middle (which AdblockRule does not escape reliably), cannot be indexed
+    if len(pattern) <= 2 or (pattern.startswith("/") and pattern.endswith("/")):
+        return []
+
+    left_anchored = pattern.startswith("|")
+    pattern = pattern[2:] if pattern.startswith("||") else pattern.lstrip("|")
+    right_anchored = pattern.endswith("|")
+    pattern = pattern[:-1] if right_anchored else pattern
+
+    if "|" in pattern:
+        return []
+
+    tokens = []
+    for match in _TOKEN_RE.finditer(pattern):
+        start, end = match.span()
+        left_safe = (start == 0 and left_anchored) or (start > 0 and pattern[start - 1] != "*")
+        right_safe = (end == len(pattern) and right_anchored) or (end < len(pattern) and pattern[end] != "*")
+
+        if left_safe and right_safe:
+            tokens.append(match.group())
+
+    return tokens
+
+
+def _get_hostname_candidates(url):
+    """
+    Returns the strings that a ||hostname^ rule can match in url: the maximal runs of hostname characters
+    starting at the beginning of the URL, after its scheme, after "//" or after a dot of the authority.
+    """
+
+    starts = [0]
+    authority_start = None
+
+    scheme = _SCHEME_RE.match(url)
+    if scheme is not None:
+        starts.append(scheme.end())
+        if url.startswith("//", scheme.end()):
+            authority_start = scheme.end() + 2
+
+    if url.startswith("//"):
+        authority_start = 2
+
+    if authority_start is not None:
+        starts.append(authority_start)
+        position = authority_start
+        while position < len(url) and url[position] not in "/?#":
+            if url[position] == ".":
+                starts.append(position + 1)
+            position += 1
+
+    return set(_HOSTNAME_RUN_RE.match(url, start).group() for start in starts)
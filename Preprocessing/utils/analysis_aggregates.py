@@ -0,0 +1,285 @@
+import hashlib, os, pickle
+from collections import Counter, OrderedDict
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, iter_crawling_results
+from utils.manifest import get_source_stat
+from utils.parsed_urls import parse_url
+
+ANALYSIS_AGGREGATES_PATH = "../Data/cache/analysis_aggregates.pickle"
+
+# Bump when the aggregates change, so that cached aggregates are rebuilt
+ANALYSIS_AGGREGATES_VERSION = 1
+
+# The notebook analyzes at most this number of searches with ads per search engine
+MAX_SEARCHES_BY_SE = 500
+
+# Fields of the parties reached in each phase, and of the tracker parties
+PARTY_FIELDS = ["domains_before_clicking", "domains_after_clicking_from_search_engine", "domains_after_clicking", "domains_after_reaching_destination"]
+TRACKER_PARTY_FIELDS = ["tracker_domains_before_clicking", "tracker_domains_after_clicking_from_search_engine", "tracker_domains_after_clicking",
+                        "tracker_domains_after_reaching_destination"]
+
+# Fields of the dataset read to build the aggregates, the other fields (requests, results, raw_body...) are not parsed
+AGGREGATE_FIELDS = ["clicked_url", "ads", "requests_by_first_parties", "redirectors", "path", "set-cookies_after_clicking", "parameters_after_clicking"] + \
+    [field for field in PARTY_FIELDS + TRACKER_PARTY_FIELDS if "from_search_engine" not in field]
+
+# Tables of Analysis/tables written from the aggregates: file name -> (section, field, number of rows)
+ANALYSIS_TABLES = OrderedDict([
+    ("most_common_parties_before_clicking_ad.txt", ("parties", "domains_before_clicking", 14)),
+    ("most_common_parties_after_clicking_ad_from_se.txt", ("parties", "domains_after_clicking_from_search_engine", 6)),
+    ("most_common_parties_after_reaching_destination.txt", ("parties", "domains_after_reaching_destination", 14)),
+    ("most_common_tracker_parties_before_clicking_ad.txt", ("tracker_parties", "tracker_domains_before_clicking", 4)),
+    ("most_common_tracker_parties_after_clicking_ad_from_se.txt", ("tracker_parties", "tracker_domains_after_clicking_from_search_engine", 4)),
+    ("most_common_tracker_parties_after_reaching_destination.txt", ("tracker_parties", "tracker_domains_after_reaching_destination", 4)),
+    ("most_common_redirectors.txt", ("redirectors", "redirectors", 14)),
+])
+
+
+def get_dataset_hash(path):
+    """
+    Returns:
+        str: the content hash of the dataset file at path
+    """
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def has_landing_url(search):
+    """
+    Returns True if an ad was clicked and the landing URL of the clicked ad was extracted, the searches the notebook keeps
+    """
+
+    return search["clicked_url"] != "" and len(search["ads"]) > 0 and "landing_url" in search["ads"][0] and search["ads"][0]["landing_url"] != ""
+
+
+def get_domains_after_clicking_from_search_engine(search):
+    """
+    Returns:
+        tuple: (domains, tracker domains) of the requests sent by the search engine's page when clicking the ad,
+        the requests of the first party of requests_by_first_parties, as in the notebook
+    """
+
+    first_party_requests = list(search["requests_by_first_parties"][0].values())[0]
+    domains = [parse_url(request["url"]).netloc for request in first_party_requests]
+    tracker_domains = [parse_url(request["url"]).netloc for request in first_party_requests if request["is_tracker"] is True]
+
+    return domains, tracker_domains
+
+
+def _new_party_counters():
+    # searches: number of searches reaching each party, requests: number of requests to each party,
+    # distinct: number of searches by number of distinct parties reached
+    return {"searches": Counter(), "requests": Counter(), "distinct": Counter()}
+
+
+def _add_parties(counters, domains):
+    distinct_domains = set(domains)
+    counters["searches"].update(distinct_domains)
+    counters["requests"].update(domains)
+    counters["distinct"][len(distinct_domains)] += 1
+
+
+class AnalysisAggregates:
+    """
+    Aggregates of the preprocessed dataset the analysis tables and plots are computed from, built in one pass.
+
+    For each search engine, over the searches the notebook analyzes (searches with the landing URL of the clicked ad,
+    at most max_searches per search engine):
+        parties, tracker_parties: for each phase field, the number of searches and of requests reaching each party, and
+            the number of searches by number of distinct parties reached
+        redirectors: the number of searches going through each redirector, the number of searches by number of
+            redirectors (searches that reached the destination), and the first parties found at each redirector position
+        paths: the number of searches following each navigation path
+        cookie_redirectors: the number of searches in which each redirector sets UID cookies, the number of times
+            redirectors do not, and the number of searches by number of redirectors setting UID cookies
+        uid_parameters: the number of UID query parameters by key and by domain, and the number of searches by number
+            of UID query parameters
+    """
+
+    def __init__(self, max_searches=MAX_SEARCHES_BY_SE):
+        self.max_searches = max_searches
+        self.search_engines = OrderedDict((se, self._new_search_engine()) for se in ALL_SE_NAMES)
+
+    @staticmethod
+    def _new_search_engine():
+        return {
+            "searches": 0,
+            "searches_with_ads": 0,
+            "analyzed_searches": 0,
+            "parties": {field: _new_party_counters() for field in PARTY_FIELDS},
+            "tracker_parties": {field: _new_party_counters() for field in TRACKER_PARTY_FIELDS},
+            "redirectors": {"redirectors": _new_party_counters(), "number_of_redirectors": Counter(), "positions": {}},
+            "paths": Counter(),
+            "cookie_redirectors": {"searches": Counter(), "not_setting_cookies": Counter(), "number_by_search": Counter()},
+            "uid_parameters": {"keys": Counter(), "domains": Counter(), "number_by_search": Counter()},
+        }
+
+    # Building
+
+    def add_search(self, se, search):
+        aggregates = self.search_engines[se]
+        aggregates["searches"] += 1
+
+        if not has_landing_url(search):
+            return
+
+        aggregates["searches_with_ads"] += 1
+        if self.max_searches is not None and aggregates["analyzed_searches"] >= self.max_searches:
+            return
+        aggregates["analyzed_searches"] += 1
+
+        domains_from_search_engine, tracker_domains_from_search_engine = get_domains_after_clicking_from_search_engine(search)
+        for section, fields in [("parties", PARTY_FIELDS), ("tracker_parties", TRACKER_PARTY_FIELDS)]:
+            for field in fields:
+                if field == "domains_after_clicking_from_search_engine":
+                    domains = domains_from_search_engine
+                elif field == "tracker_domains_after_clicking_from_search_engine":
+                    domains = tracker_domains_from_search_engine
+                else:
+                    domains = search[field]
+                _add_parties(aggregates[section][field], domains)
+
+        self._add_redirectors(aggregates, se, search)
+
+        uid_parameters = aggregates["uid_parameters"]
+        number_of_parameters = 0
+        for parameters, domain in search["parameters_after_clicking"]:
+            uid_parameters["keys"].update(parameters.keys())
+            uid_parameters["domains"][domain] += len(parameters)
+            number_of_parameters += len(parameters)
+        uid_parameters["number_by_search"][number_of_parameters] += 1
+
+    def _add_redirectors(self, aggregates, se, search):
+        redirectors = aggregates["redirectors"]
+        _add_parties(redirectors["redirectors"], search["redirectors"])
+
+        if len(search["domains_after_reaching_destination"]) > 0:
+            redirectors["number_of_redirectors"][len(search["redirectors"])] += 1
+
+        first_parties = [first_party for parties in search["requests_by_first_parties"][1:-1] for first_party in parties.keys()]
+        for position, first_party in enumerate(first_parties):
+            redirectors["positions"].setdefault(position, Counter())[first_party] += 1
+
+        if search["path"] != "":
+            aggregates["paths"][search["path"]] += 1
+
+        # Redirectors setting UID cookies, without the cookies of Bing and Google's own pages
+        redirectors_setting_cookies = set(domain for cookies, domain in search["set-cookies_after_clicking"])
+        if se in ["bing", "google"]:
+            redirectors_setting_cookies.discard("www." + se)
+
+        cookie_redirectors = aggregates["cookie_redirectors"]
+        cookie_redirectors["number_by_search"][len(redirectors_setting_cookies)] += 1
+
+        search_redirectors_setting_cookies = set()
+        for redirector in search["redirectors"]:
+            if set([redirector, redirector[:-4], redirector[:-3]]) & redirectors_setting_cookies:
+                search_redirectors_setting_cookies.add(redirector)
+            else:
+                cookie_redirectors["not_setting_cookies"][redirector] += 1
+        cookie_redirectors["searches"].update(search_redirectors_setting_cookies)
+
+    def add_searches(self, searches):
+        """
+        Adds an iterable of (search engine name, index, search), and yields them back unchanged
+        """
+
+        for se, idx, search in searches:
+            self.add_search(se, search)
+            yield se, idx, search
+
+    # Queries
+
+    def top_parties(self, se, section, field, n=None):
+        """
+        Returns:
+            list: the n parties reached by the most searches of se, with the fraction of the analyzed searches reaching them
+        """
+
+        aggregates = self.search_engines[se]
+        return [(party, count / aggregates["analyzed_searches"]) for party, count in aggregates[section][field]["searches"].most_common(n)]
+
+    def top_parties_table(self, section, field, n):
+        """
+        Returns:
+            pandas.DataFrame: one column per search engine, listing its n most common parties as "party (xx.x%)"
+        """
+
+        # Imported here, so that pandas is only needed to write the tables
+        import pandas as pd
+
+        columns = OrderedDict()
+        for se in ALL_SE_NAMES:
+            columns[se.capitalize()] = pd.Series([party + " (" + str(round(100 * fraction, 1)) + "%)" for party, fraction in self.top_parties(se, section, field, n)], dtype=object)
+
+        return pd.DataFrame(columns).fillna("")
+
+    def write_tables(self, tables_dir):
+        """
+        Writes the LaTeX tables of ANALYSIS_TABLES to tables_dir. Each table is rendered before its file is replaced,
+        so a table that fails to render leaves the previous one in place.
+        """
+
+        os.makedirs(tables_dir, exist_ok=True)
+        for file_name, (section, field, n) in ANALYSIS_TABLES.items():
+            latex = self.top_parties_table(section, field, n).to_latex(index=False, escape=True)
+
+            path = os.path.join(tables_dir, file_name)
+            with open(path + ".tmp", "w") as text_file:
+                text_file.write(latex)
+            os.replace(path + ".tmp", path)
+
+
+def build_analysis_aggregates(dataset_path=RESULTS_FILE_PATH, max_searches=MAX_SEARCHES_BY_SE):
+    """
+    Builds the aggregates of the dataset in one pass, parsing only AGGREGATE_FIELDS when the dataset has an offset index
+    """
+
+    aggregates = AnalysisAggregates(max_searches)
+    for se, idx, search in iter_crawling_results(dataset_path, fields=AGGREGATE_FIELDS):
+        aggregates.add_search(se, search)
+
+    return aggregates
+
+
+def load_analysis_aggregates(dataset_path=RESULTS_FILE_PATH, path=ANALYSIS_AGGREGATES_PATH, max_searches=MAX_SEARCHES_BY_SE, rebuild=False):
+    """
+    Returns the aggregates of the dataset, from the cache at path when they were built from a dataset with the same
+    content hash. Otherwise (or with rebuild), they are built and cached.
+    The dataset is only hashed when its size or modification time changed since the aggregates were cached.
+
+    Returns:
+        AnalysisAggregates: the aggregates
+    """
+
+    dataset_stat = get_source_stat(dataset_path)
+    cached = None
+
+    if not rebuild and os.path.exists(path):
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+
+        if cached.get("version") != ANALYSIS_AGGREGATES_VERSION or cached["aggregates"].max_searches != max_searches:
+            cached = None
+
+    if cached is not None and cached["dataset_stat"] == dataset_stat:
+        return cached["aggregates"]
+
+    dataset_hash = get_dataset_hash(dataset_path)
+    if cached is not None and cached["dataset_hash"] == dataset_hash:
+        aggregates = cached["aggregates"]
+    else:
+        aggregates = build_analysis_aggregates(dataset_path, max_searches)
+
+    if os.path.dirname(path) != "":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump({"version": ANALYSIS_AGGREGATES_VERSION, "dataset_stat": dataset_stat, "dataset_hash": dataset_hash, "aggregates": aggregates}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+    return aggregates
@@ -0,0 +1,195 @@
+import os
+from collections.abc import MutableMapping
+from utils.read_and_write_crawling_results import RESULTS_FILE_PATH, ALL_SE_NAMES, iter_crawling_results
+from utils.request_refs import to_request_references, resolve_request_references
+
+# Fields of a request stored in slots, in the order they are listed; the other fields are kept in a dictionary
+REQUEST_SLOTS = ("url", "responseHeaders", "status", "interceptionId", "requestId", "timestamp", "redirectChain", "job_id", "is_tracker")
+
+# Fields of the crawler that no stage reads, dropped from compact requests
+DROPPED_REQUEST_FIELDS = frozenset(["requestHeaders", "method", "responseText"])
+
+# Response headers read by the stages, the other headers are dropped
+KEPT_RESPONSE_HEADERS = ("location", "set-cookie")
+
+
+class StringPool:
+    """
+    Interns strings, so that equal strings (interceptionIds, repeated URLs, header values...) are stored once.
+    Unlike sys.intern, the pool can be released once the dataset is loaded.
+    """
+
+    def __init__(self):
+        self.strings = {}
+
+    def intern(self, value):
+        if type(value) is not str:
+            return value
+        return self.strings.setdefault(value, value)
+
+
+class KeptHeaders(dict):
+    """
+    Response headers reduced to KEPT_RESPONSE_HEADERS.
+    Headers from which other headers were dropped never compare equal to a plain dictionary, so a response that had
+    headers is still different from {} (as checked for bing when detecting the arrival to the landing page).
+    """
+
+    __slots__ = ["dropped"]
+
+    def __init__(self, headers, dropped):
+        super().__init__(headers)
+        self.dropped = dropped
+
+    def __eq__(self, other):
+        if isinstance(other, KeptHeaders):
+            return self.dropped == other.dropped and dict.__eq__(self, other)
+        return self.dropped == 0 and dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class CompactRequest(MutableMapping):
+    """
+    Request stored in __slots__ instead of a dictionary, with a dictionary view: request["url"], "is_tracker" in
+    request, request.get(...) and dict(request) behave as with the request dictionary, so the stages run unchanged.
+    Fields added by the stages that have no slot are kept in the extra dictionary, created when first needed.
+    """
+
+    __slots__ = REQUEST_SLOTS + ("extra",)
+
+    def __init__(self, fields=()):
+        self.extra = None
+        for key, value in dict(fields).items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in REQUEST_SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in REQUEST_SLOTS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in REQUEST_SLOTS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+
+    def __iter__(self):
+        for key in REQUEST_SLOTS:
+            if hasattr(self, key):
+                yield key
+
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for key in REQUEST_SLOTS if hasattr(self, key)) + (0 if self.extra is None else len(self.extra))
+
+    def __repr__(self):
+        return "CompactRequest(" + repr(dict(self)) + ")"
+
+    def copy(self):
+        return CompactRequest(self)
+
+
+def compact_request(request, pool):
+    """
+    Returns:
+        CompactRequest: request without the fields of DROPPED_REQUEST_FIELDS nor the headers not in KEPT_RESPONSE_HEADERS,
+        its strings interned in pool
+    """
+
+    compact = CompactRequest()
+
+    for key, value in request.items():
+        if key in DROPPED_REQUEST_FIELDS:
+            continue
+
+        if key == "responseHeaders" and isinstance(value, dict):
+            kept_headers = {pool.intern(name): pool.intern(value[name]) for name in KEPT_RESPONSE_HEADERS if name in value}
+            value = KeptHeaders(kept_headers, len(value) - len(kept_headers))
+
+        elif key == "redirectChain" and isinstance(value, list):
+            value = [{pool.intern(hop_key): pool.intern(hop_value) for hop_key, hop_value in hop.items()} if isinstance(hop, dict) else hop for hop in value]
+
+        else:
+            value = pool.intern(value)
+
+        compact[pool.intern(key)] = value
+
+    return compact
+
+
+def compact_search(search, pool=None):
+    """
+    Returns search with its requests turned into CompactRequest objects, interning their strings in pool.
+    The phase fields (requests_before_clicking, requests_by_first_parties...) are made to list the compact requests of
+    search["requests"] themselves instead of copies, as when they are read from a dataset written with request references.
+    """
+
+    if pool is None:
+        pool = StringPool()
+
+    if "requests" not in search:
+        return search
+
+    referenced_search = to_request_references(search)
+    referenced_search["requests"] = [compact_request(request, pool) for request in search["requests"]]
+
+    return resolve_request_references(referenced_search)
+
+
+def iter_compact_crawling_results(path=RESULTS_FILE_PATH, backend=None, pool=None):
+    """
+    Same as iter_crawling_results, with compact requests
+
+    Yields:
+        tuple: (search engine name, index of the search for this search engine, search)
+    """
+
+    if pool is None:
+        pool = StringPool()
+
+    for se, idx, search in iter_crawling_results(path, backend):
+        yield se, idx, compact_search(search, pool)
+
+
+def read_compact_crawling_results(path=RESULTS_FILE_PATH, backend=None):
+    """
+    Same as read_crawling_results, with compact requests: requests are CompactRequest objects, keep only the fields
+    and headers the stages read, and share their repeated strings.
+
+    Returns:
+        list: A list containing the crawling results for each search engine.
+    """
+
+    if not os.path.exists(path):
+        return []
+
+    ALL_SE_RESULTS = [[] for se in ALL_SE_NAMES]
+    for se, idx, search in iter_compact_crawling_results(path, backend):
+        ALL_SE_RESULTS[ALL_SE_NAMES.index(se)].append(search)
+
+    return ALL_SE_RESULTS
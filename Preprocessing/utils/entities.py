@@ -0,0 +1,135 @@
+import hashlib, json, os, pickle
+
+ENTITY_LIST_PATH = "../Analysis/data_sources/disconnect-entitylist.json"
+
+# Bump when EntityIndex changes, so that old snapshots are rebuilt
+ENTITY_SNAPSHOT_VERSION = 1
+
+
+def get_entity_snapshot_path(entity_list_path):
+    return os.path.splitext(entity_list_path)[0] + ".snapshot"
+
+
+def get_entity_list_hash(entity_list_path):
+    sha = hashlib.sha256()
+    with open(entity_list_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class EntityIndex:
+    """
+    Index of the Disconnect entity list: hostname -> owning entity.
+
+    Every property and resource of an entity is a key of a single hash table. A hostname is attributed by looking up
+    the hostname, then each of its parent domains (a.b.example.com, b.example.com, example.com, com), so each lookup
+    costs one dictionary access per label. When a domain is listed by several entities, the first one listed wins.
+    Unknown hostnames are attributed to "", as in the notebook.
+    """
+
+    def __init__(self, entity_list):
+        self.entities = list(entity_list["entities"])
+        self.suffixes = {}
+
+        for field in ["properties", "resources"]:
+            for entity_id, entity in enumerate(entity_list["entities"].values()):
+                for domain in entity.get(field, []):
+                    self.suffixes.setdefault(domain.lower(), entity_id)
+
+        self.memo = {}
+
+    def __getstate__(self):
+        return {"entities": self.entities, "suffixes": self.suffixes}
+
+    def __setstate__(self, state):
+        self.entities = state["entities"]
+        self.suffixes = state["suffixes"]
+        self.memo = {}
+
+    def entity(self, hostname):
+        """
+        Returns:
+            str: the entity owning hostname (a hostname, domain or ETLD + 1, with or without port), "" if unknown
+        """
+
+        entity = self.memo.get(hostname)
+        if entity is not None:
+            return entity
+
+        host = hostname.split(":")[0].rstrip(".").lower()
+        entity = ""
+        while host != "":
+            entity_id = self.suffixes.get(host)
+            if entity_id is not None:
+                entity = self.entities[entity_id]
+                break
+            host = host.partition(".")[2]
+
+        self.memo[hostname] = entity
+        return entity
+
+    def entity_of(self, domains):
+        """
+        Attributes each domain of domains to its entity in one pass, each distinct domain being looked up once.
+
+        Args:
+            domains: a list (or any iterable) of hostnames, a numpy array or a pandas Series
+
+        Returns:
+            the entities, in the order of domains: a Series with the same index for a Series, a list otherwise
+        """
+
+        if hasattr(domains, "map") and hasattr(domains, "index"):
+            return domains.map({domain: self.entity(domain) for domain in domains.unique()})
+
+        return [self.entity(domain) for domain in domains]
+
+
+def build_entity_snapshot(entity_list_path=ENTITY_LIST_PATH, list_hash=None):
+    """
+    Compiles the entity list into an EntityIndex and saves it as a snapshot next to the list.
+
+    Returns:
+        EntityIndex: the index
+    """
+
+    if list_hash is None:
+        list_hash = get_entity_list_hash(entity_list_path)
+
+    with open(entity_list_path) as f:
+        index = EntityIndex(json.load(f))
+
+    snapshot_path = get_entity_snapshot_path(entity_list_path)
+    with open(snapshot_path + ".tmp", "wb") as f:
+        pickle.dump({"version": ENTITY_SNAPSHOT_VERSION, "list_hash": list_hash, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+    return index
+
+
+def load_entity_index(entity_list_path=ENTITY_LIST_PATH):
+    """
+    Loads the compiled entity list from its snapshot.
+    The snapshot is (re)built when it is missing, was built by another version, or does not match the content of the list.
+
+    Returns:
+        EntityIndex: the index
+    """
+
+    list_hash = get_entity_list_hash(entity_list_path)
+    snapshot_path = get_entity_snapshot_path(entity_list_path)
+
+    if os.path.exists(snapshot_path):
+        try:
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+
+            if snapshot["version"] == ENTITY_SNAPSHOT_VERSION and snapshot["list_hash"] == list_hash:
+                return snapshot["index"]
+
+        except (pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+            pass
+
+    return build_entity_snapshot(entity_list_path, list_hash)
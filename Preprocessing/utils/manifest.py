@@ -0,0 +1,92 @@
+import hashlib, json, os
+
+MANIFEST_PATH = "../Data/manifest.json"
+
+CRAWLING_FILES_DIR = "../Crawling_system/files"
+
+# Bump when the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+
+def get_search_hash(search):
+    """
+    Content hash of a search as written by the crawler
+    """
+
+    return hashlib.sha256(json.dumps(search, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def get_source_stat(path):
+    """
+    Returns:
+        dict: size and modification time of a crawler file, None if it does not exist
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Manifest:
+    """
+    Record of the searches already processed into the dataset, valid for the output whose size and modification
+    time are recorded in output.
+    For each search engine, it holds the size and modification time of its crawler file, the configuration the
+    searches were processed with (the stages and anything their results depend on), and for each search the content
+    hash of the crawled search and the stages applied to it.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.search_engines = {}
+        self.output = None
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.search_engines = manifest["search_engines"]
+                self.output = manifest["output"]
+
+    def get_search_engine(self, se):
+        return self.search_engines.get(se, {"source": None, "configuration": None, "searches": []})
+
+    def is_source_unchanged(self, se, source_stat, configuration):
+        """
+        Returns True if the crawler file of se and the configuration are the same as when se was last processed
+        """
+
+        entry = self.get_search_engine(se)
+        return source_stat is not None and entry["source"] == source_stat and entry["configuration"] == configuration
+
+    def is_search_processed(self, se, idx, search_hash, stage_names, configuration):
+        """
+        Returns True if the search at position idx of se was processed with stage_names from the same crawled search,
+        and se was processed with the same configuration (e.g. the same tracker lists and token index)
+        """
+
+        entry = self.get_search_engine(se)
+        searches = entry["searches"]
+        return entry["configuration"] == configuration and idx < len(searches) and searches[idx]["hash"] == search_hash and \
+            searches[idx]["stages"] == stage_names
+
+    def set_search_engine(self, se, source_stat, configuration, searches):
+        """
+        Records that se was processed: searches is the list of {"hash": ..., "stages": [...]} of its searches
+        """
+
+        self.search_engines[se] = {"source": source_stat, "configuration": configuration, "searches": searches}
+
+    def remove_search_engine(self, se):
+        self.search_engines.pop(se, None)
+
+    def save(self):
+        if os.path.dirname(self.path) != "":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "output": self.output, "search_engines": self.search_engines}, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,241 @@
+import cProfile, json, os, time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not reported
+    resource = None
+
+# Bump when the layout of the run report changes
+RUN_REPORT_VERSION = 1
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+def get_peak_rss_mb():
+    """
+    Returns:
+        float: the peak resident set size of the process so far, in MB, None if it cannot be measured
+    """
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_rates(seconds, searches, requests):
+    return {
+        "searches_per_second": searches / seconds if seconds > 0 else None,
+        "requests_per_second": requests / seconds if seconds > 0 else None,
+    }
+
+
+def get_cache_stats(hits, misses, **extra):
+    """
+    Returns:
+        dict: hits, misses and hit rate of a cache, with the extra fields given
+    """
+
+    stats = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses > 0 else None}
+    stats.update(extra)
+    return stats
+
+
+def get_lru_cache_stats(cache_info):
+    """
+    Returns:
+        dict: the statistics of a functools.lru_cache, from its cache_info()
+    """
+
+    return get_cache_stats(cache_info.hits, cache_info.misses, size=cache_info.currsize, max_size=cache_info.maxsize)
+
+
+class RunMetrics:
+    """
+    Metrics of a run of the preprocessing stages.
+
+    For each stage and each search engine, it records the time spent in the stage, the number of searches and
+    requests it processed, and the number of requests it dropped (e.g. requests without a valid interceptionId,
+    dropped by the job_id stage). For each search engine, it records the wall time of the run spent on its searches,
+    and the peak RSS of the process when its last search was processed.
+    Cache statistics are added with record_cache, and the whole report is written as JSON with write.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.start = time.perf_counter()
+        self.stages = defaultdict(lambda: defaultdict(lambda: {"seconds": 0.0, "searches": 0, "requests": 0, "dropped_requests": 0}))
+        self.search_engines = defaultdict(lambda: {"seconds": 0.0, "searches": 0, "requests": 0, "peak_rss_mb": None})
+        self.caches = {}
+        self.wall_seconds = None
+
+    # Recording
+
+    def instrument_stage(self, name, stage):
+        """
+        Returns:
+            function: stage, recording its time, the number of requests it received and the number it dropped
+        """
+
+        def instrumented_stage(search, se):
+            number_of_requests = len(search["requests"])
+
+            start = time.perf_counter()
+            result = stage(search, se)
+            elapsed = time.perf_counter() - start
+
+            stage_metrics = self.stages[name][se]
+            stage_metrics["seconds"] += elapsed
+            stage_metrics["searches"] += 1
+            stage_metrics["requests"] += number_of_requests
+            stage_metrics["dropped_requests"] += max(0, number_of_requests - len(search["requests"]))
+
+            return result
+
+        return instrumented_stage
+
+    def instrument_stages(self, stages):
+        """
+        Returns:
+            list: the (name, stage) of stages, each stage being instrumented
+        """
+
+        return [(name, self.instrument_stage(name, stage)) for name, stage in stages]
+
+    def track_searches(self, searches):
+        """
+        Yields back an iterable of (search engine name, index, search) unchanged, attributing to each search engine
+        the time spent producing its searches (reading and processing them) and consuming them (writing them)
+        """
+
+        previous = time.perf_counter()
+
+        for se, idx, search in searches:
+            now = time.perf_counter()
+
+            se_metrics = self.search_engines[se]
+            se_metrics["seconds"] += now - previous
+            se_metrics["searches"] += 1
+            se_metrics["requests"] += len(search["requests"])
+
+            yield se, idx, search
+
+            previous = time.perf_counter()
+            se_metrics["seconds"] += previous - now
+            se_metrics["peak_rss_mb"] = get_peak_rss_mb()
+
+    def record_cache(self, name, stats):
+        self.caches[name] = stats
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.start
+
+    # Report
+
+    def report(self):
+        """
+        Returns:
+            dict: the run report, with the totals of each stage and search engine and their throughput
+        """
+
+        if self.wall_seconds is None:
+            self.finish()
+
+        stages = {}
+        for name, by_se in self.stages.items():
+            total = {key: sum(se_metrics[key] for se_metrics in by_se.values()) for key in ["seconds", "searches", "requests", "dropped_requests"]}
+            total.update(get_rates(total["seconds"], total["searches"], total["requests"]))
+            total["search_engines"] = {se: dict(se_metrics, **get_rates(se_metrics["seconds"], se_metrics["searches"], se_metrics["requests"]))
+                                       for se, se_metrics in by_se.items()}
+            stages[name] = total
+
+        search_engines = {se: dict(se_metrics, **get_rates(se_metrics["seconds"], se_metrics["searches"], se_metrics["requests"]))
+                          for se, se_metrics in self.search_engines.items()}
+
+        return {
+            "version": RUN_REPORT_VERSION,
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "searches": sum(se_metrics["searches"] for se_metrics in self.search_engines.values()),
+            "requests": sum(se_metrics["requests"] for se_metrics in self.search_engines.values()),
+            "stages": stages,
+            "search_engines": search_engines,
+            "caches": self.caches,
+        }
+
+    def write(self, path):
+        report = self.report()
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        return report
+
+    def summary(self):
+        """
+        Returns:
+            str: a short human readable summary of the report
+        """
+
+        report = self.report()
+        lines = ["Run of {} searches and {} requests in {:.1f} s, peak RSS {} MB".format(
+            report["searches"], report["requests"], report["wall_seconds"],
+            "-" if report["peak_rss_mb"] is None else "{:.0f}".format(report["peak_rss_mb"]))]
+
+        for name, stage_metrics in report["stages"].items():
+            lines.append("  {:<26} {:>9.2f} s {:>10.0f} requests/s {:>8} dropped requests".format(
+                name, stage_metrics["seconds"], stage_metrics["requests_per_second"] or 0, stage_metrics["dropped_requests"]))
+
+        for name, stats in report["caches"].items():
+            lines.append("  {:<26} hit rate {}".format(name + " cache", "-" if stats["hit_rate"] is None else "{:.1%}".format(stats["hit_rate"])))
+
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile_run(path, profiler="cprofile"):
+    """
+    Profiles the code run in the context, and saves the profile to path:
+    cProfile statistics (readable with pstats or snakeviz), or a pyinstrument HTML report (requires pyinstrument).
+    Does nothing when path is None.
+    """
+
+    if path is None:
+        yield
+        return
+
+    if profiler not in PROFILERS:
+        raise ValueError("Unknown profiler: " + profiler + ", expected one of " + ", ".join(PROFILERS))
+
+    if os.path.dirname(path) != "":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if profiler == "pyinstrument":
+        # Imported here, so that pyinstrument is only needed to profile with it
+        from pyinstrument import Profiler
+        run_profiler = Profiler()
+        run_profiler.start()
+        try:
+            yield
+        finally:
+            run_profiler.stop()
+            with open(path, "w") as f:
+                f.write(run_profiler.output_html())
+
+    else:
+        run_profiler = cProfile.Profile()
+        run_profiler.enable()
+        try:
+            yield
+        finally:
+            run_profiler.disable()
+            run_profiler.dump_stats(path)
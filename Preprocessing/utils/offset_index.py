@@ -0,0 +1,233 @@
+import json, os, shutil
+from utils.request_refs import LazySearch, REFERENCES_FIELD
+
+# The offset index of a dataset is stored next to it, in path + OFFSET_INDEX_SUFFIX
+OFFSET_INDEX_SUFFIX = ".offsets"
+
+# Bump when the layout of the offset index changes
+OFFSET_INDEX_VERSION = 1
+
+
+def get_offset_index_path(path):
+    return path + OFFSET_INDEX_SUFFIX
+
+
+def get_data_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class DatasetChangedError(Exception):
+    pass
+
+
+class LazyField:
+    """
+    Value of a field of a search that was not loaded: its JSON text is at [start, end) in the dataset file.
+    The dataset must not have changed since the search was read.
+    """
+
+    __slots__ = ["path", "start", "end", "data_stat"]
+
+    def __init__(self, path, start, end, data_stat):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.data_stat = data_stat
+
+    def read_text(self):
+        if get_data_stat(self.path) != self.data_stat:
+            raise DatasetChangedError(self.path + " changed since it was read, fields that were not loaded cannot be read anymore")
+
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            return f.read(self.end - self.start).decode()
+
+    def load(self):
+        return json.loads(self.read_text())
+
+    def __repr__(self):
+        return "LazyField(" + self.path + ", " + str(self.start) + ", " + str(self.end) + ")"
+
+
+class ProjectedSearch(LazySearch):
+    """
+    Search read with a field projection: the fields that were not selected hold a LazyField, and are loaded from the
+    dataset file the first time they are accessed. Writing the search back copies their JSON text as it is.
+    Fields written as request references are resolved on access as in LazySearch.
+    """
+
+    def _load(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyField):
+            value = value.load()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def load_all(self):
+        for key in list(dict.keys(self)):
+            self._load(key)
+        return self
+
+    def _resolve(self, field):
+        self._load("requests")
+        self._load(field)
+        return super()._resolve(field)
+
+    def __getitem__(self, key):
+        self._load(key)
+        return super().__getitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._load(key)
+        return super().pop(key, *default)
+
+    def copy(self):
+        self.load_all()
+        return super().copy()
+
+    def __eq__(self, other):
+        self.load_all()
+        if isinstance(other, ProjectedSearch):
+            other.load_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+def write_search(f, search, offset, json_default=None):
+    """
+    Writes search to the text file f, as json.dump(search, f) would, starting at byte offset.
+    The fields are read with dict.items, so that referenced fields and fields not loaded are written as they are stored.
+
+    Returns:
+        tuple: (offset after the search, list of [field, start offset of its value, end offset of its value])
+    """
+
+    field_offsets = []
+    f.write("{")
+    offset += 1
+
+    for index, (key, value) in enumerate(dict.items(search)):
+        if index > 0:
+            f.write(", ")
+            offset += 2
+
+        key_text = json.dumps(key) + ": "
+        value_text = value.read_text() if isinstance(value, LazyField) else json.dumps(value, default=json_default)
+
+        f.write(key_text)
+        f.write(value_text)
+        offset += len(key_text)
+        field_offsets.append([key, offset, offset + len(value_text)])
+        offset += len(value_text)
+
+    f.write("}")
+    return offset + 1, field_offsets
+
+
+class OffsetIndexWriter:
+    """
+    Writes the offset index of a dataset while the dataset is written: for each search, its search engine, index,
+    start and end offsets, and the start and end offsets of the value of each of its fields.
+    The searches are first written to a temporary file, then finish writes the index with the size and modification
+    time of the dataset, so that an index is never used with another version of the dataset.
+    """
+
+    def __init__(self, path):
+        self.path = get_offset_index_path(path)
+        self.searches_file = open(self.path + ".searches.tmp", "w")
+
+    def add(self, se_index, idx, start, end, field_offsets):
+        self.searches_file.write(json.dumps([se_index, idx, start, end, field_offsets]) + "\n")
+
+    def finish(self, data_path, number_of_search_engines):
+        """
+        Writes the index of the dataset data_path, which must not be modified anymore
+        """
+
+        self.searches_file.close()
+
+        with open(self.path + ".tmp", "w") as f:
+            f.write(json.dumps({"version": OFFSET_INDEX_VERSION, "data": get_data_stat(data_path), "number_of_search_engines": number_of_search_engines}) + "\n")
+            with open(self.path + ".searches.tmp") as searches_file:
+                shutil.copyfileobj(searches_file, f)
+
+        os.remove(self.path + ".searches.tmp")
+
+    def commit(self):
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self):
+        self.searches_file.close()
+        for path in [self.path + ".searches.tmp", self.path + ".tmp"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def remove_offset_index(path):
+    if os.path.exists(get_offset_index_path(path)):
+        os.remove(get_offset_index_path(path))
+
+
+def read_offset_index_header(path):
+    """
+    Returns:
+        dict: the header of the offset index of the dataset at path, None if there is no index or if it does not
+        match the dataset
+    """
+
+    index_path = get_offset_index_path(path)
+    if not os.path.exists(index_path) or not os.path.exists(path):
+        return None
+
+    with open(index_path) as f:
+        header = json.loads(f.readline())
+
+    if header.get("version") != OFFSET_INDEX_VERSION or header.get("data") != get_data_stat(path):
+        return None
+
+    return header
+
+
+def iter_projected_searches(path, fields, header):
+    """
+    Streams the searches of the dataset at path, loading only the given fields (and the list of referenced fields);
+    the other fields are loaded on access.
+
+    Yields:
+        (index of the search engine, None, None) when the list of a search engine starts, then
+        (index of the search engine, index of the search, ProjectedSearch) for each of its searches
+    """
+
+    fields = set(fields) | {REFERENCES_FIELD}
+    data_stat = header["data"]
+    current_index = -1
+
+    with open(get_offset_index_path(path)) as index_file, open(path, "rb") as f:
+        index_file.readline()
+
+        for line in index_file:
+            se_index, idx, start, end, field_offsets = json.loads(line)
+
+            while current_index < se_index:
+                current_index += 1
+                yield current_index, None, None
+
+            search = {}
+            for key, value_start, value_end in field_offsets:
+                if key in fields:
+                    f.seek(value_start)
+                    search[key] = json.loads(f.read(value_end - value_start))
+                else:
+                    search[key] = LazyField(path, value_start, value_end, data_stat)
+
+            yield se_index, idx, ProjectedSearch(search)
+
+    while current_index < header["number_of_search_engines"] - 1:
+        current_index += 1
+        yield current_index, None, None
@@ -0,0 +1,84 @@
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+from utils.urls import get_domain_resolver
+
+# Maximum number of parsed URLs kept in memory
+MAX_PARSED_URLS = 262144
+
+
+def decode_url(url):
+    """
+    Decodes the percent-encoded characters of URLs that separate their components
+    """
+
+    return url.replace("%3A", ":").replace("%2F", "/").replace("%3F", "?").replace("%26", "&").replace("%3D", "=")
+
+
+class ParsedUrl:
+    """
+    Components of a URL, each computed the first time it is needed:
+    decoded_url, netloc, path, query, query_params, domain and etld (ETLD + 1).
+
+    Records are shared through parse_url, so they must not be modified. query_params returns a new dictionary at each access.
+    """
+
+    __slots__ = ["url", "_decoded_url", "_parsed", "_query_params", "_resolved"]
+
+    def __init__(self, url):
+        self.url = url
+        self._decoded_url = None
+        self._parsed = None
+        self._query_params = None
+        self._resolved = None
+
+    @property
+    def decoded_url(self):
+        if self._decoded_url is None:
+            self._decoded_url = decode_url(self.url)
+        return self._decoded_url
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = urlparse(self.url)
+        return self._parsed
+
+    @property
+    def netloc(self):
+        return self.parsed.netloc
+
+    @property
+    def path(self):
+        return self.parsed.path
+
+    @property
+    def query(self):
+        return self.parsed.query
+
+    @property
+    def query_params(self):
+        if self._query_params is None:
+            self._query_params = parse_qs(self.parsed.query)
+        return {key: list(values) for key, values in self._query_params.items()}
+
+    @property
+    def domain(self):
+        return self._resolve()[0]
+
+    @property
+    def etld(self):
+        return self._resolve()[1]
+
+    def _resolve(self):
+        if self._resolved is None:
+            self._resolved = get_domain_resolver().resolve_url(self.url)
+        return self._resolved
+
+
+@lru_cache(maxsize=MAX_PARSED_URLS)
+def parse_url(url):
+    """
+    Returns the shared ParsedUrl record of url
+    """
+
+    return ParsedUrl(url)
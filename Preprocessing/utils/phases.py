@@ -0,0 +1,104 @@
+from utils.parsed_urls import parse_url
+
+# Upper bound of the timestamps of requests sent after clicking on an ad
+END_OF_TIME = 9999999999999
+
+
+def split_requests_by_time(requests, windows):
+    """
+    Splits requests into time windows, each window being a (start, end) interval including start and excluding end,
+    in one scan of the requests. The requests of a window keep their order.
+
+    Returns:
+        list: the list of requests of each window, in the order of windows
+    """
+
+    requests_by_window = [[] for window in windows]
+    for request in requests:
+        timestamp = request["timestamp"]
+        for window_requests, (start, end) in zip(requests_by_window, windows):
+            if start <= timestamp < end:
+                window_requests.append(request)
+
+    return requests_by_window
+
+
+def partition_search_requests(search, se, before_clicking=True, after_clicking=True):
+    """
+    Splits the requests of a search into the requests sent before clicking on the ad, after clicking on it, and
+    after reaching its destination, and fills the domains_*, tracker_requests_* and tracker_domains_* lists of each
+    phase while scanning its requests once.
+
+    The first request sent to the domain of the landing URL separates requests after clicking from requests after
+    reaching destination. The after clicking phases are only filled for searches where an ad was clicked.
+    """
+
+    windows = []
+    if before_clicking:
+        windows.append((0, search["clicking_time"]))
+
+    if after_clicking and search["clicked_url"] != "" and len(search["ads"]) > 0:
+        windows.append((search["clicking_time"], END_OF_TIME))
+    else:
+        after_clicking = False
+
+    requests_by_window = split_requests_by_time(search["requests"], windows)
+
+    if before_clicking:
+        _fill_before_clicking(search, requests_by_window[0])
+
+    if after_clicking:
+        _fill_after_clicking(search, se, requests_by_window[-1])
+
+    return search
+
+
+def _fill_before_clicking(search, requests):
+
+    domains = []
+    tracker_requests = []
+    tracker_domains = []
+
+    for request in requests:
+        domain = parse_url(request["url"]).netloc
+        domains.append(domain)
+
+        if request["is_tracker"] is True:
+            tracker_requests.append(request)
+            tracker_domains.append(domain)
+
+    search["requests_before_clicking"] = requests
+    search["domains_before_clicking"] = domains
+    search["tracker_requests_before_clicking"] = tracker_requests
+    search["tracker_domains_before_clicking"] = tracker_domains
+
+
+def _fill_after_clicking(search, se, requests):
+
+    if ">" in search["ads"][0]["landing_url"]:
+        search["ads"][0]["landing_url"] = search["ads"][0]["landing_url"].split(">")[0].replace(" ", "")
+
+    clicked_url_domain = parse_url(search["ads"][0]["landing_url"]).domain
+
+    # Requests, domains, tracker requests and tracker domains, after clicking then after reaching destination
+    phases = [([], [], [], []), ([], [], [], [])]
+    found = False
+
+    for request in requests:
+        # The domain detects the arrival to the landing URL, because it is extracted the same way as the clicked URL's.
+        # The ETLD + 1 is kept for later analysis
+        parsed_url = parse_url(request["url"])
+
+        if parsed_url.domain == clicked_url_domain and (se != "bing" or request["responseHeaders"] != {}):
+            found = True
+
+        phase_requests, phase_domains, phase_tracker_requests, phase_tracker_domains = phases[found]
+        phase_requests.append(request)
+        phase_domains.append(parsed_url.etld)
+
+        if request["is_tracker"] is True:
+            phase_tracker_requests.append(request)
+            phase_tracker_domains.append(parsed_url.netloc)
+
+    for phase, fields in zip(["after_clicking", "after_reaching_destination"], phases):
+        search["requests_" + phase], search["domains_" + phase], search["tracker_requests_" + phase], search["tracker_domains_" + phase] = fields
@@ -1,26 +1,387 @@
 import json, os
+from collections.abc import Mapping
+from utils.request_refs import to_request_references, resolve_request_references
+from utils.offset_index import OffsetIndexWriter, LazyField, write_search, remove_offset_index, read_offset_index_header, iter_projected_searches
 
 ALL_SE_NAMES = ["bing", "google", "ddg", "startpage", "qwant"]
 
 
 RESULTS_FILE_PATH = "../Data/all_se_results.json"
 
-def write_crawling_results(ALL_SE_RESULTS):
-    with open(RESULTS_FILE_PATH, 'w') as f:
-        json.dump(ALL_SE_RESULTS, f)
-        
+# Datasets stored at paths with these extensions use the SQLite backend (see utils/sqlite_store.py)
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
 
-def read_crawling_results():
+# Size of the chunks read from the dataset file when streaming it
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACES = " \t\n\r"
+
+
+def json_default(value):
+    """
+    Serializes the dictionary views that json does not know, such as the requests of utils/compact_model.py
+    """
+
+    if isinstance(value, Mapping):
+        return dict(value)
+
+    if isinstance(value, LazyField):
+        return value.load()
+
+    raise TypeError("Object of type " + type(value).__name__ + " is not JSON serializable")
+
+
+def get_backend(path, backend=None):
+    """
+    Returns the storage backend of a dataset: backend if given, else "sqlite" for paths with a SQLITE_EXTENSIONS extension, else "json"
+    """
+
+    if backend is not None:
+        if backend not in ["json", "sqlite"]:
+            raise ValueError("Unknown backend: " + backend)
+        return backend
+
+    return "sqlite" if path.endswith(SQLITE_EXTENSIONS) else "json"
+
+
+def write_crawling_results(ALL_SE_RESULTS, path=RESULTS_FILE_PATH, request_references=False, backend=None):
+    """
+    Write crawling results, one search at a time.
+    The output is identical to json.dump(ALL_SE_RESULTS) but no full serialized copy of the dataset is kept in memory.
+    With request_references, the phase fields are written as positions in search["requests"] (see utils/request_refs.py).
+    With the sqlite backend, the dataset is written in a SQLite database instead (see utils/sqlite_store.py).
+    """
+
+    write_crawling_results_stream(
+        ((ALL_SE_NAMES[index], idx, search) for index, se_searches in enumerate(ALL_SE_RESULTS) for idx, search in enumerate(se_searches)),
+        path, number_of_search_engines=len(ALL_SE_RESULTS), request_references=request_references, backend=backend)
+
+
+def read_crawling_results(path=RESULTS_FILE_PATH, backend=None, fields=None):
     """
     Read crawling results
+    Phase fields written as request references are resolved lazily, when they are accessed.
+    With fields, a list of field names, only these fields are parsed when the dataset has an offset index; the other
+    fields (e.g. raw_body or results) are loaded from the file when they are accessed.
     Returns:
         list: A list containing the crawling results for each search engine.
     """
 
-    if os.path.exists(RESULTS_FILE_PATH):
-        f = open(RESULTS_FILE_PATH)
-        return json.load(f)
+    if get_backend(path, backend) == "sqlite":
+        from utils.sqlite_store import read_sqlite_crawling_results
+        return read_sqlite_crawling_results(path)
+
+    if not os.path.exists(path):
+        return []
+
+    ALL_SE_RESULTS = []
+    for index, idx, search in _iter_dataset(path, fields):
+        if idx is None:
+            ALL_SE_RESULTS.append([])
+        else:
+            ALL_SE_RESULTS[index].append(resolve_request_references(search))
+
+    return ALL_SE_RESULTS
+
+
+def iter_crawling_results(path=RESULTS_FILE_PATH, backend=None, fields=None):
+    """
+    Stream the crawling results without loading the whole dataset in memory.
+    With fields, only these fields are parsed when possible, as in read_crawling_results.
+
+    Yields:
+        tuple: (search engine name, index of the search for this search engine, search)
+    """
+
+    if get_backend(path, backend) == "sqlite":
+        from utils.sqlite_store import SqliteDatasetStore
+        if os.path.exists(path):
+            with SqliteDatasetStore(path) as store:
+                yield from store.iter_searches()
+        return
+
+    for index, idx, search in _iter_dataset(path, fields):
+        if idx is not None:
+            yield ALL_SE_NAMES[index], idx, resolve_request_references(search)
+
+
+def _iter_dataset(path, fields=None):
+    """
+    Same as _iter_json_lists, parsing only the given fields of each search when the dataset has a valid offset index
+    """
+
+    if fields is not None:
+        header = read_offset_index_header(path)
+        if header is not None:
+            return iter_projected_searches(path, fields, header)
+
+    return _iter_json_lists(path)
+
+
+def iter_json_list(path):
+    """
+    Stream the elements of a file holding a single JSON list, like the crawler files of Crawling_system/files/
+    """
+
+    if not os.path.exists(path):
+        return
+
+    with open(path) as f:
+        reader = _StreamReader(f)
+
+        reader.expect("[")
+        if reader.consume("]"):
+            return
+
+        while True:
+            yield reader.decode_value()
+            if reader.consume("]"):
+                return
+            reader.expect(",")
+
+
+def _iter_json_lists(path):
+    """
+    Stream the list of lists stored in the dataset file.
+    Yields (index, None, None) when the list of a search engine starts, then (index, idx, search) for each of its searches.
+    """
+
+    if not os.path.exists(path):
+        return
+
+    with open(path) as f:
+        reader = _StreamReader(f)
+
+        reader.expect("[")
+        index = 0
+        if reader.consume("]"):
+            return
+
+        while True:
+            reader.expect("[")
+            yield index, None, None
+            idx = 0
+            if not reader.consume("]"):
+                while True:
+                    yield index, idx, reader.decode_value()
+                    idx += 1
+                    if reader.consume("]"):
+                        break
+                    reader.expect(",")
+
+            index += 1
+            if reader.consume("]"):
+                return
+            reader.expect(",")
+
+
+def write_crawling_results_stream(searches, path=RESULTS_FILE_PATH, number_of_search_engines=None, request_references=False, backend=None, offset_index=True):
+    """
+    Write the dataset from an iterable of (search engine name, index, search), grouped by search engine.
+    The output keeps the list layout of read_crawling_results: one list per search engine, in the ALL_SE_NAMES order.
+    Search engines without searches are written as empty lists so that positions in the file never shift.
+
+    The file is written next to the destination and then moved, so it is safe to stream from and to the same path.
+    With request_references, the phase fields are written as positions in search["requests"].
+    With offset_index, the byte offsets of each search and of each of its fields are written next to the dataset
+    (see utils/offset_index.py), so that it can be read with a field projection.
+    With the sqlite backend, the searches are written in a SQLite database instead, replacing its content.
+    """
+
+    if get_backend(path, backend) == "sqlite":
+        from utils.sqlite_store import write_sqlite_crawling_results
+        write_sqlite_crawling_results(searches, path, number_of_search_engines)
+        return
+
+    if number_of_search_engines is None:
+        number_of_search_engines = len(ALL_SE_NAMES)
+
+    index_writer = OffsetIndexWriter(path) if offset_index else None
+
+    # The output is ASCII (json escapes the other characters), so the number of characters written is the byte offset
+    def write(text):
+        nonlocal offset
+        f.write(text)
+        offset += len(text)
+
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            offset = 0
+            write("[")
+            current_index = -1
+            first_in_list = True
+
+            for se, idx, search in searches:
+                index = ALL_SE_NAMES.index(se)
+                if index < current_index:
+                    raise ValueError("searches must be grouped by search engine, in the ALL_SE_NAMES order")
+
+                while current_index < index:
+                    if current_index >= 0:
+                        write("], ")
+                    write("[")
+                    current_index += 1
+                    first_in_list = True
+
+                if not first_in_list:
+                    write(", ")
+
+                start = offset
+                offset, field_offsets = write_search(f, to_request_references(search) if request_references else search, offset, json_default)
+                if index_writer is not None:
+                    index_writer.add(index, idx, start, offset, field_offsets)
+                first_in_list = False
+
+            while current_index < number_of_search_engines - 1:
+                if current_index >= 0:
+                    write("], ")
+                write("[")
+                current_index += 1
+
+            if current_index >= 0:
+                write("]")
+            write("]")
+
+        if index_writer is not None:
+            index_writer.finish(tmp_path, number_of_search_engines)
+
+    except BaseException:
+        if index_writer is not None:
+            index_writer.abort()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # The index of the previous dataset is removed first, in case the new index is not moved
+    remove_offset_index(path)
+    os.replace(tmp_path, path)
+    if index_writer is not None:
+        index_writer.commit()
+
+
+class CrawlingResultsShardWriter:
+    """
+    Incremental writer of crawling results, sharded as one JSON Lines file per search engine.
+    Each line holds {"search_engine": ..., "index": ..., "search": ...}, so records can be appended as they are processed
+    and read back with iter_crawling_results_shards.
+    With request_references, the phase fields are written as positions in search["requests"].
+    """
+
+    def __init__(self, directory, append=True, request_references=False):
+        self.directory = directory
+        self.request_references = request_references
+        self.mode = "a" if append else "w"
+        self.files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def get_shard_path(self, se):
+        return os.path.join(self.directory, se + ".jsonl")
+
+    def append(self, se, idx, search):
+        if se not in self.files:
+            self.files[se] = open(self.get_shard_path(se), self.mode)
+
+        if self.request_references:
+            search = to_request_references(search)
+
+        self.files[se].write(json.dumps({"search_engine": se, "index": idx, "search": search}, default=json_default) + "\n")
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def iter_crawling_results_shards(directory, search_engines=ALL_SE_NAMES):
+    """
+    Stream the records written by CrawlingResultsShardWriter, search engine by search engine.
+
+    Yields:
+        tuple: (search engine name, index of the search for this search engine, search)
+    """
+
+    for se in search_engines:
+        shard_path = os.path.join(directory, se + ".jsonl")
+        if not os.path.exists(shard_path):
+            continue
+
+        with open(shard_path) as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                record = json.loads(line)
+                yield record["search_engine"], record["index"], resolve_request_references(record["search"])
+
+
+class _StreamReader:
+    """
+    Minimal incremental reader over a JSON text file, decoding one value at a time.
+    """
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size):
+        chunk = self.f.read(size)
+        if chunk == "":
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _skip_whitespaces(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACES:
+                self.pos += 1
+
+            if self.pos < len(self.buffer) or not self._read_more(self.chunk_size):
+                return
+
+    def consume(self, char):
+        self._skip_whitespaces()
+        if self.buffer.startswith(char, self.pos):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError("Malformed crawling results: expected '%s' at %s" % (char, self.buffer[self.pos:self.pos + 20]))
+
+    def decode_value(self):
+        self._skip_whitespaces()
+        size = self.chunk_size
 
-    return[]
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buffer, self.pos)
+                # A number may be cut at the end of the buffer, make sure it is complete
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
 
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
 
+            # The value is not complete yet, read bigger chunks until it is
+            self._read_more(size)
+            size *= 2
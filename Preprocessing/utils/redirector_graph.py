@@ -0,0 +1,214 @@
+import json, os
+from collections import Counter, defaultdict
+
+REDIRECTOR_GRAPH_PATH = "../Data/redirector_graph.json"
+
+# Bump when the layout of the graph file changes
+REDIRECTOR_GRAPH_VERSION = 1
+
+
+class RedirectorGraph:
+    """
+    Index of the navigation paths and redirectors of the dataset, built from the path and redirectors fields.
+
+    Domains are interned as integer node ids. For each search engine, it keeps:
+    - edges: the weighted edges (domain, next domain in a navigation path) -> number of paths
+    - paths: the path frequency table, path as a tuple of node ids (ending with "destination") -> number of searches
+    - positions: for each position k, the number of searches whose k-th redirector is each domain
+    - searches: the path and redirectors of each indexed search, so that a search can be replaced when it changes
+
+    Searches are added one at a time, so the graph can be updated as crawls are added.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.node_ids = {}
+        self.edges = defaultdict(Counter)
+        self.paths = defaultdict(Counter)
+        self.positions = defaultdict(lambda: defaultdict(Counter))
+        self.searches = defaultdict(dict)
+        self.paths_by_node = defaultdict(lambda: defaultdict(set))
+
+    def intern(self, domain):
+        node_id = self.node_ids.get(domain)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.nodes.append(domain)
+            self.node_ids[domain] = node_id
+
+        return node_id
+
+    # Updating
+
+    def add_search(self, se, idx, search):
+        """
+        Indexes the navigation path and redirectors of a search, replacing what was indexed for the same search before
+        """
+
+        entry = None
+        if search.get("path", "") != "":
+            entry = (tuple(self.intern(domain) for domain in search["path"].split(" - ")),
+                     tuple(self.intern(domain) for domain in search.get("redirectors", [])))
+
+        previous_entry = self.searches[se].get(idx)
+        if previous_entry == entry:
+            return
+
+        if previous_entry is not None:
+            self._count(se, previous_entry, -1)
+            del self.searches[se][idx]
+
+        if entry is not None:
+            self._count(se, entry, 1)
+            self.searches[se][idx] = entry
+
+    def add_searches(self, searches):
+        """
+        Adds an iterable of (search engine name, index, search), and yields them back unchanged
+        """
+
+        for se, idx, search in searches:
+            self.add_search(se, idx, search)
+            yield se, idx, search
+
+    def _count(self, se, entry, weight):
+        path, redirectors = entry
+
+        self.paths[se][path] += weight
+        if self.paths[se][path] <= 0:
+            del self.paths[se][path]
+            for node_id in set(path):
+                self.paths_by_node[se][node_id].discard(path)
+        else:
+            for node_id in path:
+                self.paths_by_node[se][node_id].add(path)
+
+        for edge in zip(path, path[1:]):
+            self.edges[se][edge] += weight
+            if self.edges[se][edge] <= 0:
+                del self.edges[se][edge]
+
+        for position, node_id in enumerate(redirectors):
+            self.positions[se][position][node_id] += weight
+            if self.positions[se][position][node_id] <= 0:
+                del self.positions[se][position][node_id]
+
+    # Queries
+
+    def _format_path(self, path):
+        return " - ".join(self.nodes[node_id] for node_id in path)
+
+    def number_of_paths(self, se):
+        return sum(self.paths[se].values())
+
+    def most_common_paths(self, se, n=None):
+        """
+        Returns:
+            list: (path, number of searches) of the n most common navigation paths of se, paths formatted as the path field.
+            Ties are sorted by path, all the paths are returned when n is None
+        """
+
+        paths = sorted(((self._format_path(path), count) for path, count in self.paths[se].items()), key=lambda item: (-item[1], item[0]))
+        return paths[:n]
+
+    def top_redirectors(self, se, n=None):
+        """
+        Returns:
+            list: (domain, number of searches) of the n redirectors bounced through in the most searches of se
+        """
+
+        counts = Counter()
+        for position_counts in self.positions[se].values():
+            counts.update(position_counts)
+
+        redirectors = sorted(((self.nodes[node_id], count) for node_id, count in counts.items()), key=lambda item: (-item[1], item[0]))
+        return redirectors[:n]
+
+    def redirectors_at_position(self, se, position):
+        """
+        Returns:
+            Counter: domain -> number of searches of se whose redirector at position (0 for the first one) is domain
+        """
+
+        return Counter({self.nodes[node_id]: count for node_id, count in self.positions[se][position].items()})
+
+    def paths_through(self, domain, se):
+        """
+        Returns:
+            dict: path -> number of searches, for the navigation paths of se going through domain
+        """
+
+        node_id = self.node_ids.get(domain)
+        if node_id is None:
+            return {}
+
+        return {self._format_path(path): self.paths[se][path] for path in self.paths_by_node[se][node_id]}
+
+    def weighted_edges(self, se):
+        """
+        Returns:
+            list: (domain, next domain, number of paths) of the edges of the navigation paths of se
+        """
+
+        return [(self.nodes[source], self.nodes[target], weight) for (source, target), weight in self.edges[se].items()]
+
+    # Persistence
+
+    def save(self, path=REDIRECTOR_GRAPH_PATH):
+        data = {
+            "version": REDIRECTOR_GRAPH_VERSION,
+            "nodes": self.nodes,
+            "search_engines": {se: {
+                "edges": [[source, target, weight] for (source, target), weight in self.edges[se].items()],
+                "paths": [list(path) + [count] for path, count in self.paths[se].items()],
+                "positions": [[position, node_id, count] for position, counts in self.positions[se].items() for node_id, count in counts.items()],
+                "searches": [[idx, list(path), list(redirectors)] for idx, (path, redirectors) in self.searches[se].items()],
+            } for se in self.searches},
+        }
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+
+def load_redirector_graph(path=REDIRECTOR_GRAPH_PATH):
+    """
+    Loads the graph saved at path, or returns an empty graph if there is none (or if it was saved by another version)
+
+    Returns:
+        RedirectorGraph: the graph
+    """
+
+    graph = RedirectorGraph()
+    if not os.path.exists(path):
+        return graph
+
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get("version") != REDIRECTOR_GRAPH_VERSION:
+        return graph
+
+    for domain in data["nodes"]:
+        graph.intern(domain)
+
+    for se, se_data in data["search_engines"].items():
+        for source, target, weight in se_data["edges"]:
+            graph.edges[se][(source, target)] = weight
+
+        for item in se_data["paths"]:
+            path = tuple(item[:-1])
+            graph.paths[se][path] = item[-1]
+            for node_id in path:
+                graph.paths_by_node[se][node_id].add(path)
+
+        for position, node_id, count in se_data["positions"]:
+            graph.positions[se][position][node_id] = count
+
+        for idx, path, redirectors in se_data["searches"]:
+            graph.searches[se][idx] = (tuple(path), tuple(redirectors))
+
+    return graph
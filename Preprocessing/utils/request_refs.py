@@ -0,0 +1,276 @@
+# Fields holding lists of requests of search["requests"]
+REQUEST_LIST_FIELDS = ["requests_before_clicking", "tracker_requests_before_clicking",
+                       "requests_after_clicking", "tracker_requests_after_clicking",
+                       "requests_after_reaching_destination", "tracker_requests_after_reaching_destination"]
+
+# Phase of the requests listed in each field
+PHASE_FIELDS = [("requests_before_clicking", "before_clicking"), ("requests_after_clicking", "after_clicking"),
+                ("requests_after_reaching_destination", "after_reaching_destination")]
+
+# Field holding a list of {first_party: list of requests of search["requests"]}
+FIRST_PARTIES_FIELD = "requests_by_first_parties"
+
+# Field listing the fields of a search stored as indices into search["requests"]
+REFERENCES_FIELD = "request_references"
+
+# Fields identifying a request of search["requests"], when a field holds a modified copy of it
+REQUEST_KEY_FIELDS = ["interceptionId", "requestId", "timestamp"]
+
+
+def to_request_references(search):
+    """
+    Returns a copy of search where the phase fields store the positions of their requests in search["requests"]
+    instead of copies of the requests. The search itself is left unchanged.
+
+    A field is only converted when each of its requests is found in search["requests"], by identity or else by value,
+    so converting never loses information. The converted fields are listed in search["request_references"].
+    """
+
+    if "requests" not in search:
+        return search
+
+    positions = {}
+    for position, request in enumerate(search["requests"]):
+        positions.setdefault(id(request), position)
+
+    # Positions by (url, timestamp), built only when a request has to be found by value
+    positions_by_signature = {}
+
+    def get_position(request):
+        position = positions.get(id(request))
+        if position is not None and search["requests"][position] is request:
+            return position
+
+        if len(positions_by_signature) == 0:
+            for position, item in enumerate(search["requests"]):
+                positions_by_signature.setdefault((item.get("url"), item.get("timestamp")), []).append(position)
+
+        candidates = positions_by_signature.get((request.get("url"), request.get("timestamp")), [])
+        return next((position for position in candidates if search["requests"][position] == request), None)
+
+    def to_positions(requests):
+        request_positions = [get_position(request) for request in requests]
+        return None if None in request_positions else request_positions
+
+    converted_search = dict(search)
+    converted_fields = list(search.get(REFERENCES_FIELD, []))
+
+    for field in REQUEST_LIST_FIELDS:
+        if field in search and field not in converted_fields:
+            request_positions = to_positions(search[field])
+            if request_positions is not None:
+                converted_search[field] = request_positions
+                converted_fields.append(field)
+
+    if FIRST_PARTIES_FIELD in search and FIRST_PARTIES_FIELD not in converted_fields:
+        first_parties = []
+        for item in search[FIRST_PARTIES_FIELD]:
+            first_party_positions = {first_party: to_positions(requests) for first_party, requests in item.items()}
+            first_parties.append(first_party_positions)
+
+        if all(None not in item.values() for item in first_parties):
+            converted_search[FIRST_PARTIES_FIELD] = first_parties
+            converted_fields.append(FIRST_PARTIES_FIELD)
+
+    if len(converted_fields) > 0:
+        converted_search[REFERENCES_FIELD] = [field for field in REQUEST_LIST_FIELDS + [FIRST_PARTIES_FIELD] if field in converted_fields]
+
+    return converted_search
+
+
+def get_request_phases(referenced_search):
+    """
+    Returns the phase of each request of search["requests"] (None for requests of no phase),
+    given the search returned by to_request_references(search)
+    """
+
+    referenced_fields = referenced_search.get(REFERENCES_FIELD, [])
+    phases = [None] * len(referenced_search["requests"])
+
+    for field, phase in PHASE_FIELDS:
+        if field in referenced_fields:
+            for position in referenced_search[field]:
+                phases[position] = phase
+
+    return phases
+
+
+class RequestLocator:
+    """
+    Finds the positions in search["requests"] of the requests of the fields of a search, by identity or else by
+    REQUEST_KEY_FIELDS. Unlike to_request_references, modified copies of the requests are found too, such as the
+    requests of requests_after_clicking once extract_user_identifiers decoded their URL and added their UIDs.
+    """
+
+    def __init__(self, search):
+        self.requests = search.get("requests", [])
+        self.search = search
+        self.positions_by_id = {}
+        for position, request in enumerate(self.requests):
+            self.positions_by_id.setdefault(id(request), position)
+
+        # Positions by key, built only when a request has to be found by key
+        self.positions_by_key = None
+
+    def _find_by_key(self, request, used_positions):
+        if self.positions_by_key is None:
+            self.positions_by_key = {}
+            for position, item in enumerate(self.requests):
+                self.positions_by_key.setdefault(tuple(item.get(name) for name in REQUEST_KEY_FIELDS), []).append(position)
+
+        candidates = self.positions_by_key.get(tuple(request.get(name) for name in REQUEST_KEY_FIELDS), [])
+        return next((position for position in candidates if position not in used_positions), None)
+
+    def get_positions(self, requests, field):
+        """
+        Raises:
+            ValueError: if a request of field is not in search["requests"]
+
+        Returns:
+            list: the positions of requests, the requests of field, in search["requests"]
+        """
+
+        positions = []
+        used_positions = set()
+
+        for request in requests:
+            position = self.positions_by_id.get(id(request))
+            if position is None:
+                position = self._find_by_key(request, used_positions)
+
+            if position is None:
+                raise ValueError("The request " + str(request.get("url")) + " of " + field + " is not in the requests of the search")
+
+            used_positions.add(position)
+            positions.append(position)
+
+        return positions
+
+    def get_phases(self):
+        """
+        Returns:
+            list: the phase of each request of search["requests"] (None for requests of no phase)
+        """
+
+        phases = [None] * len(self.requests)
+        for field, phase in PHASE_FIELDS:
+            if field in self.search:
+                for position in self.get_positions(self.search[field], field):
+                    phases[position] = phase
+
+        return phases
+
+    def get_first_parties(self):
+        """
+        Returns:
+            list: the first party of the segment of requests_by_first_parties holding each request of search["requests"],
+            None for the requests of no segment
+        """
+
+        first_parties = [None] * len(self.requests)
+        for segment in self.search.get(FIRST_PARTIES_FIELD, []):
+            for first_party, requests in segment.items():
+                for position in self.get_positions(requests, FIRST_PARTIES_FIELD):
+                    first_parties[position] = first_party
+
+        return first_parties
+
+
+def resolve_request_references(search):
+    """
+    Returns search with its referenced fields resolved to the requests of search["requests"].
+    Searches without references are returned as they are, searches with references are wrapped in a LazySearch.
+    """
+
+    if isinstance(search, LazySearch):
+        return search
+
+    if REFERENCES_FIELD in search:
+        return LazySearch(search)
+
+    return search
+
+
+class LazySearch(dict):
+    """
+    Search read from a dataset written with request references.
+    Referenced fields are resolved the first time they are accessed, to lists of the request dictionaries of
+    search["requests"] themselves, as when the phases are computed in memory.
+    Fields not accessed yet stay stored as positions, so writing the search back keeps them as references.
+    """
+
+    def __init__(self, search):
+        super().__init__(search)
+        self.pending_fields = set(dict.get(self, REFERENCES_FIELD, []))
+
+    def _resolve(self, field):
+        self.pending_fields.discard(field)
+        requests = dict.__getitem__(self, "requests")
+        positions = dict.__getitem__(self, field)
+
+        if field == FIRST_PARTIES_FIELD:
+            value = [{first_party: [requests[position] for position in item[first_party]] for first_party in item} for item in positions]
+        else:
+            value = [requests[position] for position in positions]
+
+        dict.__setitem__(self, field, value)
+        self._update_references_field()
+        return value
+
+    def _update_references_field(self):
+        remaining_fields = [field for field in dict.get(self, REFERENCES_FIELD, []) if field in self.pending_fields]
+        if len(remaining_fields) > 0:
+            dict.__setitem__(self, REFERENCES_FIELD, remaining_fields)
+        else:
+            dict.pop(self, REFERENCES_FIELD, None)
+
+    def resolve_all(self):
+        for field in list(self.pending_fields):
+            if field in self:
+                self._resolve(field)
+            else:
+                self.pending_fields.discard(field)
+        self._update_references_field()
+        return self
+
+    def __getitem__(self, key):
+        if key in self.pending_fields:
+            return self._resolve(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        if key == "requests":
+            # The positions of the pending fields point into the old requests
+            self.resolve_all()
+
+        if key in self.pending_fields:
+            self.pending_fields.discard(key)
+            self._update_references_field()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if key in self.pending_fields:
+            self.pending_fields.discard(key)
+            self._update_references_field()
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self.pending_fields and key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def items(self):
+        return self.resolve_all().copy().items()
+
+    def values(self):
+        return self.resolve_all().copy().values()
+
+    def copy(self):
+        return dict(dict.items(self))
@@ -0,0 +1,248 @@
+import json, os
+from array import array
+import numpy as np
+
+from utils.read_and_write_crawling_results import ALL_SE_NAMES
+from utils.request_refs import RequestLocator, PHASE_FIELDS
+from utils.parsed_urls import parse_url
+
+try:
+    import pyarrow, pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+REQUEST_TABLE_PATH = "../Data/request_table"
+
+# Bump when the layout of the table changes
+REQUEST_TABLE_VERSION = 1
+
+PHASES = [phase for field, phase in PHASE_FIELDS]
+
+# Phase of the requests that belong to none of the phases, e.g. after the click of a search where no ad was clicked
+NO_PHASE = "none"
+
+# Columns of the table and their NumPy types. String columns are dictionary encoded: they store codes, -1 for missing values
+COLUMNS = [
+    ("search_engine", "int8"),
+    ("search_index", "int32"),
+    ("request_index", "int32"),
+    ("phase", "int8"),
+    ("job_id", "float64"),
+    ("timestamp", "float64"),
+    ("status", "int32"),
+    ("etld", "int32"),
+    ("netloc", "int32"),
+    ("is_tracker", "int8"),
+    ("first_party", "int32"),
+]
+
+DICTIONARY_COLUMNS = ["search_engine", "phase", "etld", "netloc", "first_party"]
+
+# Missing values of the numeric columns
+MISSING_VALUES = {"job_id": float("nan"), "timestamp": float("nan"), "status": -1, "is_tracker": -1}
+
+_ARRAY_TYPECODES = {"int8": "b", "int32": "i", "float64": "d"}
+
+
+class RequestTableBuilder:
+    """
+    Flattens the requests of searches into columns, one row per request of search["requests"].
+    Searches are added one at a time, so the table can be built while streaming the dataset.
+
+    is_tracker is 1 or 0, and -1 when the request was not classified.
+    first_party is the first party of the segment of requests_by_first_parties holding the request, if any.
+    """
+
+    def __init__(self):
+        self.columns = {name: array(_ARRAY_TYPECODES[dtype]) for name, dtype in COLUMNS}
+        self.dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+
+        for name, values in [("search_engine", ALL_SE_NAMES), ("phase", PHASES + [NO_PHASE])]:
+            for value in values:
+                self._encode(name, value)
+
+    def _encode(self, name, value):
+        if value is None:
+            return -1
+
+        dictionary = self.dictionaries[name]
+        code = dictionary.get(value)
+        if code is None:
+            code = len(dictionary)
+            dictionary[value] = code
+
+        return code
+
+    def add_search(self, se, idx, search):
+        requests = search.get("requests", [])
+        if len(requests) == 0:
+            return
+
+        # Raises a ValueError rather than exporting requests of a phase as of no phase
+        locator = RequestLocator(search)
+        phases = [NO_PHASE if phase is None else phase for phase in locator.get_phases()]
+        first_parties = locator.get_first_parties()
+
+        se_code = self._encode("search_engine", se)
+        columns = self.columns
+
+        for position, request in enumerate(requests):
+            parsed_url = parse_url(request.get("url", ""))
+            is_tracker = request.get("is_tracker")
+
+            columns["search_engine"].append(se_code)
+            columns["search_index"].append(idx)
+            columns["request_index"].append(position)
+            columns["phase"].append(self._encode("phase", phases[position]))
+            for name in ["job_id", "timestamp", "status"]:
+                value = request.get(name)
+                columns[name].append(MISSING_VALUES[name] if value is None else value)
+            columns["etld"].append(self._encode("etld", parsed_url.etld))
+            columns["netloc"].append(self._encode("netloc", parsed_url.netloc))
+            columns["is_tracker"].append(MISSING_VALUES["is_tracker"] if is_tracker is None else int(is_tracker))
+            columns["first_party"].append(self._encode("first_party", first_parties[position]))
+
+    def add_searches(self, searches):
+        """
+        Adds an iterable of (search engine name, index, search), and yields them back unchanged
+        """
+
+        for se, idx, search in searches:
+            self.add_search(se, idx, search)
+            yield se, idx, search
+
+    def write(self, directory=REQUEST_TABLE_PATH, parquet=False):
+        """
+        Writes each column as a .npy file of directory, and the dictionaries of the string columns in dictionaries.json.
+        With parquet, the table is also written as directory/requests.parquet, with dictionary encoded string columns.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        for name, dtype in COLUMNS:
+            np.save(os.path.join(directory, name + ".npy"), np.array(self.columns[name], dtype=dtype))
+
+        dictionaries = {name: list(dictionary) for name, dictionary in self.dictionaries.items()}
+        with open(os.path.join(directory, "dictionaries.json"), "w") as f:
+            json.dump({"version": REQUEST_TABLE_VERSION, "rows": len(self.columns["search_index"]), "dictionaries": dictionaries}, f)
+
+        if parquet:
+            load_request_table(directory).write_parquet(os.path.join(directory, "requests.parquet"))
+
+
+class RequestTable:
+    """
+    Columns of the request table, as NumPy arrays, with the dictionaries of the string columns.
+    """
+
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self):
+        return len(self.columns["search_index"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def code(self, name, value):
+        """
+        Returns the code of value in the string column name, -1 if the value never appears
+        """
+
+        try:
+            return self.dictionaries[name].index(value)
+        except ValueError:
+            return -1
+
+    def decode(self, name, codes=None):
+        """
+        Returns the values of the string column name (or of the given codes of that column), None for missing values
+        """
+
+        codes = self.columns[name] if codes is None else codes
+        dictionary = self.dictionaries[name]
+        return [dictionary[code] if code >= 0 else None for code in codes]
+
+    def group_count(self, by, mask=None, distinct=None):
+        """
+        Counts the rows of each group of the columns by, restricted to the rows of mask.
+        With distinct, counts the distinct non-missing values of the column distinct in each group instead.
+
+        Example, number of tracker parties before clicking on each search engine:
+            table.group_count(["search_engine"], (table["phase"] == table.code("phase", "before_clicking")) & (table["is_tracker"] == 1), distinct="etld")
+
+        Returns:
+            dict: {tuple of the (decoded) values of by: count}
+        """
+
+        keys = np.stack([np.asarray(self.columns[name], dtype="float64") for name in by], axis=1)
+        if mask is not None:
+            keys = keys[mask]
+
+        if distinct is not None:
+            values = np.asarray(self.columns[distinct], dtype="float64")
+            values = values if mask is None else values[mask]
+            keys = np.unique(np.concatenate([keys, values[:, None]], axis=1)[values >= 0], axis=0)[:, :-1]
+
+        groups, counts = np.unique(keys, axis=0, return_counts=True)
+
+        result = {}
+        for group, count in zip(groups, counts):
+            decoded_group = tuple(self.decode(name, [int(value)])[0] if name in self.dictionaries else value.item()
+                                  for name, value in zip(by, group))
+            result[decoded_group] = int(count)
+
+        return result
+
+    def to_pandas(self):
+        """
+        Returns the table as a pandas DataFrame, with categorical string columns
+        """
+
+        import pandas as pd
+
+        data = {}
+        for name, dtype in COLUMNS:
+            if name in self.dictionaries:
+                data[name] = pd.Categorical.from_codes(self.columns[name], categories=self.dictionaries[name])
+            else:
+                data[name] = self.columns[name]
+
+        return pd.DataFrame(data)
+
+    def write_parquet(self, path):
+        if pyarrow is None:
+            raise ImportError("pyarrow is required to write Parquet files")
+
+        arrays = []
+        for name, dtype in COLUMNS:
+            if name in self.dictionaries:
+                codes = np.asarray(self.columns[name], dtype="int32")
+                arrays.append(pyarrow.DictionaryArray.from_arrays(pyarrow.array(codes, mask=codes < 0), pyarrow.array(self.dictionaries[name], type=pyarrow.string())))
+            else:
+                arrays.append(pyarrow.array(self.columns[name]))
+
+        pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, names=[name for name, dtype in COLUMNS]), path)
+
+
+def load_request_table(directory=REQUEST_TABLE_PATH, mmap=True):
+    """
+    Loads the request table written by RequestTableBuilder.write. With mmap, the columns are memory-mapped
+    instead of being read in memory.
+
+    Returns:
+        RequestTable: the table
+    """
+
+    with open(os.path.join(directory, "dictionaries.json")) as f:
+        metadata = json.load(f)
+
+    if metadata["version"] != REQUEST_TABLE_VERSION:
+        raise ValueError("Request table version %s is not supported, export the table again" % metadata["version"])
+
+    columns = {}
+    for name, dtype in COLUMNS:
+        columns[name] = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None)
+
+    return RequestTable(columns, metadata["dictionaries"])
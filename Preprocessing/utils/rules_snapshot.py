@@ -0,0 +1,65 @@
+import os, pickle
+from utils.adblock_index import IndexedAdblockRules
+from utils.tracker_cache import get_tracker_lists_hash, TRACKER_LIST_FILES
+
+# Bump when IndexedAdblockRules changes, so that old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_FILE_NAME = "tracker_rules.snapshot"
+
+
+def get_rules_snapshot_path(lists_dir):
+    return os.path.join(lists_dir, SNAPSHOT_FILE_NAME)
+
+
+def build_rules_snapshot(lists_dir, file_names=TRACKER_LIST_FILES, lists_hash=None):
+    """
+    Parses the filter lists of lists_dir into an IndexedAdblockRules and saves it as a snapshot next to the lists.
+
+    Returns:
+        IndexedAdblockRules: the parsed rules
+    """
+
+    if lists_hash is None:
+        lists_hash = get_tracker_lists_hash(lists_dir, file_names)
+
+    raw_rules = []
+    for file_name in file_names:
+        with open(os.path.join(lists_dir, file_name)) as f:
+            raw_rules += f.read().splitlines()
+
+    print("Number of rules:", len(raw_rules))
+    rules = IndexedAdblockRules(raw_rules)
+
+    snapshot_path = get_rules_snapshot_path(lists_dir)
+    with open(snapshot_path + ".tmp", "wb") as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "lists_hash": lists_hash, "file_names": list(file_names), "rules": rules}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+    return rules
+
+
+def load_rules_snapshot(lists_dir, file_names=TRACKER_LIST_FILES):
+    """
+    Loads the parsed rules of the filter lists of lists_dir from their snapshot.
+    The snapshot is (re)built when it is missing, was built by another version, or does not match the content of the lists.
+
+    Returns:
+        IndexedAdblockRules: the parsed rules
+    """
+
+    lists_hash = get_tracker_lists_hash(lists_dir, file_names)
+    snapshot_path = get_rules_snapshot_path(lists_dir)
+
+    if os.path.exists(snapshot_path):
+        try:
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+
+            if snapshot["version"] == SNAPSHOT_VERSION and snapshot["lists_hash"] == lists_hash and snapshot["file_names"] == list(file_names):
+                return snapshot["rules"]
+
+        except (pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+            pass
+
+    return build_rules_snapshot(lists_dir, file_names, lists_hash)
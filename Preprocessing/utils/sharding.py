@@ -0,0 +1,164 @@
+import hashlib, heapq, json, os, uuid
+from utils.read_and_write_crawling_results import ALL_SE_NAMES, CrawlingResultsShardWriter, iter_crawling_results, iter_crawling_results_shards
+
+SHARDS_DIR = "../Data/shards"
+
+# The split writes the number of shards and of searches of each search engine in this file of the shards directory
+SHARDS_MANIFEST_FILE = "shards.json"
+
+# Each processed shard records the stages it was processed with in this file of its directory
+PROCESSED_SHARD_FILE = "processed.json"
+
+# Bump when the layout of the shards changes
+SHARDS_VERSION = 1
+
+
+def get_search_shard(se, idx, number_of_shards):
+    """
+    Returns:
+        int: the shard of the search idx of the search engine se, the same on every machine and for every run
+        (unlike hash(), which is randomized per process)
+    """
+
+    digest = hashlib.blake2b((se + "\0" + str(idx)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % number_of_shards
+
+
+def get_shard_dir(shards_dir, shard):
+    return os.path.join(shards_dir, "shard_{:05d}".format(shard))
+
+
+def get_processed_shard_dir(shards_dir, shard):
+    return os.path.join(shards_dir, "shard_{:05d}_processed".format(shard))
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_shards_manifest(shards_dir):
+    """
+    Raises:
+        ValueError: if the shards directory was not written by split_dataset, or by another version
+
+    Returns:
+        dict: the number of shards, and the number of searches of each search engine of the dataset that was split
+    """
+
+    path = os.path.join(shards_dir, SHARDS_MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise ValueError(shards_dir + " does not hold a split dataset, split it first")
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != SHARDS_VERSION:
+        raise ValueError(shards_dir + " was split by another version, split the dataset again")
+
+    return manifest
+
+
+def split_dataset(input_path, shards_dir, number_of_shards):
+    """
+    Splits the dataset at input_path into number_of_shards shards, each search going to get_search_shard(se, idx).
+    Each shard is a directory of JSON Lines files, one per search engine (see CrawlingResultsShardWriter), which keep
+    the index of each search in the dataset, so that the shards can be processed independently and merged back.
+
+    Returns:
+        dict: the shards manifest
+    """
+
+    counts = {se: 0 for se in ALL_SE_NAMES}
+    writers = [CrawlingResultsShardWriter(get_shard_dir(shards_dir, shard), append=False) for shard in range(number_of_shards)]
+
+    # The writers only create the files of the search engines they receive searches for, files of a previous split are removed
+    for writer in writers:
+        for se in ALL_SE_NAMES:
+            if os.path.exists(writer.get_shard_path(se)):
+                os.remove(writer.get_shard_path(se))
+
+    try:
+        for se, idx, search in iter_crawling_results(input_path):
+            writers[get_search_shard(se, idx, number_of_shards)].append(se, idx, search)
+            counts[se] += 1
+
+    finally:
+        for writer in writers:
+            writer.close()
+
+    # Identifies this split, so that shards processed from a previous split are not merged
+    manifest = {"version": SHARDS_VERSION, "split_id": uuid.uuid4().hex, "number_of_shards": number_of_shards, "counts": counts}
+    _write_json(os.path.join(shards_dir, SHARDS_MANIFEST_FILE), manifest)
+    return manifest
+
+
+def write_processed_shard_info(shards_dir, shard, split_id, configuration, counts):
+    """
+    Records that the shard of the split split_id was processed, with the configuration of the stages (see get_pipeline_configuration)
+    """
+
+    _write_json(os.path.join(get_processed_shard_dir(shards_dir, shard), PROCESSED_SHARD_FILE),
+                {"version": SHARDS_VERSION, "shard": shard, "split_id": split_id, "configuration": configuration, "counts": counts})
+
+
+def _read_processed_shard_info(shards_dir, shard, split_id):
+    path = os.path.join(get_processed_shard_dir(shards_dir, shard), PROCESSED_SHARD_FILE)
+    if not os.path.exists(path):
+        raise ValueError("The shard " + str(shard) + " was not processed (" + path + " is missing)")
+
+    with open(path) as f:
+        info = json.load(f)
+
+    if info.get("version") != SHARDS_VERSION or info.get("split_id") != split_id:
+        raise ValueError("The shard " + str(shard) + " was processed from a previous split, process it again")
+
+    return info
+
+
+def _iter_processed_shard(shards_dir, shard, se):
+    for _, idx, search in iter_crawling_results_shards(get_processed_shard_dir(shards_dir, shard), [se]):
+        yield idx, shard, search
+
+
+def iter_merged_shards(shards_dir):
+    """
+    Merges the processed shards back in the order of the dataset that was split: search engine by search engine, in
+    the ALL_SE_NAMES order, and by increasing index. Every search is checked to appear exactly once, in its shard,
+    and all the shards are checked to be processed with the same configuration.
+
+    Raises:
+        ValueError: if a shard is missing or was processed with another configuration, or if a search is missing,
+        duplicated or in the wrong shard; the merge stops at the first error
+
+    Yields:
+        tuple: (search engine name, index of the search for this search engine, search)
+    """
+
+    manifest = read_shards_manifest(shards_dir)
+    number_of_shards = manifest["number_of_shards"]
+
+    configurations = [_read_processed_shard_info(shards_dir, shard, manifest["split_id"])["configuration"] for shard in range(number_of_shards)]
+    for shard, configuration in enumerate(configurations):
+        if configuration != configurations[0]:
+            raise ValueError("The shards 0 and " + str(shard) + " were processed with different configurations: " + str(configurations[0]) + " and " + str(configuration))
+
+    for se in ALL_SE_NAMES:
+        # Each shard is sorted by index, a k-way merge restores the order of the search engine
+        shard_searches = [_iter_processed_shard(shards_dir, shard, se) for shard in range(number_of_shards)]
+        expected_idx = 0
+
+        for idx, shard, search in heapq.merge(*shard_searches, key=lambda item: item[0]):
+            if idx < expected_idx:
+                raise ValueError("The search " + str(idx) + " of " + se + " appears more than once")
+            if idx > expected_idx:
+                raise ValueError("The search " + str(expected_idx) + " of " + se + " is missing")
+            if shard != get_search_shard(se, idx, number_of_shards):
+                raise ValueError("The search " + str(idx) + " of " + se + " is in the shard " + str(shard) + " instead of " + str(get_search_shard(se, idx, number_of_shards)))
+
+            yield se, idx, search
+            expected_idx += 1
+
+        if expected_idx != manifest["counts"][se]:
+            raise ValueError(se + " has " + str(expected_idx) + " searches in the shards instead of " + str(manifest["counts"][se]))
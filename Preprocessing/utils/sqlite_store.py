@@ -0,0 +1,351 @@
+import json, os, sqlite3
+
+from utils.read_and_write_crawling_results import ALL_SE_NAMES, json_default
+from utils.request_refs import to_request_references, resolve_request_references, RequestLocator, REFERENCES_FIELD
+from utils.parsed_urls import parse_url
+
+# Search fields stored in their own table, as rows of (position, key, value, domain)
+IDENTIFIER_TABLES = {"set-cookies_after_clicking": "cookies", "parameters_after_clicking": "parameters"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT);
+
+CREATE TABLE IF NOT EXISTS searches (
+    search_engine TEXT, search_index INTEGER, data TEXT,
+    PRIMARY KEY (search_engine, search_index));
+
+CREATE TABLE IF NOT EXISTS requests (
+    search_engine TEXT, search_index INTEGER, request_index INTEGER, phase TEXT,
+    url TEXT, etld TEXT, status INTEGER, timestamp REAL, job_id REAL, is_tracker INTEGER, data TEXT,
+    PRIMARY KEY (search_engine, search_index, request_index));
+
+CREATE TABLE IF NOT EXISTS redirect_hops (
+    search_engine TEXT, search_index INTEGER, request_index INTEGER, hop_index INTEGER, url TEXT, data TEXT,
+    PRIMARY KEY (search_engine, search_index, request_index, hop_index));
+
+CREATE TABLE IF NOT EXISTS cookies (
+    search_engine TEXT, search_index INTEGER, position INTEGER, key_index INTEGER, key TEXT, value, domain TEXT,
+    PRIMARY KEY (search_engine, search_index, position, key_index));
+
+CREATE TABLE IF NOT EXISTS parameters (
+    search_engine TEXT, search_index INTEGER, position INTEGER, key_index INTEGER, key TEXT, value, domain TEXT,
+    PRIMARY KEY (search_engine, search_index, position, key_index));
+
+CREATE INDEX IF NOT EXISTS requests_phase ON requests (search_engine, search_index, phase);
+CREATE INDEX IF NOT EXISTS requests_etld ON requests (etld);
+CREATE INDEX IF NOT EXISTS requests_is_tracker ON requests (is_tracker);
+CREATE INDEX IF NOT EXISTS cookies_key ON cookies (key);
+CREATE INDEX IF NOT EXISTS parameters_key ON parameters (key);
+"""
+
+_SEARCH_TABLES = ["searches", "requests", "redirect_hops", "cookies", "parameters"]
+
+# Columns of the requests table computed from the request, in the order returned by _get_request_columns
+_REQUEST_COLUMNS = ["url", "etld", "status", "timestamp", "job_id", "is_tracker"]
+
+
+class SqliteDatasetStore:
+    """
+    Dataset stored in a SQLite database instead of a single JSON file.
+
+    - searches: one row per search, holding the search as JSON, without its requests.
+      The phase fields are stored as positions in search["requests"] (see utils/request_refs.py).
+    - requests: one row per request of search["requests"], with its phase, URL, ETLD + 1, status, timestamp, job_id
+      and is_tracker as indexed columns, and the request as JSON, without its redirect chain.
+    - redirect_hops: one row per hop of the redirect chain of each request.
+    - cookies and parameters: one row per UID found in set-cookies_after_clicking and parameters_after_clicking.
+
+    Searches are read back identical to what was written. Writes are grouped in transactions of batch_size searches.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending_searches = 0
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    # Writing
+
+    def clear(self):
+        for table in _SEARCH_TABLES:
+            self.connection.execute("DELETE FROM " + table)
+        self.connection.execute("DELETE FROM metadata")
+        self.connection.commit()
+
+    def write_search(self, se, idx, search):
+        """
+        Writes search, replacing the search with the same search engine and index if there is one
+        """
+
+        self._delete_search(se, idx)
+
+        referenced_search = to_request_references(search)
+        requests = referenced_search.get("requests")
+        phases = RequestLocator(search).get_phases() if requests is not None else []
+
+        search_data = dict(referenced_search)
+        if requests is not None:
+            search_data["requests"] = None
+
+        for field, table in IDENTIFIER_TABLES.items():
+            if field in search_data:
+                self._write_identifiers(table, se, idx, search_data[field])
+                search_data[field] = None
+
+        self.connection.execute("INSERT INTO searches VALUES (?, ?, ?)", (se, idx, json.dumps(search_data, default=json_default)))
+
+        request_rows = []
+        hop_rows = []
+        for request_index, (request, phase) in enumerate(zip(requests or [], phases)):
+            request_data = dict(request)
+
+            if isinstance(request_data.get("redirectChain"), list):
+                for hop_index, hop in enumerate(request_data["redirectChain"]):
+                    hop_rows.append((se, idx, request_index, hop_index, hop.get("url") if isinstance(hop, dict) else None, json.dumps(hop)))
+                request_data["redirectChain"] = []
+
+            request_rows.append((se, idx, request_index, phase) + self._get_request_columns(request) + (json.dumps(request_data, default=json_default),))
+
+        self.connection.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", request_rows)
+        self.connection.executemany("INSERT INTO redirect_hops VALUES (?, ?, ?, ?, ?, ?)", hop_rows)
+
+        self.pending_searches += 1
+        if self.pending_searches >= self.batch_size:
+            self.commit()
+
+    def write_searches(self, searches, number_of_search_engines=None):
+        """
+        Writes an iterable of (search engine name, index, search)
+
+        Returns:
+            int: the number of searches written
+        """
+
+        count = 0
+        for se, idx, search in searches:
+            self.write_search(se, idx, search)
+            count += 1
+
+        if number_of_search_engines is not None:
+            self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('number_of_search_engines', ?)", (str(number_of_search_engines),))
+
+        self.commit()
+        return count
+
+    def update_search_field(self, se, idx, field, value):
+        """
+        Sets a single field of a stored search, without rewriting its requests
+        """
+
+        row = self.connection.execute("SELECT data FROM searches WHERE search_engine = ? AND search_index = ?", (se, idx)).fetchone()
+        if row is None:
+            raise KeyError((se, idx))
+
+        if field == "requests":
+            raise ValueError("Requests are replaced by writing the whole search with write_search")
+
+        search_data = json.loads(row[0])
+        if field in search_data.get(REFERENCES_FIELD, []):
+            # The new value is stored as it is, instead of positions in search["requests"]
+            search_data[REFERENCES_FIELD] = [item for item in search_data[REFERENCES_FIELD] if item != field]
+            if len(search_data[REFERENCES_FIELD]) == 0:
+                del search_data[REFERENCES_FIELD]
+
+        if field in IDENTIFIER_TABLES:
+            self.connection.execute("DELETE FROM " + IDENTIFIER_TABLES[field] + " WHERE search_engine = ? AND search_index = ?", (se, idx))
+            self._write_identifiers(IDENTIFIER_TABLES[field], se, idx, value)
+            value = None
+
+        search_data[field] = value
+        self.connection.execute("UPDATE searches SET data = ? WHERE search_engine = ? AND search_index = ?", (json.dumps(search_data, default=json_default), se, idx))
+
+    def update_request_field(self, se, idx, request_index, field, value):
+        """
+        Sets a single field of a stored request, and its indexed column if it has one
+        """
+
+        row = self.connection.execute("SELECT data FROM requests WHERE search_engine = ? AND search_index = ? AND request_index = ?", (se, idx, request_index)).fetchone()
+        if row is None:
+            raise KeyError((se, idx, request_index))
+
+        if field == "redirectChain":
+            raise ValueError("Redirect chains are replaced by writing the whole search with write_search")
+
+        request_data = json.loads(row[0])
+        request_data[field] = value
+
+        columns = dict(zip(_REQUEST_COLUMNS, self._get_request_columns(request_data)))
+        columns["data"] = json.dumps(request_data, default=json_default)
+
+        self.connection.execute("UPDATE requests SET " + ", ".join(name + " = ?" for name in columns) + " WHERE search_engine = ? AND search_index = ? AND request_index = ?",
+                                list(columns.values()) + [se, idx, request_index])
+
+    def update_search_fields(self, se, idx, search, search_fields, request_fields):
+        """
+        Sets the given fields of a stored search and of each of its requests to their values in search, without
+        rewriting the rest of the search. Fields missing from search or from a request are left as they are.
+        """
+
+        for field in search_fields:
+            if field in search:
+                self.update_search_field(se, idx, field, search[field])
+
+        if len(request_fields) > 0:
+            for request_index, request in enumerate(search.get("requests", [])):
+                for field in request_fields:
+                    if field in request:
+                        self.update_request_field(se, idx, request_index, field, request[field])
+
+        self.pending_searches += 1
+        if self.pending_searches >= self.batch_size:
+            self.commit()
+
+    def delete_search(self, se, idx):
+        self._delete_search(se, idx)
+
+    def _get_request_columns(self, request):
+        url = request.get("url")
+        etld = parse_url(url).etld if isinstance(url, str) else None
+        is_tracker = request.get("is_tracker")
+
+        return (url, etld, request.get("status"), request.get("timestamp"), request.get("job_id"),
+                None if is_tracker is None else int(is_tracker))
+
+    def _write_identifiers(self, table, se, idx, identifiers):
+        rows = []
+        for position, (values, domain) in enumerate(identifiers):
+            if len(values) == 0:
+                rows.append((se, idx, position, 0, None, None, domain))
+            for key_index, (key, value) in enumerate(values.items()):
+                rows.append((se, idx, position, key_index, key, value, domain))
+
+        self.connection.executemany("INSERT INTO " + table + " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _delete_search(self, se, idx):
+        for table in _SEARCH_TABLES:
+            self.connection.execute("DELETE FROM " + table + " WHERE search_engine = ? AND search_index = ?", (se, idx))
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_searches = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Reading
+
+    def get_number_of_search_engines(self):
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = 'number_of_search_engines'").fetchone()
+        if row is not None:
+            return int(row[0])
+
+        stored_search_engines = [row[0] for row in self.connection.execute("SELECT DISTINCT search_engine FROM searches")]
+        return max([ALL_SE_NAMES.index(se) + 1 for se in stored_search_engines if se in ALL_SE_NAMES] + [0])
+
+    def search_keys(self, search_engines=ALL_SE_NAMES):
+        """
+        Returns:
+            list: (search engine name, index) of the stored searches, in dataset order
+        """
+
+        keys = []
+        for se in search_engines:
+            keys += [(se, row[0]) for row in self.connection.execute("SELECT search_index FROM searches WHERE search_engine = ? ORDER BY search_index", (se,))]
+
+        return keys
+
+    def read_search(self, se, idx):
+        row = self.connection.execute("SELECT data FROM searches WHERE search_engine = ? AND search_index = ?", (se, idx)).fetchone()
+        if row is None:
+            raise KeyError((se, idx))
+
+        search = json.loads(row[0])
+
+        if "requests" in search:
+            requests = [json.loads(row[0]) for row in self.connection.execute(
+                "SELECT data FROM requests WHERE search_engine = ? AND search_index = ? ORDER BY request_index", (se, idx))]
+
+            for request_index, hop_index, data in self.connection.execute(
+                    "SELECT request_index, hop_index, data FROM redirect_hops WHERE search_engine = ? AND search_index = ? ORDER BY request_index, hop_index", (se, idx)):
+                requests[request_index]["redirectChain"].append(json.loads(data))
+
+            search["requests"] = requests
+
+        for field, table in IDENTIFIER_TABLES.items():
+            if field in search:
+                search[field] = self._read_identifiers(table, se, idx)
+
+        return resolve_request_references(search)
+
+    def iter_searches(self, search_engines=ALL_SE_NAMES):
+        """
+        Yields:
+            tuple: (search engine name, index of the search for this search engine, search), in dataset order
+        """
+
+        for se, idx in self.search_keys(search_engines):
+            yield se, idx, self.read_search(se, idx)
+
+    def query_requests(self, search_engine=None, search_index=None, phase=None, etld=None, is_tracker=None):
+        """
+        Yields the requests matching all the given conditions, without their redirect chain, as
+        (search engine name, search index, request index, request)
+        """
+
+        conditions = [(name, value) for name, value in [("search_engine", search_engine), ("search_index", search_index), ("phase", phase), ("etld", etld),
+                                                         ("is_tracker", None if is_tracker is None else int(is_tracker))] if value is not None]
+        query = "SELECT search_engine, search_index, request_index, data FROM requests"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(name + " = ?" for name, value in conditions)
+
+        for se, idx, request_index, data in self.connection.execute(query, [value for name, value in conditions]):
+            yield se, idx, request_index, json.loads(data)
+
+    def _read_identifiers(self, table, se, idx):
+        identifiers = []
+        for position, key, value, domain in self.connection.execute(
+                "SELECT position, key, value, domain FROM " + table + " WHERE search_engine = ? AND search_index = ? ORDER BY position, key_index", (se, idx)):
+            if position == len(identifiers):
+                identifiers.append([{}, domain])
+            if key is not None:
+                identifiers[position][0][key] = value
+
+        return identifiers
+
+
+def read_sqlite_crawling_results(path):
+    """
+    Reads a dataset stored with SqliteDatasetStore in the list layout of read_crawling_results
+    """
+
+    if not os.path.exists(path):
+        return []
+
+    with SqliteDatasetStore(path) as store:
+        ALL_SE_RESULTS = [[] for index in range(store.get_number_of_search_engines())]
+        for se, idx, search in store.iter_searches():
+            ALL_SE_RESULTS[ALL_SE_NAMES.index(se)].append(search)
+
+    return ALL_SE_RESULTS
+
+
+def write_sqlite_crawling_results(searches, path, number_of_search_engines=None):
+    """
+    Replaces the dataset stored at path by an iterable of (search engine name, index, search)
+    """
+
+    with SqliteDatasetStore(path) as store:
+        store.clear()
+        store.write_searches(searches, number_of_search_engines)
@@ -0,0 +1,186 @@
+import hashlib, os, pickle
+from array import array
+from utils.parsed_urls import parse_url
+from utils.uid_tokens import parse_set_cookie, get_query_parameter_pairs
+
+TOKEN_INDEX_PATH = "../Data/token_index.pickle"
+
+# Bump when the layout of TokenFrequencyIndex changes, so that old indexes are rebuilt
+TOKEN_INDEX_VERSION = 1
+
+# Default depth (number of hash functions) of the count-min sketch
+SKETCH_DEPTH = 4
+
+
+def get_token_hash(token_key, token_value):
+    """
+    Returns:
+        bytes: a 128 bits hash of the (key, value) token, stable across runs (unlike hash())
+    """
+
+    return hashlib.blake2b((token_key + "\0" + token_value).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+# Content hash of the token indexes already hashed by this process, by path, with the size and modification time they
+# were hashed at
+_TOKEN_INDEX_HASHES = {}
+
+
+def get_token_index_hash(path=TOKEN_INDEX_PATH):
+    """
+    Returns:
+        str: the content hash of the token index saved at path, the same for every copy of the index (unlike its
+        modification time), so that shards processed on different machines with the same index can be merged.
+        The index is only hashed again when its size or modification time changed.
+    """
+
+    stat = os.stat(path)
+    stat = (stat.st_size, stat.st_mtime_ns)
+
+    cached = _TOKEN_INDEX_HASHES.get(os.path.abspath(path))
+    if cached is not None and cached[0] == stat:
+        return cached[1]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    _TOKEN_INDEX_HASHES[os.path.abspath(path)] = (stat, sha.hexdigest())
+    return sha.hexdigest()
+
+
+def get_search_tokens(search):
+    """
+    Returns:
+        set: the distinct (key, value) tokens of the cookies set by the responses and of the query parameters of the
+        requests of a search, parsed as in extract_user_identifiers.py
+    """
+
+    tokens = set()
+    for request in search["requests"]:
+        if "set-cookie" in request["responseHeaders"]:
+            tokens.update(parse_set_cookie(request["responseHeaders"]["set-cookie"]).items())
+
+        tokens.update(get_query_parameter_pairs(parse_url(parse_url(request["url"]).decoded_url).query_params))
+
+    return tokens
+
+
+class TokenFrequencyIndex:
+    """
+    Number of distinct searches each (key, value) token of cookies and query parameters appears in.
+
+    Tokens are stored as 64 bits hashes in a hash table, or, when sketch_width is given, counted in a count-min sketch
+    of sketch_depth rows of sketch_width counters, whose size does not depend on the number of tokens. The sketch
+    never underestimates a count, and overestimates it only when the token collides with more frequent tokens in
+    every row, so a wide enough sketch rarely mistakes a user identifier for a constant token.
+    Both answer count and is_constant in constant time.
+    """
+
+    def __init__(self, sketch_width=None, sketch_depth=SKETCH_DEPTH):
+        self.number_of_searches = 0
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+
+        if sketch_width is None:
+            self.counts = {}
+        else:
+            self.sketch = [array("I", bytes(4 * sketch_width)) for _ in range(sketch_depth)]
+
+    def _sketch_positions(self, token_hash):
+        # Double hashing: the i-th row uses h1 + i * h2
+        h1 = int.from_bytes(token_hash[:8], "little")
+        h2 = int.from_bytes(token_hash[8:], "little") | 1
+        return [(h1 + row * h2) % self.sketch_width for row in range(self.sketch_depth)]
+
+    # Updating
+
+    def add_tokens(self, tokens):
+        """
+        Counts a search whose distinct (key, value) tokens are tokens
+        """
+
+        self.number_of_searches += 1
+
+        for token_key, token_value in tokens:
+            token_hash = get_token_hash(token_key, token_value)
+
+            if self.sketch_width is None:
+                key = int.from_bytes(token_hash[:8], "little")
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+            else:
+                for row, position in zip(self.sketch, self._sketch_positions(token_hash)):
+                    row[position] += 1
+
+    def add_search(self, search):
+        self.add_tokens(get_search_tokens(search))
+
+    def add_searches(self, searches):
+        """
+        Adds an iterable of (search engine name, index, search), and yields them back unchanged
+        """
+
+        for se, idx, search in searches:
+            self.add_search(search)
+            yield se, idx, search
+
+    # Queries
+
+    def count(self, token_key, token_value):
+        """
+        Returns:
+            int: the number of searches the token appears in (an upper bound with a count-min sketch)
+        """
+
+        token_hash = get_token_hash(token_key, token_value)
+
+        if self.sketch_width is None:
+            return self.counts.get(int.from_bytes(token_hash[:8], "little"), 0)
+
+        return min(row[position] for row, position in zip(self.sketch, self._sketch_positions(token_hash)))
+
+    def is_constant(self, token_key, token_value, min_searches=2):
+        """
+        Returns True if the token has the same value across different iterations, i.e. appears in at least min_searches searches
+        """
+
+        return self.count(token_key, token_value) >= min_searches
+
+    def __len__(self):
+        """
+        Number of distinct tokens of the hash table, or number of counters of the sketch
+        """
+
+        return len(self.counts) if self.sketch_width is None else self.sketch_width * self.sketch_depth
+
+    # Persistence
+
+    def save(self, path=TOKEN_INDEX_PATH):
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"version": TOKEN_INDEX_VERSION, "index": self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+
+def load_token_index(path=TOKEN_INDEX_PATH):
+    """
+    Loads the token index saved at path
+
+    Raises:
+        ValueError: if the index was saved by another version, and must be rebuilt with build_token_index.py
+
+    Returns:
+        TokenFrequencyIndex: the index
+    """
+
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+
+    if data.get("version") != TOKEN_INDEX_VERSION:
+        raise ValueError("The token index " + path + " was built by another version, rebuild it with build_token_index.py")
+
+    return data["index"]
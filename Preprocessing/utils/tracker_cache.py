@@ -0,0 +1,128 @@
+import hashlib, os, sqlite3
+from collections import OrderedDict
+
+CACHE_DIR = "../Data/cache"
+
+TRACKER_CACHE_PATH = os.path.join(CACHE_DIR, "tracker_cache.sqlite")
+
+TRACKER_LISTS_DIR = "lists"
+
+TRACKER_LIST_FILES = ["easylist.txt", "easyprivacy.txt"]
+
+
+def get_tracker_lists_hash(lists_dir=TRACKER_LISTS_DIR, file_names=TRACKER_LIST_FILES):
+    """
+    Content hash of the filter lists used to classify trackers.
+    Any change in one of the lists changes the hash, which invalidates the classifications computed with the old lists.
+    """
+
+    sha = hashlib.sha256()
+    for file_name in file_names:
+        sha.update(file_name.encode())
+        with open(os.path.join(lists_dir, file_name), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class TrackerClassificationCache:
+    """
+    Cache of tracker classifications keyed by URL.
+    A bounded in-memory LRU is backed by a SQLite file that persists between runs.
+    The file is emptied when lists_hash, the content hash of the filter lists (or any key identifying how the URLs are
+    classified, see add_is_tracker.get_tracker_cache_key), differs from the one it was built with.
+    """
+
+    def __init__(self, lists_hash, path=TRACKER_CACHE_PATH, max_memory_entries=200000, write_batch_size=10000):
+        self.lists_hash = lists_hash
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.write_batch_size = write_batch_size
+
+        self.memory = OrderedDict()
+        self.pending_writes = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS classifications (url TEXT PRIMARY KEY, is_tracker INTEGER)")
+
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = 'lists_hash'").fetchone()
+        if row is None or row[0] != lists_hash:
+            self.connection.execute("DELETE FROM classifications")
+            self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('lists_hash', ?)", (lists_hash,))
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        Returns the cached classification of url, or None if it was never classified with the current lists.
+        """
+
+        if url in self.memory:
+            self.memory.move_to_end(url)
+            self.memory_hits += 1
+            return self.memory[url]
+
+        if url in self.pending_writes:
+            self.disk_hits += 1
+            is_tracker = bool(self.pending_writes[url])
+            self._remember(url, is_tracker)
+            return is_tracker
+
+        row = self.connection.execute("SELECT is_tracker FROM classifications WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        is_tracker = bool(row[0])
+        self._remember(url, is_tracker)
+        return is_tracker
+
+    def set(self, url, is_tracker):
+        self._remember(url, is_tracker)
+        self.pending_writes[url] = int(is_tracker)
+
+        if len(self.pending_writes) >= self.write_batch_size:
+            self.flush()
+
+    def classify(self, url, TRACKER_RULES):
+        """
+        Returns the classification of url, computing it with TRACKER_RULES only if it is not cached.
+        """
+
+        is_tracker = self.get(url)
+        if is_tracker is None:
+            is_tracker = TRACKER_RULES.should_block(url)
+            self.set(url, is_tracker)
+
+        return is_tracker
+
+    def _remember(self, url, is_tracker):
+        self.memory[url] = is_tracker
+        self.memory.move_to_end(url)
+
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def flush(self):
+        if len(self.pending_writes) > 0:
+            self.connection.executemany("INSERT OR REPLACE INTO classifications VALUES (?, ?)", self.pending_writes.items())
+            self.connection.commit()
+            self.pending_writes = {}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
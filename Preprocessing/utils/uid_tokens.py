@@ -0,0 +1,162 @@
+import enchant, validators
+from functools import lru_cache
+
+# Manual filtering results
+MANUAL_FILTERED_VALUES = frozenset(["EUR", "en", "sc_b_locale=fr_FR", "set", ""])
+
+# Manual filtering result - 2
+MANUAL_FILTERED_KEYS = frozenset(["DATA"])
+
+# Token keys that have same values accross different iterations
+CONSTANT_KEYS = frozenset(["et_keyword", "url", "utm_term", "utm_campaign", "utm_content", "u", "tuuid", "aw7735", "bId", "aw17547", "ds_k", "JPOP", "JPKW", "semnb", "ref", "keywords", "utm_custom1", "utm_ag", "asid", "ds_dest_url", "atc_content", "litb_from", "utm_source", "utm_medium", "m_pi", "m_cn", "m_ag", "m_ac", "cm_mmc", "oll", "ad_provider", "ad_domain", "dm", "d", "dsig", "blay", "sm","ccpturl", "uule", "ei", "c1", "c2", "gclsrc"])
+
+# Token values that have same values accross different iterations - 2
+CONSTANT_VALUES = frozenset(["Event.ClientInst", "UserEvent", "Event.ClientInst", "zenaps.com", "w*HZeZhmD60", "sa360-au-new-goodscat", "p64736203151", "ppc|ga|1|||", "googdemozdesk-21", "A4768712791", "fr_pd_ppc_google_youmake2022_shop-HQ_marque-exact_hot_you-make_text_none_none", "pcmcat1563299784494", "421x11964043", "459x3096044", "duckduckgo.com", "zIv3CTTKCSOnGn", "googhydr0a8-21", "-oaymwEECHwQRg", "AIDcmm2yi7yuxb_SEM_{gclid}:G:s", "{gclid}:G:s", "tbn:ANd9GcSBFmzURVeYKqQuB2JbIhAOt40ZNwbh-7Z6X56HI8mQfw"])
+
+# Token value prefixes that have same values accross different iterations - 3
+CONSTANT_VALUE_PREFIXES = frozenset(["kwd-", "dat-", "dsa-", "DevE", "SERP"])
+
+# Timestamps between june 2022 and july 2023 both in s and ms
+TIMESTAMP_RANGES = [(1654034400000, 1672527600000), (1654034400, 1672527600)]
+
+
+def parse_set_cookie(raw_set_cookies):
+    """
+    Parses a set of cookies. Transforms it from a string to a dictionary (cookie_name, cookie_value)
+
+    Returns:
+        a dictionnary of cookies {"cookie_key": cookie_value}
+    """
+
+    cookies = {}
+    raw_cookies = raw_set_cookies.split("\n")
+
+    for raw_cookie in raw_cookies:
+        cookie_items = raw_cookie.split(";")
+        cookie_key = cookie_items[0].split("=")[0]
+        cookie_value = "=".join(cookie_items[0].split("=")[1:])
+        cookies[cookie_key] = cookie_value
+
+    return cookies
+
+
+def get_query_parameter_pairs(parameters):
+    """
+    Returns:
+        list: the (key, value) tokens of query parameters parsed with parse_qs, the values of a repeated key being joined
+    """
+
+    pairs = []
+    for key, value in parameters.items():
+
+        value = list(set(value))
+        value = " ".join(value)
+        pairs.append((key, value))
+
+    return pairs
+
+
+class UidTokenClassifier:
+    """
+    Decides whether a (key, value) token found in first-party storage or in query parameters is a user identifier.
+
+    The English dictionary is loaded once, the denylists are frozensets, and the results of the
+    dictionary lookups, URL validations and token decisions are memoized.
+
+    Tokens that have the same values across different iterations are found with the hand-maintained CONSTANT_*
+    denylists, or, when a token_index (see utils/token_index.py) is given, with the number of distinct searches
+    each token was seen in: tokens seen in at least min_searches searches are not user identifiers.
+    """
+
+    def __init__(self, language="en_US", max_cached_tokens=1000000, token_index=None, min_searches=2):
+        self.token_index = token_index
+        self.min_searches = min_searches
+        self.english_dictionnary = enchant.Dict(language)
+        self.is_english_word = lru_cache(maxsize=max_cached_tokens)(self.english_dictionnary.check)
+        self.is_url = lru_cache(maxsize=max_cached_tokens)(lambda value: bool(validators.url(value)))
+        self.is_uid_token = lru_cache(maxsize=max_cached_tokens)(self._is_uid_token)
+
+    def _is_uid_token(self, token_key, token_value):
+
+        if token_value in MANUAL_FILTERED_VALUES or token_key in MANUAL_FILTERED_KEYS:
+            return False
+
+        if self.token_index is not None:
+            if self.token_index.is_constant(token_key, token_value, self.min_searches):
+                return False
+
+        elif token_key in CONSTANT_KEYS or token_value in CONSTANT_VALUES or token_value[:4] in CONSTANT_VALUE_PREFIXES:
+            return False
+
+        # Removing short tokens
+        if len(token_value) < 8:
+            return False
+
+        # Removing timestamp values
+        if token_value.isdigit():
+            int_value = int(token_value)
+            if any(start <= int_value <= end for start, end in TIMESTAMP_RANGES):
+                return False
+
+        # Removing url values
+        if self.is_url(token_value):
+            return False
+
+        # Removing english words
+        token_values_for_dictionary = token_value.replace("_", " ").replace("=", " ")
+        if all(self.is_english_word(item) for item in token_values_for_dictionary.split(" ") if item != ''):
+            return False
+
+        return True
+
+    def classify_pairs(self, pairs):
+        """
+        Classifies all the (key, value) pairs of a search at once
+
+        Returns:
+            list: True for each pair that is a UID token, in the order of pairs
+        """
+
+        decisions = {}
+        for pair in pairs:
+            if pair not in decisions:
+                decisions[pair] = self.is_uid_token(*pair)
+
+        return [decisions[pair] for pair in pairs]
+
+    def filter_pairs(self, pairs):
+        """
+        Returns:
+            dict: {key: value} of the (key, value) pairs that are UID tokens
+        """
+
+        pairs = list(pairs)
+        return {key: value for (key, value), is_uid in zip(pairs, self.classify_pairs(pairs)) if is_uid}
+
+    def cache_info(self):
+        return {"tokens": self.is_uid_token.cache_info(), "words": self.is_english_word.cache_info(), "urls": self.is_url.cache_info()}
+
+
+_UID_TOKEN_CLASSIFIER = None
+
+
+def get_uid_token_classifier():
+    """
+    Returns the shared UidTokenClassifier, created the first time it is needed
+    """
+
+    global _UID_TOKEN_CLASSIFIER
+
+    if _UID_TOKEN_CLASSIFIER is None:
+        _UID_TOKEN_CLASSIFIER = UidTokenClassifier()
+
+    return _UID_TOKEN_CLASSIFIER
+
+
+def set_uid_token_classifier(classifier):
+    """
+    Replaces the shared UidTokenClassifier, e.g. by one using a token index
+    """
+
+    global _UID_TOKEN_CLASSIFIER
+    _UID_TOKEN_CLASSIFIER = classifier
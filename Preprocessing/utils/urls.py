@@ -1,5 +1,87 @@
 
+import os
+from functools import lru_cache
 import tldextract
+from tldextract.remote import lenient_netloc
+
+# Snapshot of the public suffix list, so that domains are resolved offline
+PUBLIC_SUFFIX_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lists", "public_suffix_list.dat")
+
+
+class DomainResolver:
+    """
+    Resolves the domain and ETLD + 1 of URLs with the vendored public suffix list, without any network access.
+    Results are memoized by hostname, so the URLs of a same host are resolved once.
+    """
+
+    def __init__(self, suffix_list_path=PUBLIC_SUFFIX_LIST_PATH, max_hostnames=500000):
+        self.extractor = tldextract.TLDExtract(cache_dir=None, suffix_list_urls=("file://" + os.path.abspath(suffix_list_path),), fallback_to_snapshot=True)
+        self.resolve_hostname = lru_cache(maxsize=max_hostnames)(self._resolve_hostname)
+
+    def _resolve_hostname(self, hostname):
+        extracted_url = self.extractor(hostname)
+        return extracted_url.domain.lower(), extracted_url.subdomain.lower() + "." + extracted_url.domain.lower()
+
+    def get_url_etld(self, url):
+        return self.resolve_hostname(lenient_netloc(url))[1]
+
+    def get_url_domain(self, url):
+
+        clicked_url_domain = self.resolve_hostname(lenient_netloc(url))[0]
+
+        if url.startswith("https://business.google.com") :
+            clicked_url_domain = "business.google"
+
+        return clicked_url_domain
+
+    def resolve_url(self, url):
+        """
+        Returns:
+            tuple: (domain, ETLD + 1) of url, as returned by get_url_domain and get_url_etld
+        """
+
+        domain, etld = self.resolve_hostname(lenient_netloc(url))
+
+        if url.startswith("https://business.google.com") :
+            domain = "business.google"
+
+        return domain, etld
+
+    def resolve_urls(self, urls):
+        """
+        Bulk version of get_url_domain and get_url_etld
+
+        Returns:
+            tuple: (list of domains, list of ETLD + 1), in the order of urls
+        """
+
+        domains = []
+        etlds = []
+        for url in urls:
+            domain, etld = self.resolve_url(url)
+            domains.append(domain)
+            etlds.append(etld)
+
+        return domains, etlds
+
+    def cache_info(self):
+        return self.resolve_hostname.cache_info()
+
+
+_DOMAIN_RESOLVER = None
+
+"""
+Returns the shared DomainResolver, created the first time it is needed
+"""
+def get_domain_resolver():
+    global _DOMAIN_RESOLVER
+
+    if _DOMAIN_RESOLVER is None:
+        _DOMAIN_RESOLVER = DomainResolver()
+
+    return _DOMAIN_RESOLVER
+
+
 """
 Extracts the top level domain of a given URL
 
@@ -8,8 +90,7 @@ Returns:
 """
 def get_url_etld(url):
 
-    extracted_url = tldextract.extract(url)
-    return extracted_url.subdomain.lower() + "." + extracted_url.domain.lower()
+    return get_domain_resolver().get_url_etld(url)
 
 
 
@@ -21,9 +102,15 @@ Returns:
 """
 def get_url_domain(url):
 
-    clicked_url_domain = tldextract.extract(url).domain.lower()
+    return get_domain_resolver().get_url_domain(url)
+
 
-    if url.startswith("https://business.google.com") :
-        clicked_url_domain = "business.google"
+"""
+Extracts the domains and ETLD + 1 of a list of URLs
+
+Returns:
+    tuple: (list of domains, list of ETLD + 1), in the order of urls
+"""
+def resolve_urls(urls):
 
-    return clicked_url_domain
+    return get_domain_resolver().resolve_urls(urls)